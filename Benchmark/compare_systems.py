@@ -0,0 +1,292 @@
+"""
+CNN 与产生式系统性能对比
+在同一 Animals-10 标签空间（10 种动物，意大利语目录名映射到规则库中的中文名称）上评测两个系统：
+- 产生式系统：输入取自 ANIMAL_KNOWLEDGE_BASE 的特征集合，按比例随机丢失特征、加入干扰特征
+- CNN：split_dataset/test 上的 ResNet50（可为剪枝模型）
+统一报告单条延迟分位数、批量吞吐、内存占用与准确率，写入带 schema 版本号的 JSON 结果文件
+
+用法:
+    python compare_systems.py
+    python compare_systems.py --missing 0 0.2 0.4 --noise 0 2 --rule_samples 200
+    python compare_systems.py --skip_cnn
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import resource
+import subprocess
+import tracemalloc
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Production_system"))
+sys.path.insert(0, os.path.join(ROOT, "CNN_system"))
+
+from Production_system import InferenceEngine  # noqa: E402
+from rules_base import ANIMAL_KNOWLEDGE_BASE, get_rules  # noqa: E402
+
+SCHEMA_VERSION = 1
+RESULTS_PATH = "benchmark_results.json"
+DATA_DIR = os.path.join(ROOT, "CNN_system", "split_dataset", "test")
+MODEL_PATH = os.path.join(ROOT, "CNN_system", "best_resnet50.pth")
+SEED = 42
+
+# Animals-10 目录名 -> 规则库动物名称
+LABEL_MAP = {
+    "cane": "狗",
+    "cavallo": "马",
+    "elefante": "大象",
+    "farfalla": "蝴蝶",
+    "gallina": "鸡",
+    "gatto": "猫",
+    "mucca": "牛",
+    "pecora": "羊",
+    "ragno": "蜘蛛",
+    "scoiattolo": "松鼠",
+}
+
+
+# ================================
+# 公共统计
+# ================================
+def percentiles(values, qs=(50, 90, 99)):
+    """最近秩法分位数，另附均值；单位与输入一致"""
+    ordered = sorted(values)
+    stats = {f"p{q}": ordered[min(len(ordered) - 1, max(0, -(-q * len(ordered) // 100) - 1))] for q in qs}
+    stats["mean"] = sum(ordered) / len(ordered)
+    return stats
+
+
+def peak_rss_mb():
+    """进程峰值常驻内存（MB）；Linux 上 ru_maxrss 单位为 KB，macOS 为字节"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == "darwin" else rss / 1024
+
+
+def per_class_accuracy(truths, preds):
+    totals, hits = {}, {}
+    for t, p in zip(truths, preds):
+        totals[t] = totals.get(t, 0) + 1
+        hits[t] = hits.get(t, 0) + (t == p)
+    return {name: hits[name] / totals[name] for name in sorted(totals)}
+
+
+# ================================
+# 产生式系统
+# ================================
+def animal_facts(animal):
+    """知识库中一种动物的全部可观测特征（特征 + 外观 + 习性），均作为布尔事实"""
+    entry = ANIMAL_KNOWLEDGE_BASE[animal]
+    return entry["特征"] + entry["外观"] + entry["习性"]
+
+
+def make_rule_items(samples_per_animal, missing, noise, seed=SEED):
+    """
+    生成 [(事实列表, 真实动物), ...]
+    missing: 每个特征被独立丢弃的概率；noise: 额外加入的干扰特征数（取自其他动物的特征）
+    """
+    rng = random.Random(f"{seed}-{missing}-{noise}")
+    vocabulary = sorted({f for animal in ANIMAL_KNOWLEDGE_BASE for f in animal_facts(animal)})
+    items = []
+    for animal in ANIMAL_KNOWLEDGE_BASE:
+        facts = animal_facts(animal)
+        distractors = [f for f in vocabulary if f not in facts]
+        for _ in range(samples_per_animal):
+            kept = [f for f in facts if rng.random() >= missing]
+            kept += rng.sample(distractors, min(noise, len(distractors)))
+            rng.shuffle(kept)
+            items.append((kept, animal))
+    return items
+
+
+def run_rule_engine(rules, facts):
+    engine = InferenceEngine(rules, verbose=False)
+    for fact in facts:
+        engine.add_fact(fact, True)
+    engine.infer()
+    return engine.get_result()[0]
+
+
+def benchmark_rules(items, rules):
+    """逐条计时（延迟）+ 整批计时（吞吐）+ tracemalloc 峰值（单条推理的 Python 堆分配）"""
+    latencies, preds = [], []
+    for facts, _ in items:
+        start = time.perf_counter()
+        preds.append(run_rule_engine(rules, facts))
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    for facts, _ in items:
+        run_rule_engine(rules, facts)
+    throughput = len(items) / (time.perf_counter() - start)
+
+    tracemalloc.start()
+    peaks = []
+    for facts, _ in items[:200]:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        run_rule_engine(rules, facts)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+
+    truths = [animal for _, animal in items]
+    correct = sum(p == t for p, t in zip(preds, truths))
+    answered = sum(p != "未知动物" for p in preds)
+    return {
+        "items": len(items),
+        "latency_ms": percentiles(latencies),
+        "throughput_items_per_s": throughput,
+        "memory": {"peak_alloc_per_item_kb": max(peaks) / 1024, "peak_rss_mb": peak_rss_mb()},
+        "accuracy": correct / len(items),
+        "coverage": answered / len(items),
+        "per_class_accuracy": per_class_accuracy(truths, preds),
+    }
+
+
+# ================================
+# CNN
+# ================================
+def benchmark_cnn(data_dir, model_path, batch_size, latency_items, max_images=None, num_workers=4):
+    import torch
+    from torch.utils.data import DataLoader, Subset
+    from torchvision import datasets
+
+    from fast_decode import select_loaders
+    from model_utils import eval_transforms, load_resnet50
+
+    torch.manual_seed(SEED)
+    dataset = datasets.ImageFolder(data_dir, transform=eval_transforms, loader=select_loaders()[0])
+    unknown = [c for c in dataset.classes if c not in LABEL_MAP]
+    if unknown:
+        raise ValueError(f"测试集类别不在 Animals-10 标签空间内: {unknown}")
+    names = [LABEL_MAP[c] for c in dataset.classes]
+    if max_images:
+        indices = random.Random(SEED).sample(range(len(dataset)), min(max_images, len(dataset)))
+        dataset = Subset(dataset, sorted(indices))
+
+    device = torch.device("cpu")
+    model = load_resnet50(model_path, len(names), device)
+    model_mb = sum(t.numel() * t.element_size() for t in list(model.parameters()) + list(model.buffers())) / 2**20
+
+    # 批量：完整测试集准确率 + 模型前向吞吐（不含解码，与产生式系统一样只计推理本身）
+    truths, preds, forward_time, first_batches = [], [], 0.0, []
+    with torch.no_grad():
+        for images, labels in DataLoader(dataset, batch_size=batch_size, num_workers=num_workers):
+            start = time.perf_counter()
+            outputs = model(images)
+            forward_time += time.perf_counter() - start
+            preds += [names[i] for i in outputs.argmax(1).tolist()]
+            truths += [names[i] for i in labels.tolist()]
+            if sum(x.size(0) for x in first_batches) < latency_items:
+                first_batches.append(images)
+
+        # 单条：batch=1 的前向延迟
+        singles = torch.cat(first_batches)[:latency_items]
+        for x in singles[:3]:
+            model(x[None])
+        latencies = []
+        for x in singles:
+            start = time.perf_counter()
+            model(x[None])
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    correct = sum(p == t for p, t in zip(preds, truths))
+    return {
+        "items": len(truths),
+        "batch_size": batch_size,
+        "latency_ms": percentiles(latencies),
+        "throughput_items_per_s": len(truths) / forward_time,
+        "memory": {"model_mb": model_mb, "peak_rss_mb": peak_rss_mb()},
+        "accuracy": correct / len(truths),
+        "coverage": 1.0,
+        "per_class_accuracy": per_class_accuracy(truths, preds),
+    }
+
+
+# ================================
+# 结果文件
+# ================================
+def environment_info():
+    info = {"python": platform.python_version(), "platform": platform.platform(),
+            "processor": platform.processor(), "cpu_count": os.cpu_count()}
+    try:
+        info["git_commit"] = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                                            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        info["git_commit"] = None
+    try:
+        import torch
+        info["torch"] = torch.__version__
+        info["torch_threads"] = torch.get_num_threads()
+    except ImportError:
+        info["torch"] = None
+    return info
+
+
+def print_summary(results):
+    print(f"\n{'system':<28}{'acc(%)':>8}{'cover(%)':>10}{'p50(ms)':>10}{'p99(ms)':>10}{'items/s':>12}{'RSS(MB)':>10}")
+    rows = [(f"rules missing={r['missing']} noise={r['noise']}", r) for r in results["rules"]]
+    if isinstance(results.get("cnn"), dict) and "accuracy" in results["cnn"]:
+        rows.append((f"cnn batch={results['cnn']['batch_size']}", results["cnn"]))
+    for name, r in rows:
+        print(f"{name:<28}{r['accuracy'] * 100:>8.2f}{r['coverage'] * 100:>10.1f}"
+              f"{r['latency_ms']['p50']:>10.3f}{r['latency_ms']['p99']:>10.3f}"
+              f"{r['throughput_items_per_s']:>12.1f}{r['memory']['peak_rss_mb']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CNN 与产生式系统性能对比")
+    parser.add_argument("--missing", type=float, nargs="+", default=[0.0, 0.2, 0.4],
+                        help="特征丢失概率（可多个）")
+    parser.add_argument("--noise", type=int, nargs="+", default=[0, 2], help="干扰特征数（可多个）")
+    parser.add_argument("--rule_samples", type=int, default=200, help="每种动物、每种条件生成的样本数")
+    parser.add_argument("--data_dir", default=DATA_DIR)
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--latency_items", type=int, default=100, help="CNN 单条延迟测量的图像数")
+    parser.add_argument("--max_images", type=int, default=None, help="只评测测试集的随机子集")
+    parser.add_argument("--skip_cnn", action="store_true")
+    parser.add_argument("--output", default=RESULTS_PATH)
+    args = parser.parse_args()
+
+    rules = get_rules()
+    results = {"rules": [], "cnn": None}
+    for missing in args.missing:
+        for noise in args.noise:
+            items = make_rule_items(args.rule_samples, missing, noise)
+            r = benchmark_rules(items, rules)
+            r.update(missing=missing, noise=noise)
+            results["rules"].append(r)
+            print(f"🧠 rules missing={missing} noise={noise}: acc {r['accuracy'] * 100:.2f}%")
+
+    if args.skip_cnn:
+        results["cnn"] = {"skipped": "--skip_cnn"}
+    elif not (os.path.exists(args.model) and os.path.isdir(args.data_dir)):
+        results["cnn"] = {"skipped": f"缺少模型或测试集: {args.model}, {args.data_dir}"}
+        print(f"⚠️ {results['cnn']['skipped']}，跳过 CNN")
+    else:
+        results["cnn"] = benchmark_cnn(args.data_dir, args.model, args.batch_size,
+                                       args.latency_items, args.max_images)
+        print(f"🖼️ cnn: acc {results['cnn']['accuracy'] * 100:.2f}%")
+
+    output = {
+        "schema_version": SCHEMA_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "environment": environment_info(),
+        "label_space": LABEL_MAP,
+        "config": vars(args),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(output, f, ensure_ascii=False, indent=2)
+    print_summary(results)
+    print(f"\n✅ 对比结果已保存为: {args.output}（schema v{SCHEMA_VERSION}）")
+
+
+if __name__ == "__main__":
+    main()
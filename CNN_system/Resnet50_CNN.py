@@ -1,21 +1,52 @@
 import os
+import time
 import torch
 import torch.nn as nn
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, IterableDataset
 from torchvision import datasets, transforms, models
 from tqdm import tqdm
 import matplotlib.pyplot as plt
 
+from async_validation import AsyncValidator, summarize
+from autotune import apply_threads, load_tuned_config, loader_kwargs
+from compile_utils import compile_lr, enable_compile_cache, make_eval_step, make_train_step
+from fast_decode import FAST_JPEG_DECODE, select_loaders
+from manifest_dataset import ManifestDataset
+from shard_dataset import ShardDataset
+from zip_dataset import ZipImageFolder
+
 # ================================
 # 1️⃣ 基本配置
 # ================================
 data_dir = "split_dataset"   # 数据集路径
+manifest_path = None         # 划分清单路径（如 "split_manifest.json"），设置后直接从 raw-img 读取
+zip_path = None              # 数据集 zip 包路径，设置后直接从归档读取，无需解压
+zip_root = "split_dataset"   # zip 内数据根目录（含 train/val/test）；配合 manifest_path 时为 raw-img 目录
+shard_dir = None             # shard_dataset.py pack 生成的分片目录，设置后顺序流式读取
+fast_jpeg_decode = FAST_JPEG_DECODE  # 降分辨率 JPEG 解码（默认关闭）；在 fast_decode.py 中统一切换，需与训练时一致
 num_classes = 10
 batch_size = 8
+num_workers = 4
+prefetch_factor = 2
+use_tuned_config = False     # 若本机运行过 autotune.py --mode train，用调优结果覆盖 worker / prefetch / 线程数（不改批大小）
 num_epochs = 15
 learning_rate = 1e-3
+use_compile = False          # torch.compile 编译前向+损失+反向与优化器更新（首个 epoch 付编译代价；torch 版本支持时缓存可复用）
+async_validation = False     # 每个 epoch 的权重快照交给独立评估进程验证，与下一个 epoch 的训练重叠
+async_val_threads = max(1, (os.cpu_count() or 1) // 4)  # 评估进程的线程 / 核数预算，训练进程让出相应线程
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
+tuned = load_tuned_config("train") if use_tuned_config else None
+if tuned:
+    # 批大小是影响收敛的超参数（learning_rate 未随之缩放），这里只采用吞吐相关的设置
+    num_workers, prefetch_factor = tuned["num_workers"], tuned["prefetch_factor"]
+    apply_threads(tuned)
+    print(f"⚙️ 使用调优配置: num_workers={num_workers}, prefetch_factor={prefetch_factor}, "
+          f"threads={tuned['intra_op_threads']}/{tuned['inter_op_threads']}")
+    if tuned["batch_size"] != batch_size:
+        print(f"ℹ️ 调优批大小为 {tuned['batch_size']}，训练仍使用 batch_size={batch_size}；"
+              f"如需采用请手动修改并相应调整 learning_rate")
+
 # ================================
 # 2️⃣ 数据增强与加载
 # ================================
@@ -35,11 +66,31 @@ val_transforms = transforms.Compose([
                          [0.229, 0.224, 0.225])
 ])
 
-train_dataset = datasets.ImageFolder(os.path.join(data_dir, "train"), transform=train_transforms)
-val_dataset = datasets.ImageFolder(os.path.join(data_dir, "val"), transform=val_transforms)
+def load_split(split, transform):
+    """按配置从分片 / zip 归档 / 划分清单 / split_dataset 目录加载某一划分"""
+    path_loader, bytes_loader = select_loaders(fast_jpeg_decode)
+    if shard_dir:
+        return ShardDataset(shard_dir, split, transform=transform, shuffle=(split == "train"),
+                            loader=bytes_loader)
+    if zip_path and manifest_path:
+        return ZipImageFolder(zip_path, zip_root, transform=transform, loader=bytes_loader,
+                              manifest_path=manifest_path, split=split)
+    if zip_path:
+        return ZipImageFolder(zip_path, f"{zip_root}/{split}", transform=transform, loader=bytes_loader)
+    if manifest_path:
+        return ManifestDataset(manifest_path, split, transform=transform, loader=path_loader)
+    return datasets.ImageFolder(os.path.join(data_dir, split), transform=transform, loader=path_loader)
+
+train_dataset = load_split("train", train_transforms)
+val_dataset = load_split("val", val_transforms)
 
-train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True, num_workers=4)
-val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False, num_workers=4)
+# 分片数据集自身负责打乱（分片顺序 + 洗牌缓冲区）
+# 编译模式下固定批大小：训练丢弃不足一批的尾部（BN 统计量不允许补零），验证在 make_eval_step 中补齐
+train_loader = DataLoader(train_dataset, batch_size=batch_size,
+                          shuffle=not isinstance(train_dataset, IterableDataset),
+                          drop_last=use_compile, **loader_kwargs(num_workers, prefetch_factor))
+val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False,
+                        **loader_kwargs(num_workers, prefetch_factor))
 
 print(f"训练样本数: {len(train_dataset)}")
 print(f"验证样本数: {len(val_dataset)}")
@@ -57,30 +108,98 @@ model = model.to(device)
 # 4️⃣ 损失函数与优化器
 # ================================
 criterion = nn.CrossEntropyLoss()
-optimizer = torch.optim.Adam(model.parameters(), lr=learning_rate)
+# 编译模式下 lr 用张量（torch >= 2.2），调度器调整学习率时不触发重新编译
+optimizer = torch.optim.Adam(model.parameters(),
+                             lr=compile_lr(learning_rate) if use_compile else learning_rate)
 scheduler = torch.optim.lr_scheduler.StepLR(optimizer, step_size=5, gamma=0.1)
 
+if use_compile:
+    enable_compile_cache()
+train_step = make_train_step(model, criterion, optimizer, compile=use_compile)
+eval_step = make_eval_step(model, batch_size, compile=use_compile)
+
 # ================================
 # 5️⃣ 训练与验证
 # ================================
+def plot_training_curves(path='training_curves_annotated.png'):
+    """绘制训练曲线并标注最优点；异步验证时验证曲线可能比训练曲线短几个 epoch"""
+    plt.figure(figsize=(12, 5))
+
+    # ---- Loss 曲线 ----
+    plt.subplot(1, 2, 1)
+    plt.plot(train_losses, label='Train Loss', marker='o')
+    plt.plot(val_losses, label='Val Loss', marker='o')
+    plt.axvline(x=best_epoch, color='r', linestyle='--', label=f'Best Epoch ({best_epoch+1})')
+    plt.scatter(best_epoch, val_losses[best_epoch], color='red', s=60, zorder=5)
+    plt.text(best_epoch, val_losses[best_epoch] + 0.01,
+             f'Best={val_losses[best_epoch]:.3f}', color='red', fontsize=9)
+    plt.title('Loss Curve')
+    plt.xlabel('Epoch')
+    plt.ylabel('Loss')
+    plt.legend()
+
+    # ---- Accuracy 曲线 ----
+    plt.subplot(1, 2, 2)
+    plt.plot(train_accs, label='Train Acc', marker='o')
+    plt.plot(val_accs, label='Val Acc', marker='o')
+    plt.axvline(x=best_epoch, color='r', linestyle='--', label=f'Best Epoch ({best_epoch+1})')
+    plt.scatter(best_epoch, val_accs[best_epoch], color='red', s=60, zorder=5)
+    plt.text(best_epoch, val_accs[best_epoch] + 0.5,
+             f'Best={val_accs[best_epoch]:.2f}%', color='red', fontsize=9)
+    plt.title('Accuracy Curve')
+    plt.xlabel('Epoch')
+    plt.ylabel('Accuracy (%)')
+    plt.legend()
+
+    plt.tight_layout()
+    plt.savefig(path, dpi=300)
+
+
+def on_val_result(result):
+    """处理评估进程返回的一个 epoch 的验证结果：记录曲线、更新最佳模型并重绘训练曲线"""
+    global best_val_acc, best_epoch
+    epoch, val_loss, val_acc = result["epoch"], result["val_loss"], result["val_acc"]
+    val_losses.append(val_loss)
+    val_accs.append(val_acc)
+    val_results.append(result)
+    print(f"[async] Epoch {epoch+1} Val Loss: {val_loss:.4f} | Val Acc: {val_acc:.2f}% "
+          f"({result['seconds']:.1f}s)")
+    if val_acc > best_val_acc:
+        best_val_acc = val_acc
+        best_epoch = epoch
+        os.replace(result["snapshot"], "best_resnet50.pth")
+        print(f"✅ 保存最佳模型！(Epoch {epoch+1})")
+    validator.release(result)
+    plot_training_curves()
+    plt.close()
+
+
 train_losses, val_losses = [], []
 train_accs, val_accs = [], []
 best_val_acc = 0.0
 best_epoch = 0
 
+# 异步验证：评估进程自建验证 DataLoader，训练进程不再持有 val_loader 的 worker
+validator = None
+if async_validation:
+    validator = AsyncValidator(val_dataset, batch_size, async_val_threads,
+                               num_workers=min(num_workers, async_val_threads),
+                               prefetch_factor=prefetch_factor, device=device)
+train_times, val_results = [], []
+run_start = time.perf_counter()
+
 for epoch in range(num_epochs):
     print(f"\nEpoch [{epoch+1}/{num_epochs}]")
+    epoch_start = time.perf_counter()
+    if hasattr(train_dataset, "set_epoch"):
+        train_dataset.set_epoch(epoch)
     model.train()
     train_loss, correct, total = 0.0, 0, 0
 
     for images, labels in tqdm(train_loader, desc="Training"):
         images, labels = images.to(device), labels.to(device)
 
-        optimizer.zero_grad()
-        outputs = model(images)
-        loss = criterion(outputs, labels)
-        loss.backward()
-        optimizer.step()
+        outputs, loss = train_step(images, labels)
 
         train_loss += loss.item() * images.size(0)
         _, predicted = outputs.max(1)
@@ -92,6 +211,15 @@ for epoch in range(num_epochs):
     train_losses.append(train_loss)
     train_accs.append(train_acc)
 
+    if validator:
+        print(f"Train Loss: {train_loss:.4f} | Train Acc: {train_acc:.2f}%")
+        train_times.append(time.perf_counter() - epoch_start)
+        validator.submit(epoch, model)
+        for result in validator.poll():
+            on_val_result(result)
+        scheduler.step()
+        continue
+
     # 验证
     model.eval()
     val_loss, val_correct, val_total = 0.0, 0, 0
@@ -99,7 +227,7 @@ for epoch in range(num_epochs):
     with torch.no_grad():
         for images, labels in tqdm(val_loader, desc="Validating"):
             images, labels = images.to(device), labels.to(device)
-            outputs = model(images)
+            outputs = eval_step(images)
             loss = criterion(outputs, labels)
 
             val_loss += loss.item() * images.size(0)
@@ -124,41 +252,23 @@ for epoch in range(num_epochs):
 
     scheduler.step()
 
+if validator:
+    print("\n⏳ 等待评估进程完成剩余验证...")
+    for result in validator.drain():
+        on_val_result(result)
+    validator.close()
+    report = summarize(train_times, val_results, time.perf_counter() - run_start)
+    print(report)
+    with open("async_validation_report.txt", "w", encoding="utf-8") as f:
+        f.write(report + "\n")
+    print("✅ 异步验证报告已保存为: async_validation_report.txt")
+
 print(f"\n🎯 训练完成！最佳验证准确率: {best_val_acc:.2f}% (Epoch {best_epoch+1})")
 
 # ================================
 # 6️⃣ 绘制训练曲线 + 标注最优点
 # ================================
-plt.figure(figsize=(12, 5))
-
-# ---- Loss 曲线 ----
-plt.subplot(1, 2, 1)
-plt.plot(train_losses, label='Train Loss', marker='o')
-plt.plot(val_losses, label='Val Loss', marker='o')
-plt.axvline(x=best_epoch, color='r', linestyle='--', label=f'Best Epoch ({best_epoch+1})')
-plt.scatter(best_epoch, val_losses[best_epoch], color='red', s=60, zorder=5)
-plt.text(best_epoch, val_losses[best_epoch] + 0.01,
-         f'Best={val_losses[best_epoch]:.3f}', color='red', fontsize=9)
-plt.title('Loss Curve')
-plt.xlabel('Epoch')
-plt.ylabel('Loss')
-plt.legend()
-
-# ---- Accuracy 曲线 ----
-plt.subplot(1, 2, 2)
-plt.plot(train_accs, label='Train Acc', marker='o')
-plt.plot(val_accs, label='Val Acc', marker='o')
-plt.axvline(x=best_epoch, color='r', linestyle='--', label=f'Best Epoch ({best_epoch+1})')
-plt.scatter(best_epoch, val_accs[best_epoch], color='red', s=60, zorder=5)
-plt.text(best_epoch, val_accs[best_epoch] + 0.5,
-         f'Best={val_accs[best_epoch]:.2f}%', color='red', fontsize=9)
-plt.title('Accuracy Curve')
-plt.xlabel('Epoch')
-plt.ylabel('Accuracy (%)')
-plt.legend()
-
-plt.tight_layout()
-plt.savefig('training_curves_annotated.png', dpi=300)
+plot_training_curves()
 plt.show()
 
 print("📈 已保存带标注的训练曲线：training_curves_annotated.png")
@@ -0,0 +1,184 @@
+"""
+异步验证
+每个 epoch 结束后把权重快照写入磁盘，交给独立的评估进程验证，训练进程直接开始下一个 epoch
+评估进程有自己的线程预算（OMP/MKL 线程数 + torch.set_num_threads，并绑定到末尾几个 CPU 核），
+训练进程相应减少 intra-op 线程数，两者不争抢同一批核
+
+评估进程通过 stdin / stdout 的 JSON 行通信：任务 {"epoch", "path"}，结果 {"epoch", "val_loss", "val_acc", "seconds"}
+验证集对象被序列化后交给评估进程，因此可以是任意可 pickle 的数据集（ImageFolder / 清单 / zip / 分片）
+"""
+
+import os
+import sys
+import json
+import queue
+import pickle
+import shutil
+import argparse
+import threading
+import subprocess
+import time
+
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader
+
+from autotune import loader_kwargs
+from model_utils import build_resnet50_from_state_dict
+
+WORKDIR = ".async_val"
+
+
+class AsyncValidator:
+    """
+    训练进程一侧的句柄
+    submit(epoch, model) 写快照并派发任务；poll() 取回已完成的结果（不阻塞）；drain() 等待全部完成
+    每个结果带 "snapshot" 路径，调用方处理完（如复制为最佳模型）后调用 release(result) 删除快照
+    """
+
+    def __init__(self, val_dataset, batch_size, threads, num_workers=2, prefetch_factor=2,
+                 device="cpu", workdir=WORKDIR, pin_cores=True):
+        os.makedirs(workdir, exist_ok=True)
+        self.workdir = os.path.abspath(workdir)
+        dataset_path = os.path.join(self.workdir, "val_dataset.pkl")
+        with open(dataset_path, "wb") as f:
+            pickle.dump(val_dataset, f)
+
+        cores = []
+        if pin_cores and hasattr(os, "sched_getaffinity"):
+            available = sorted(os.sched_getaffinity(0))
+            if len(available) > threads:
+                cores = available[-threads:]
+        env = dict(os.environ, OMP_NUM_THREADS=str(threads), MKL_NUM_THREADS=str(threads))
+        command = [sys.executable, os.path.abspath(__file__), "--dataset", dataset_path,
+                   "--batch_size", str(batch_size), "--threads", str(threads),
+                   "--num_workers", str(num_workers), "--prefetch_factor", str(prefetch_factor),
+                   "--device", str(device), "--cores", ",".join(map(str, cores))]
+        # 与训练进程同一工作目录，数据集中的相对路径保持有效；脚本所在目录自动进入 sys.path
+        self.proc = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+                                     encoding="utf-8", env=env)
+        # 训练进程在当前线程数（可能已由调优配置设置）基础上让出评估进程使用的线程
+        torch.set_num_threads(max(torch.get_num_threads() - threads, 1))
+
+        self.results = queue.Queue()
+        self.pending = 0
+        self._reader = threading.Thread(target=self._read_results, daemon=True)
+        self._reader.start()
+
+    def _read_results(self):
+        for line in self.proc.stdout:
+            self.results.put(json.loads(line))
+        self.results.put(None)  # 评估进程退出
+
+    def submit(self, epoch, model):
+        """把当前权重写成快照（先写临时文件再原子替换）并派发验证任务"""
+        path = os.path.join(self.workdir, f"epoch_{epoch}.pth")
+        state_dict = {k: v.detach().cpu() for k, v in model.state_dict().items()}
+        torch.save(state_dict, path + ".tmp")
+        os.replace(path + ".tmp", path)
+        self.proc.stdin.write(json.dumps({"epoch": epoch, "path": path}) + "\n")
+        self.proc.stdin.flush()
+        self.pending += 1
+
+    def _take(self, block):
+        result = self.results.get(block=block)
+        if result is None:
+            raise RuntimeError(f"评估进程异常退出（返回码 {self.proc.wait()}）")
+        self.pending -= 1
+        return result
+
+    def poll(self):
+        done = []
+        while self.pending:
+            try:
+                done.append(self._take(block=False))
+            except queue.Empty:
+                break
+        return done
+
+    def drain(self):
+        return [self._take(block=True) for _ in range(self.pending)]
+
+    @staticmethod
+    def release(result):
+        if os.path.exists(result["snapshot"]):
+            os.remove(result["snapshot"])
+
+    def close(self):
+        self.proc.stdin.close()
+        self.proc.wait()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def summarize(train_times, results, wall_clock):
+    """
+    统计异步验证节省的墙钟时间
+    exposed 为训练进程在训练之外额外等待的时间（主要是最后一个 epoch 的验证与快照写入）；
+    验证总耗时按评估进程的线程预算测得，同步验证占用全部线程时会略快
+    """
+    train_total = sum(train_times)
+    val_total = sum(r["seconds"] for r in results)
+    exposed = max(wall_clock - train_total, 0.0)
+    saving = val_total - exposed
+    return "\n".join([
+        f"wall-clock:          {wall_clock:.1f}s",
+        f"training (sum):      {train_total:.1f}s",
+        f"validation (sum):    {val_total:.1f}s (overlapped with training in a separate process)",
+        f"exposed validation:  {exposed:.1f}s",
+        f"wall-clock saving:   {saving:.1f}s ({saving / max(train_total + val_total, 1e-9) * 100:.1f}% "
+        f"of the serial {train_total + val_total:.1f}s)",
+    ])
+
+
+# ================================
+# 评估进程
+# ================================
+@torch.no_grad()
+def validate(model, loader, device):
+    criterion = nn.CrossEntropyLoss(reduction="sum")
+    loss, correct, total = 0.0, 0, 0
+    for images, labels in loader:
+        images, labels = images.to(device), labels.to(device)
+        outputs = model(images)
+        loss += criterion(outputs, labels).item()
+        correct += outputs.argmax(1).eq(labels).sum().item()
+        total += labels.size(0)
+    return loss / total, 100 * correct / total
+
+
+def worker_main():
+    parser = argparse.ArgumentParser(description="异步验证评估进程（由 AsyncValidator 启动）")
+    parser.add_argument("--dataset", required=True)
+    parser.add_argument("--batch_size", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--num_workers", type=int, default=2)
+    parser.add_argument("--prefetch_factor", type=int, default=2)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--cores", default="")
+    args = parser.parse_args()
+
+    if args.cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, [int(c) for c in args.cores.split(",")])
+    torch.set_num_threads(args.threads)
+    device = torch.device(args.device)
+    with open(args.dataset, "rb") as f:
+        dataset = pickle.load(f)
+    loader = DataLoader(dataset, batch_size=args.batch_size, shuffle=False,
+                        **loader_kwargs(args.num_workers, args.prefetch_factor))
+
+    model = None
+    for line in sys.stdin:
+        task = json.loads(line)
+        start = time.perf_counter()
+        state_dict = torch.load(task["path"], map_location=device)
+        if model is None:
+            model = build_resnet50_from_state_dict(state_dict).to(device)
+        model.load_state_dict(state_dict)
+        model.eval()
+        val_loss, val_acc = validate(model, loader, device)
+        print(json.dumps({"epoch": task["epoch"], "val_loss": val_loss, "val_acc": val_acc,
+                          "seconds": time.perf_counter() - start, "snapshot": task["path"]}), flush=True)
+
+
+if __name__ == "__main__":
+    worker_main()
@@ -0,0 +1,338 @@
+"""
+吞吐自动调优
+短时探测 批大小 / DataLoader worker 数 / prefetch_factor / torch intra-op 与 inter-op 线程数，
+在内存上限内选出实测 images/s 最高的组合，按机器（主机名 + CPU + torch 版本 + GPU）保存到 tuned_config.json，
+训练与测试脚本设置 use_tuned_config = True 后直接复用
+
+探测分四步，避免全网格搜索：
+1. 线程数：固定批大小、随机输入，只测模型计算
+2. 批大小：用最优线程数逐级加倍，超过内存上限或吞吐不再提升即停止
+3. 数据加载：只测 DataLoader（解码 + 预处理）各 worker / prefetch 组合
+4. 端到端：前两名线程配置 × 前三名加载配置实际跑完整流水线，取 images/s 最高者
+线程数只能在进程启动时设置一次（inter-op），因此涉及模型的探测都在独立子进程中进行
+
+用法:
+    python autotune.py --mode train --data_dir split_dataset
+    python autotune.py --mode eval --data_dir split_dataset --split test
+"""
+
+import io
+import os
+import json
+import time
+import socket
+import platform
+import argparse
+import resource
+import multiprocessing as mp
+from datetime import datetime
+
+import numpy as np
+import torch
+import torch.nn as nn
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset
+from torchvision import datasets
+
+from fast_decode import select_loaders
+from model_utils import build_resnet50, eval_transforms
+
+TUNE_CACHE = "tuned_config.json"
+NUM_CLASSES = 10
+BATCH_SIZES = (8, 16, 32, 64, 128, 256)
+PREFETCH_FACTORS = (2, 4)
+PROBE_STEPS = 5
+WARMUP_STEPS = 2
+PROBE_TIMEOUT = 600           # 单个子进程探测的超时（秒）
+
+
+# ================================
+# 机器标识与配置缓存
+# ================================
+def machine_key():
+    gpu = torch.cuda.get_device_name(0) if torch.cuda.is_available() else "cpu"
+    return f"{socket.gethostname()}|{platform.processor() or platform.machine()}|" \
+           f"{os.cpu_count()}cpu|torch-{torch.__version__}|{gpu}"
+
+
+def load_tuned_config(mode, path=TUNE_CACHE):
+    """返回本机在 mode（train / eval）下的调优结果；没有则返回 None"""
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get(machine_key(), {}).get(mode)
+
+
+def save_tuned_config(mode, config, path=TUNE_CACHE):
+    cache = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            cache = json.load(f)
+    cache.setdefault(machine_key(), {})[mode] = config
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+def apply_threads(config):
+    """按调优结果设置 torch 线程数；inter-op 线程数在已有并行任务后无法再修改，此时保持原值"""
+    torch.set_num_threads(config["intra_op_threads"])
+    try:
+        torch.set_num_interop_threads(config["inter_op_threads"])
+    except RuntimeError:
+        print("⚠️ inter-op 线程数已初始化，保持原值")
+
+
+def loader_kwargs(num_workers, prefetch_factor):
+    """DataLoader 的 worker 相关参数；num_workers=0 时不能传 prefetch_factor"""
+    kwargs = {"num_workers": num_workers}
+    if num_workers > 0:
+        kwargs["prefetch_factor"] = prefetch_factor
+    return kwargs
+
+
+# ================================
+# 内存测量
+# ================================
+def _children(pid):
+    path = f"/proc/{pid}/task/{pid}/children"
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        pids = [int(p) for p in f.read().split()]
+    return pids + [c for p in pids for c in _children(p)]
+
+
+def tree_rss_mb():
+    """本进程及全部子进程（DataLoader worker）的常驻内存之和（共享页会重复计入，偏保守）；非 Linux 退回本进程峰值"""
+    pids = [os.getpid()] + _children(os.getpid())
+    total, found = 0, False
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                total += int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+                found = True
+        except (OSError, ValueError):
+            continue
+    if not found:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return total / 2**20
+
+
+def default_memory_limit_mb():
+    """默认内存上限：物理内存的 80%"""
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") * 0.8 / 2**20
+    except (ValueError, OSError):
+        return 16 * 1024
+
+
+# ================================
+# 数据集
+# ================================
+class SyntheticJpegDataset(Dataset):
+    """没有真实数据时使用：反复解码同一张随机 JPEG，近似真实的解码 + 预处理开销"""
+
+    def __init__(self, size=2048, image_size=(500, 375), transform=eval_transforms):
+        pixels = np.random.default_rng(0).integers(0, 256, (image_size[1], image_size[0], 3), dtype=np.uint8)
+        buf = io.BytesIO()
+        Image.fromarray(pixels).save(buf, format="JPEG", quality=90)
+        self.data = buf.getvalue()
+        self.size = size
+        self.transform = transform
+        self.loader = select_loaders()[1]
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, idx):
+        return self.transform(self.loader(self.data)), idx % NUM_CLASSES
+
+
+def make_dataset(data_dir, split):
+    folder = os.path.join(data_dir, split) if data_dir else None
+    if folder and os.path.isdir(folder):
+        return datasets.ImageFolder(folder, transform=eval_transforms, loader=select_loaders()[0])
+    return SyntheticJpegDataset()
+
+
+# ================================
+# 探测
+# ================================
+def _run_steps(model, batches, mode, optimizer, criterion, steps, warmup):
+    """跑 warmup + steps 个批次，返回 (images/s, 峰值内存 MB)；批次数不超过 warmup 时无法计时，抛出 RuntimeError"""
+    peak, n, start = 0.0, 0, None
+    for i, (images, labels) in enumerate(batches):
+        if i == warmup:
+            start, n = time.perf_counter(), 0
+        if mode == "train":
+            optimizer.zero_grad(set_to_none=True)
+            criterion(model(images), labels).backward()
+            optimizer.step()
+        else:
+            with torch.no_grad():
+                model(images)
+        n += images.size(0)
+        peak = max(peak, tree_rss_mb())
+        if i + 1 >= warmup + steps:
+            break
+    if start is None:
+        raise RuntimeError(f"数据不足：批次数不超过 warmup={warmup}，跳过该配置")
+    return n / (time.perf_counter() - start), peak
+
+
+def _probe_worker(queue, mode, config, data_dir, split, steps, warmup):
+    """子进程：设置线程数后测模型（config 含 num_workers 时为端到端流水线）"""
+    try:
+        torch.set_num_threads(config["intra_op_threads"])
+        torch.set_num_interop_threads(config["inter_op_threads"])
+        model = build_resnet50(NUM_CLASSES).train(mode == "train")
+        optimizer = torch.optim.Adam(model.parameters(), lr=1e-4)
+        criterion = nn.CrossEntropyLoss()
+        batch_size = config["batch_size"]
+        if "num_workers" in config:
+            batches = DataLoader(make_dataset(data_dir, split), batch_size=batch_size, shuffle=True,
+                                 drop_last=True, **loader_kwargs(config["num_workers"], config["prefetch_factor"]))
+        else:
+            images = torch.randn(batch_size, 3, 224, 224)
+            labels = torch.randint(0, NUM_CLASSES, (batch_size,))
+            batches = iter(lambda: (images, labels), None)
+        speed, peak = _run_steps(model, batches, mode, optimizer, criterion, steps, warmup)
+        queue.put({"images_per_sec": speed, "peak_memory_mb": peak})
+    except (RuntimeError, MemoryError) as e:
+        queue.put({"error": str(e).splitlines()[0]})
+
+
+def probe(mode, config, data_dir=None, split="train", steps=PROBE_STEPS, warmup=WARMUP_STEPS):
+    """在 spawn 子进程中探测一个配置，返回 config 与结果合并后的字典"""
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_probe_worker, args=(queue, mode, config, data_dir, split, steps, warmup))
+    proc.start()
+    try:
+        result = queue.get(timeout=PROBE_TIMEOUT)
+    except Exception:
+        result = {"error": "timeout or crash"}
+    proc.join(timeout=10)
+    if proc.is_alive():
+        proc.kill()
+    result = {**config, **result}
+    status = result.get("error") or f"{result['images_per_sec']:.1f} img/s, {result['peak_memory_mb']:.0f} MB"
+    print(f"  {config} -> {status}")
+    return result
+
+
+def probe_loader(dataset, batch_size, num_workers, prefetch_factor, steps, warmup):
+    """只测数据加载（解码 + 预处理）吞吐"""
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=True, drop_last=True,
+                        **loader_kwargs(num_workers, prefetch_factor))
+    n, start = 0, None
+    for i, (images, _) in enumerate(loader):
+        if i == warmup:
+            start, n = time.perf_counter(), 0
+        n += images.size(0)
+        if i + 1 >= warmup + steps:
+            break
+    speed = n / (time.perf_counter() - start) if start is not None else 0.0  # 批次数不超过 warmup 时记为 0
+    print(f"  workers={num_workers} prefetch={prefetch_factor} -> {speed:.1f} img/s")
+    return {"num_workers": num_workers, "prefetch_factor": prefetch_factor, "loader_images_per_sec": speed}
+
+
+def _ok(result, memory_limit_mb):
+    return "error" not in result and result["peak_memory_mb"] <= memory_limit_mb
+
+
+def _powers_of_two(limit):
+    values, v = [], 1
+    while v < limit:
+        values.append(v)
+        v *= 2
+    return values + [limit]
+
+
+def tune(mode="train", data_dir=None, split="train", memory_limit_mb=None,
+         batch_sizes=BATCH_SIZES, steps=PROBE_STEPS, warmup=WARMUP_STEPS):
+    memory_limit_mb = memory_limit_mb or default_memory_limit_mb()
+    cpus = os.cpu_count() or 1
+    print(f"🔧 调优 mode={mode}, {cpus} CPU, 内存上限 {memory_limit_mb:.0f} MB, 机器: {machine_key()}")
+
+    # 1. 线程数
+    print("[1/4] 线程数")
+    base_batch = min(16, max(batch_sizes))
+    thread_results = [probe(mode, {"batch_size": base_batch, "intra_op_threads": intra, "inter_op_threads": inter},
+                            steps=steps, warmup=warmup)
+                      for intra in _powers_of_two(cpus) for inter in (1, 2) if inter <= cpus]
+    thread_results = sorted((r for r in thread_results if _ok(r, memory_limit_mb)),
+                            key=lambda r: -r["images_per_sec"])
+    if not thread_results:
+        raise RuntimeError("所有线程配置均失败或超出内存上限")
+    best_threads = thread_results[0]
+
+    # 2. 批大小
+    print("[2/4] 批大小")
+    batch_results = []
+    for batch_size in batch_sizes:
+        r = probe(mode, {**{k: best_threads[k] for k in ("intra_op_threads", "inter_op_threads")},
+                         "batch_size": batch_size}, steps=steps, warmup=warmup)
+        if not _ok(r, memory_limit_mb):
+            break
+        batch_results.append(r)
+        if len(batch_results) >= 3 and r["images_per_sec"] < max(b["images_per_sec"] for b in batch_results[:-2]):
+            break  # 连续两级不再提升
+    if not batch_results:
+        raise RuntimeError("最小批大小已超出内存上限")
+    batch_size = max(batch_results, key=lambda r: r["images_per_sec"])["batch_size"]
+
+    # 3. 数据加载
+    print("[3/4] 数据加载")
+    dataset = make_dataset(data_dir, split)
+    loader_results = [probe_loader(dataset, batch_size, 0, None, steps, warmup)]
+    for workers in _powers_of_two(cpus)[1:] if cpus > 1 else []:
+        for prefetch in PREFETCH_FACTORS:
+            loader_results.append(probe_loader(dataset, batch_size, workers, prefetch, steps, warmup))
+    loader_results.sort(key=lambda r: -r["loader_images_per_sec"])
+
+    # 4. 端到端
+    print("[4/4] 端到端")
+    candidates = []
+    for threads in thread_results[:2]:
+        for loader in loader_results[:3]:
+            config = {"batch_size": batch_size,
+                      "intra_op_threads": threads["intra_op_threads"],
+                      "inter_op_threads": threads["inter_op_threads"],
+                      "num_workers": loader["num_workers"],
+                      "prefetch_factor": loader["prefetch_factor"] or 2}
+            candidates.append(probe(mode, config, data_dir, split, steps, warmup))
+    candidates = [c for c in candidates if _ok(c, memory_limit_mb)]
+    if not candidates:
+        raise RuntimeError("所有端到端配置均失败或超出内存上限")
+    best = max(candidates, key=lambda r: r["images_per_sec"])
+    best["tuned_at"] = datetime.now().isoformat(timespec="seconds")
+    best["memory_limit_mb"] = round(memory_limit_mb)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批大小 / worker / 线程数吞吐自动调优")
+    parser.add_argument("--mode", choices=["train", "eval"], default="train")
+    parser.add_argument("--data_dir", default="split_dataset", help="不存在时使用合成 JPEG 测数据加载")
+    parser.add_argument("--split", default=None, help="默认 train 模式用 train，eval 模式用 test")
+    parser.add_argument("--memory_limit_gb", type=float, default=None, help="默认物理内存的 80%%")
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=list(BATCH_SIZES))
+    parser.add_argument("--steps", type=int, default=PROBE_STEPS)
+    parser.add_argument("--warmup", type=int, default=WARMUP_STEPS)
+    parser.add_argument("--output", default=TUNE_CACHE)
+    args = parser.parse_args()
+
+    split = args.split or ("train" if args.mode == "train" else "test")
+    limit = args.memory_limit_gb * 1024 if args.memory_limit_gb else None
+    best = tune(args.mode, args.data_dir, split, limit, args.batch_sizes, args.steps, args.warmup)
+    save_tuned_config(args.mode, best, args.output)
+    print(f"\n✅ 最优配置（{best['images_per_sec']:.1f} img/s）已保存到 {args.output}:")
+    for key in ("batch_size", "num_workers", "prefetch_factor", "intra_op_threads", "inter_op_threads"):
+        print(f"  {key} = {best[key]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+置信度门控的级联推理（早退出）
+在 ResNet50 的 layer3 输出上接一个轻量分类头（全局平均池化 + 全连接），主干冻结只训练该分类头；
+推理时先跑到 layer3，若分类头经温度校准后的 softmax 置信度不低于阈值，直接返回结果，
+否则复用 layer3 特征继续计算 layer4 + fc，简单图像省去约 1/3 的计算量
+
+阈值在验证集上校准：选取使级联准确率相对完整模型下降不超过 max_accuracy_drop 的最低阈值；
+测试集上报告各阈值的早退出比例、平均延迟与准确率损失，导出的 exit_head.pth 可在 test_model.py 中通过
+cascade_head_path 使用
+"""
+
+import os
+import time
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.utils.data import DataLoader
+from torchvision import datasets, transforms
+from tqdm import tqdm
+
+from fast_decode import select_loaders
+from model_utils import IMAGENET_MEAN, IMAGENET_STD, eval_transforms, load_resnet50
+
+# ================================
+# 1️⃣ 基本配置
+# ================================
+data_dir = "split_dataset"
+model_path = "best_resnet50.pth"
+num_classes = 10
+head_epochs = 3
+head_lr = 1e-3
+batch_size = 32
+max_accuracy_drop = 0.5              # 校准阈值允许的准确率下降（百分点）
+sweep_thresholds = (0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.98, 0.99)
+latency_images = 200                 # 逐张（batch=1）测延迟使用的测试图像数
+head_path = "exit_head.pth"
+report_path = "cascade_report.txt"
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+train_transforms = transforms.Compose([
+    transforms.Resize((224, 224)),
+    transforms.RandomHorizontalFlip(),
+    transforms.ToTensor(),
+    transforms.Normalize(IMAGENET_MEAN, IMAGENET_STD)
+])
+
+
+# ================================
+# 2️⃣ 早退出分类头与级联模型
+# ================================
+class EarlyExitHead(nn.Module):
+    """layer3 特征 -> 全局平均池化 -> 全连接"""
+
+    def __init__(self, in_channels, num_classes):
+        super().__init__()
+        self.fc = nn.Linear(in_channels, num_classes)
+
+    def forward(self, features):
+        return self.fc(torch.flatten(F.adaptive_avg_pool2d(features, 1), 1))
+
+
+def layer3_channels(model):
+    # 剪枝只改变 Bottleneck 中间通道，layer3 输出通道数不变；仍按权重实际形状读取
+    return model.layer3[-1].bn3.num_features
+
+
+def stage1_features(model, x):
+    """stem + layer1~3"""
+    x = model.maxpool(model.relu(model.bn1(model.conv1(x))))
+    return model.layer3(model.layer2(model.layer1(x)))
+
+
+def stage2_logits(model, features):
+    """由 layer3 特征继续计算 layer4 + fc"""
+    return model.fc(torch.flatten(model.avgpool(model.layer4(features)), 1))
+
+
+class CascadeResNet(nn.Module):
+    """
+    级联推理：置信度 >= threshold 的样本在 layer3 早退出，其余样本复用特征进入 layer4
+    forward 返回与完整模型同形状的未缩放 logits（温度只用于计算置信度）；num_exited / num_seen 累计早退出统计
+    record_exits=True 时按样本顺序记录是否早退出，exit_mask() 返回拼接后的布尔张量
+    """
+
+    def __init__(self, model, head, temperature=1.0, threshold=0.9, record_exits=False):
+        super().__init__()
+        self.model = model
+        self.head = head
+        self.temperature = temperature
+        self.threshold = threshold
+        self.record_exits = record_exits
+        self.exit_masks = []
+        self.num_exited = 0
+        self.num_seen = 0
+
+    @torch.no_grad()
+    def forward(self, x):
+        features = stage1_features(self.model, x)
+        logits = self.head(features)
+        confidence = (logits / self.temperature).softmax(1).max(1).values
+        exited = confidence >= self.threshold
+        uncertain = (~exited).nonzero(as_tuple=True)[0]
+        if uncertain.numel():
+            logits = logits.clone()
+            logits[uncertain] = stage2_logits(self.model, features[uncertain])
+        if self.record_exits:
+            self.exit_masks.append(exited.cpu())
+        self.num_exited += x.size(0) - uncertain.numel()
+        self.num_seen += x.size(0)
+        return logits
+
+    def exit_mask(self):
+        return torch.cat(self.exit_masks) if self.exit_masks else torch.zeros(0, dtype=torch.bool)
+
+    @property
+    def exit_fraction(self):
+        return self.num_exited / max(self.num_seen, 1)
+
+
+def load_cascade(model, path, device, record_exits=False):
+    """加载 cascade.py 导出的分类头、温度与阈值，包装已加载的 ResNet50"""
+    checkpoint = torch.load(path, map_location=device)
+    head = EarlyExitHead(layer3_channels(model), model.fc.out_features)
+    head.load_state_dict(checkpoint["state_dict"])
+    cascade = CascadeResNet(model, head, checkpoint["temperature"], checkpoint["threshold"], record_exits)
+    return cascade.to(device).eval()
+
+
+# ================================
+# 3️⃣ 训练分类头与校准
+# ================================
+def train_exit_head(model, loader, epochs=head_epochs, lr=head_lr):
+    """冻结主干，只训练 layer3 上的分类头"""
+    model = model.to(device).eval()
+    head = EarlyExitHead(layer3_channels(model), model.fc.out_features).to(device)
+    criterion = nn.CrossEntropyLoss()
+    optimizer = torch.optim.Adam(head.parameters(), lr=lr)
+    for epoch in range(epochs):
+        head.train()
+        for images, labels in tqdm(loader, desc=f"Exit head {epoch+1}/{epochs}"):
+            images, labels = images.to(device), labels.to(device)
+            with torch.no_grad():
+                features = stage1_features(model, images)
+            optimizer.zero_grad()
+            loss = criterion(head(features), labels)
+            loss.backward()
+            optimizer.step()
+    return head.eval()
+
+
+@torch.no_grad()
+def collect_outputs(model, head, loader):
+    """返回 (分类头 logits, 完整模型 logits, 标签)，两个阶段共用一次 layer3 计算"""
+    head_logits, full_logits, labels = [], [], []
+    for images, targets in tqdm(loader, desc="Collecting"):
+        features = stage1_features(model, images.to(device))
+        head_logits.append(head(features).cpu())
+        full_logits.append(stage2_logits(model, features).cpu())
+        labels.append(targets)
+    return torch.cat(head_logits), torch.cat(full_logits), torch.cat(labels)
+
+
+def fit_temperature(logits, labels, iters=50):
+    """温度缩放：在验证集上最小化 NLL，使 softmax 置信度与实际准确率一致"""
+    log_t = torch.zeros(1, requires_grad=True)
+    optimizer = torch.optim.LBFGS([log_t], lr=0.1, max_iter=iters)
+
+    def closure():
+        optimizer.zero_grad()
+        loss = F.cross_entropy(logits / log_t.exp(), labels)
+        loss.backward()
+        return loss
+
+    optimizer.step(closure)
+    return log_t.exp().item()
+
+
+def cascade_stats(head_logits, full_logits, labels, temperature, threshold):
+    """返回 (早退出比例, 级联准确率%)"""
+    confidence, head_pred = (head_logits / temperature).softmax(1).max(1)
+    exited = confidence >= threshold
+    pred = torch.where(exited, head_pred, full_logits.argmax(1))
+    return exited.float().mean().item(), pred.eq(labels).float().mean().item() * 100
+
+
+def calibrate_threshold(head_logits, full_logits, labels, temperature, max_drop=max_accuracy_drop):
+    """返回准确率下降不超过 max_drop 的最低阈值（早退出最多）；都不满足时返回 1.0（不早退出）"""
+    full_acc = full_logits.argmax(1).eq(labels).float().mean().item() * 100
+    confidence = (head_logits / temperature).softmax(1).max(1).values
+    for threshold in sorted(set(confidence.tolist())):
+        _, acc = cascade_stats(head_logits, full_logits, labels, temperature, threshold)
+        if full_acc - acc <= max_drop:
+            return threshold
+    return 1.0
+
+
+# ================================
+# 4️⃣ 延迟测量（batch=1，模拟逐请求推理）
+# ================================
+@torch.no_grad()
+def measure_stage_latency(model, head, images, warmup=5):
+    """返回 (layer3+分类头, layer4+fc, 完整模型) 的单张平均延迟（毫秒）"""
+    model, head = model.to("cpu").eval(), head.to("cpu").eval()
+    for x in images[:warmup]:
+        head(stage1_features(model, x[None]))
+    t1 = t2 = tf = 0.0
+    for x in images:
+        x = x[None]
+        start = time.perf_counter()
+        features = stage1_features(model, x)
+        head(features)
+        t1 += time.perf_counter() - start
+        start = time.perf_counter()
+        stage2_logits(model, features)
+        t2 += time.perf_counter() - start
+        start = time.perf_counter()
+        model(x)
+        tf += time.perf_counter() - start
+    n = len(images)
+    return t1 * 1000 / n, t2 * 1000 / n, tf * 1000 / n
+
+
+@torch.no_grad()
+def measure_cascade_latency(cascade, images):
+    """实际运行级联模型（batch=1）的单张平均延迟（毫秒）与早退出比例"""
+    cascade = cascade.to("cpu").eval()
+    cascade.num_exited = cascade.num_seen = 0
+    start = time.perf_counter()
+    for x in images:
+        cascade(x[None])
+    return (time.perf_counter() - start) * 1000 / len(images), cascade.exit_fraction
+
+
+# ================================
+# 5️⃣ 流水线
+# ================================
+def main():
+    path_loader, _ = select_loaders()
+
+    def folder(split, tf):
+        return datasets.ImageFolder(os.path.join(data_dir, split), transform=tf, loader=path_loader)
+
+    train_loader = DataLoader(folder("train", train_transforms), batch_size=batch_size,
+                              shuffle=True, num_workers=4)
+    val_loader = DataLoader(folder("val", eval_transforms), batch_size=batch_size, num_workers=4)
+    test_dataset = folder("test", eval_transforms)
+    test_loader = DataLoader(test_dataset, batch_size=batch_size, num_workers=4)
+
+    model = load_resnet50(model_path, num_classes, device)
+    head = train_exit_head(model, train_loader)
+
+    val_head, val_full, val_labels = collect_outputs(model, head, val_loader)
+    temperature = fit_temperature(val_head, val_labels)
+    threshold = calibrate_threshold(val_head, val_full, val_labels, temperature)
+    torch.save({"state_dict": head.state_dict(), "temperature": temperature,
+                "threshold": threshold, "stage": "layer3"}, head_path)
+    print(f"✅ 分类头已导出: {head_path}（T={temperature:.3f}, threshold={threshold:.4f}）")
+
+    test_head, test_full, test_labels = collect_outputs(model, head, test_loader)
+    full_acc = test_full.argmax(1).eq(test_labels).float().mean().item() * 100
+    head_acc = test_head.argmax(1).eq(test_labels).float().mean().item() * 100
+
+    images = torch.stack([test_dataset[i][0] for i in range(min(latency_images, len(test_dataset)))])
+    t_stage1, t_stage2, t_full = measure_stage_latency(model, head, images)
+
+    lines = [
+        f"exit stage: layer3, temperature={temperature:.3f}, calibrated threshold={threshold:.4f} "
+        f"(val, max drop {max_accuracy_drop} pts)",
+        f"full model: acc {full_acc:.2f}%, latency {t_full:.1f} ms/img",
+        f"exit head alone: acc {head_acc:.2f}%, latency {t_stage1:.1f} ms/img (layer4+fc {t_stage2:.1f} ms)",
+        "",
+        f"{'threshold':>10}{'exited(%)':>12}{'latency(ms)':>14}{'acc(%)':>10}{'acc loss':>10}",
+    ]
+    # 延迟按 batch=1 估计：每张都付 stage1，未早退出的再付 stage2
+    for t in sorted(set(sweep_thresholds) | {threshold}):
+        exited, acc = cascade_stats(test_head, test_full, test_labels, temperature, t)
+        latency = t_stage1 + (1 - exited) * t_stage2
+        mark = "  <- calibrated" if t == threshold else ""
+        lines.append(f"{t:>10.4f}{exited * 100:>12.1f}{latency:>14.1f}{acc:>10.2f}{full_acc - acc:>+10.2f}{mark}")
+
+    cascade = CascadeResNet(model, head, temperature, threshold)
+    measured, exited = measure_cascade_latency(cascade, images)
+    lines.append(f"\nmeasured cascade @ calibrated threshold ({len(images)} imgs, batch=1): "
+                 f"{measured:.1f} ms/img, exited {exited * 100:.1f}%, speedup {t_full / measured:.2f}x")
+
+    report = "\n".join(lines)
+    print("\n" + report)
+    with open(report_path, "w", encoding="utf-8") as f:
+        f.write(report + "\n")
+    print(f"✅ 级联推理报告已保存为: {report_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+torch.compile 编译模式
+把 ResNet50 的前向 + 损失（及其反向图）与优化器更新分别编译，减少逐算子的 Python 分发与未融合内核开销
+- 形状固定（dynamic=False）：训练用 drop_last 丢弃不足一批的尾部，验证/测试把最后一批补零到整批再截断输出，
+  因而整个训练过程中不会因批大小变化而重新编译
+- 编译产物（FX 图缓存，torch 新版本中还有 AOTAutograd 缓存）写入 inductor 缓存目录，再次运行时直接复用；
+  缓存目录由 TORCHINDUCTOR_CACHE_DIR 决定，需在启动 Python 前设置
+- 版本要求：编译优化器使用张量 lr 需 torch >= 2.2，持久化缓存需当前 torch 提供对应配置项；
+  requirements.txt 固定的 torch 2.0.1 不满足时回退为 float lr、不开启缓存，并给出提示
+
+用法（基准：编译耗时、稳态单步耗时、回本所需 epoch 数）:
+    python compile_utils.py --batch_size 8 --steps 20
+"""
+
+import os
+import time
+import argparse
+
+import torch
+import torch.nn as nn
+
+from model_utils import build_resnet50
+
+COMPILE_MODE = "default"        # 可选 "reduce-overhead" / "max-autotune"（编译更慢，稳态更快）
+TENSOR_LR_MIN_TORCH = (2, 2)    # 编译后的优化器更新支持张量 lr 的最低 torch 版本
+
+
+def enable_compile_cache():
+    """
+    开启持久化编译缓存；需在首次 torch.compile 调用前执行
+    只设置当前 torch 实际提供的配置项（torch 已导入，此时再设置 TORCHINDUCTOR_* 环境变量不生效），
+    返回已开启的缓存列表，均不支持时返回空列表
+    """
+    import torch._inductor.config as inductor_config
+    import torch._functorch.config as functorch_config
+    enabled = []
+    if hasattr(inductor_config, "fx_graph_cache"):
+        inductor_config.fx_graph_cache = True
+        enabled.append("fx_graph_cache")
+    if hasattr(functorch_config, "enable_autograd_cache"):
+        functorch_config.enable_autograd_cache = True
+        enabled.append("autograd_cache")
+    if not enabled:
+        print(f"⚠️ torch {torch.__version__} 不支持持久化编译缓存，每次运行都会重新编译")
+    return enabled
+
+
+def compile_lr(learning_rate):
+    """
+    编译模式下传给优化器的 lr：torch >= 2.2 用张量，调度器调整学习率时不触发重新编译；
+    更早的版本不支持张量 lr，回退为 float（每次调整学习率会重新编译一次优化器更新）
+    """
+    if torch.__version__ >= TENSOR_LR_MIN_TORCH:
+        return torch.tensor(learning_rate)
+    print(f"⚠️ torch {torch.__version__} 的编译优化器不支持张量 lr，回退为 float（调整学习率时会重新编译）")
+    return learning_rate
+
+
+def pad_batch(images, batch_size):
+    """把不足 batch_size 的最后一批补零到整批，返回 (补齐后的张量, 有效样本数)"""
+    n = images.size(0)
+    if n >= batch_size:
+        return images, n
+    pad = images.new_zeros((batch_size - n, *images.shape[1:]))
+    return torch.cat([images, pad]), n
+
+
+def make_train_step(model, criterion, optimizer, compile=True, mode=COMPILE_MODE):
+    """
+    返回 step(images, labels) -> (outputs, loss)，完成一次 前向 + 损失 + 反向 + 参数更新
+    compile=True 时前向与损失编译为一张图（AOTAutograd 同时生成对应的反向图），优化器更新单独编译；
+    配合学习率调度器时，优化器的 lr 应由 compile_lr() 给出（新版本为张量），否则每次调整学习率都会重新编译
+    """
+    def forward_loss(images, labels):
+        outputs = model(images)
+        return outputs, criterion(outputs, labels)
+
+    def optimizer_step():
+        optimizer.step()
+
+    if compile:
+        forward_loss = torch.compile(forward_loss, mode=mode, dynamic=False)
+        optimizer_step = torch.compile(optimizer_step, mode=mode, dynamic=False)
+
+    def step(images, labels):
+        optimizer.zero_grad(set_to_none=True)
+        outputs, loss = forward_loss(images, labels)
+        loss.backward()
+        optimizer_step()
+        return outputs.detach(), loss.detach()
+
+    return step
+
+
+def make_eval_step(model, batch_size, compile=True, mode=COMPILE_MODE):
+    """返回 forward(images) -> outputs；最后一批补齐到 batch_size 后再截断，避免重新编译"""
+    if not compile:
+        return model
+    forward = torch.compile(model, mode=mode, dynamic=False)
+
+    def step(images):
+        padded, n = pad_batch(images, batch_size)
+        return forward(padded)[:n]
+
+    return step
+
+
+# ================================
+# 基准：编译耗时 / 稳态耗时 / 回本 epoch 数
+# ================================
+def _count_images(data_dir):
+    if not os.path.isdir(data_dir):
+        return None
+    return sum(len(files) for _, _, files in os.walk(data_dir))
+
+
+def _time_steps(fn, steps):
+    start = time.perf_counter()
+    for _ in range(steps):
+        fn()
+    return (time.perf_counter() - start) / steps
+
+
+def benchmark_training(num_classes, batch_size, image_size, steps, warmup, device, mode=COMPILE_MODE):
+    """返回 {eager_step, compile_time, compiled_step}（秒），使用随机输入"""
+    images = torch.randn(batch_size, 3, image_size, image_size, device=device)
+    labels = torch.randint(0, num_classes, (batch_size,), device=device)
+    results = {}
+
+    for compiled in (False, True):
+        torch.manual_seed(0)
+        model = build_resnet50(num_classes).to(device).train()
+        optimizer = torch.optim.Adam(model.parameters(), lr=compile_lr(1e-3) if compiled else 1e-3)
+        step = make_train_step(model, nn.CrossEntropyLoss(), optimizer, compile=compiled, mode=mode)
+        start = time.perf_counter()
+        step(images, labels)
+        first = time.perf_counter() - start
+        _time_steps(lambda: step(images, labels), warmup)
+        per_step = _time_steps(lambda: step(images, labels), steps)
+        if compiled:
+            results["compiled_step"] = per_step
+            results["compile_time"] = max(first - per_step, 0.0)
+        else:
+            results["eager_step"] = per_step
+    return results
+
+
+@torch.no_grad()
+def benchmark_eval(num_classes, batch_size, image_size, steps, warmup, device, mode=COMPILE_MODE):
+    """返回 {eager_step, compile_time, compiled_step, partial_batch}（秒）"""
+    images = torch.randn(batch_size, 3, image_size, image_size, device=device)
+    model = build_resnet50(num_classes).to(device).eval()
+    results = {}
+    for compiled in (False, True):
+        step = make_eval_step(model, batch_size, compile=compiled, mode=mode)
+        start = time.perf_counter()
+        step(images)
+        first = time.perf_counter() - start
+        _time_steps(lambda: step(images), warmup)
+        per_step = _time_steps(lambda: step(images), steps)
+        if compiled:
+            results["compiled_step"] = per_step
+            results["compile_time"] = max(first - per_step, 0.0)
+            # 尾部不足一批：补齐后复用已编译的图
+            results["partial_batch"] = _time_steps(lambda: step(images[:max(batch_size // 2, 1)]), 1)
+        else:
+            results["eager_step"] = per_step
+    return results
+
+
+def break_even_epochs(compile_time, eager_step, compiled_step, steps_per_epoch):
+    """编译耗时需要多少个 epoch 的单步节省才能抵消；编译后不更快时返回 inf"""
+    saving = (eager_step - compiled_step) * steps_per_epoch
+    return compile_time / saving if saving > 0 else float("inf")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="torch.compile 编译模式基准")
+    parser.add_argument("--data_dir", default="split_dataset", help="用于统计每个 epoch 的步数")
+    parser.add_argument("--train_size", type=int, default=None, help="训练样本数（默认统计 data_dir/train）")
+    parser.add_argument("--val_size", type=int, default=None, help="验证样本数（默认统计 data_dir/val）")
+    parser.add_argument("--num_classes", type=int, default=10)
+    parser.add_argument("--batch_size", type=int, default=8)
+    parser.add_argument("--image_size", type=int, default=224)
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--mode", default=COMPILE_MODE)
+    parser.add_argument("--report", default="compile_report.txt")
+    args = parser.parse_args()
+
+    caches = enable_compile_cache()
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    train_size = args.train_size or _count_images(os.path.join(args.data_dir, "train")) or 18325
+    val_size = args.val_size or _count_images(os.path.join(args.data_dir, "val")) or 3927
+    train_steps = train_size // args.batch_size
+    val_steps = (val_size + args.batch_size - 1) // args.batch_size
+
+    train = benchmark_training(args.num_classes, args.batch_size, args.image_size,
+                               args.steps, args.warmup, device, args.mode)
+    val = benchmark_eval(args.num_classes, args.batch_size, args.image_size,
+                         args.steps, args.warmup, device, args.mode)
+
+    compile_time = train["compile_time"] + val["compile_time"]
+    eager_epoch = train["eager_step"] * train_steps + val["eager_step"] * val_steps
+    compiled_epoch = train["compiled_step"] * train_steps + val["compiled_step"] * val_steps
+    epochs = compile_time / (eager_epoch - compiled_epoch) if eager_epoch > compiled_epoch else float("inf")
+
+    lines = [
+        f"device={device.type} mode={args.mode} batch_size={args.batch_size} image_size={args.image_size}",
+        f"torch {torch.__version__}, compile cache: {', '.join(caches) or 'unsupported'}",
+        f"steps/epoch: train {train_steps} (drop_last), val {val_steps} (padded)",
+        "",
+        f"{'':<8}{'compile(s)':>12}{'eager(ms)':>12}{'compiled(ms)':>14}{'speedup':>10}",
+    ]
+    for name, r in (("train", train), ("eval", val)):
+        lines.append(f"{name:<8}{r['compile_time']:>12.1f}{r['eager_step'] * 1000:>12.1f}"
+                     f"{r['compiled_step'] * 1000:>14.1f}{r['eager_step'] / r['compiled_step']:>9.2f}x")
+    lines += [
+        f"eval partial batch (padded, no recompile): {val['partial_batch'] * 1000:.1f} ms",
+        "",
+        f"epoch time: eager {eager_epoch:.1f}s, compiled {compiled_epoch:.1f}s",
+        f"break-even: {epochs:.2f} epochs "
+        f"(train step only: {break_even_epochs(train['compile_time'], train['eager_step'], train['compiled_step'], train_steps):.2f})",
+        "再次运行时编译缓存命中，compile(s) 应明显下降" if caches else "当前 torch 不支持持久化缓存，每次运行都付编译代价",
+    ]
+    report = "\n".join(lines)
+    print(report)
+    with open(args.report, "w", encoding="utf-8") as f:
+        f.write(report + "\n")
+    print(f"✅ 编译基准报告已保存为: {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+知识蒸馏训练脚本
+以训练好的 best_resnet50.pth 为教师，在同一 split_dataset 上训练轻量学生模型
+（ResNet18 / MobileNetV3），用于仅有 CPU 的推理场景
+
+可选缓存教师 logits：教师只在训练集上完整前向一次（原图 + 水平翻转两份），
+之后每个 epoch 直接读取缓存，不再运行教师
+"""
+
+import os
+import time
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.utils.data import DataLoader, Dataset
+from torchvision import datasets, models, transforms
+from tqdm import tqdm
+
+from model_utils import IMAGENET_MEAN, IMAGENET_STD, eval_transforms, load_resnet50
+
+# ================================
+# 1️⃣ 基本配置
+# ================================
+data_dir = "split_dataset"
+teacher_path = "best_resnet50.pth"
+student_arch = "mobilenet_v3_large"   # resnet18 / mobilenet_v3_small / mobilenet_v3_large
+student_path = f"best_{student_arch}_student.pth"
+num_classes = 10
+batch_size = 32
+num_epochs = 10
+learning_rate = 1e-3
+temperature = 4.0       # 蒸馏温度
+alpha = 0.7             # 软标签损失权重，(1 - alpha) 为真实标签交叉熵权重
+use_cached_teacher_logits = True
+teacher_cache_path = "teacher_logits_train.pt"
+report_path = "distill_report.txt"
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+train_transforms = transforms.Compose([
+    transforms.Resize((224, 224)),
+    transforms.RandomHorizontalFlip(),
+    transforms.RandomRotation(15),
+    transforms.ToTensor(),
+    transforms.Normalize(IMAGENET_MEAN, IMAGENET_STD)
+])
+
+
+# ================================
+# 2️⃣ 模型与数据
+# ================================
+def build_student(arch, num_classes, pretrained=True):
+    """构建学生模型（ImageNet 预训练权重 + 新分类头）"""
+    if arch == "resnet18":
+        model = models.resnet18(weights=models.ResNet18_Weights.IMAGENET1K_V1 if pretrained else None)
+        model.fc = nn.Linear(model.fc.in_features, num_classes)
+    elif arch == "mobilenet_v3_small":
+        model = models.mobilenet_v3_small(
+            weights=models.MobileNet_V3_Small_Weights.IMAGENET1K_V1 if pretrained else None)
+        model.classifier[-1] = nn.Linear(model.classifier[-1].in_features, num_classes)
+    elif arch == "mobilenet_v3_large":
+        model = models.mobilenet_v3_large(
+            weights=models.MobileNet_V3_Large_Weights.IMAGENET1K_V2 if pretrained else None)
+        model.classifier[-1] = nn.Linear(model.classifier[-1].in_features, num_classes)
+    else:
+        raise ValueError(f"不支持的学生模型: {arch}")
+    return model
+
+
+class IndexedDataset(Dataset):
+    """在样本后附带其下标，用于查找缓存的教师 logits"""
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, idx):
+        image, label = self.dataset[idx]
+        return image, label, idx
+
+
+@torch.no_grad()
+def compute_teacher_logits(teacher, dataset, batch_size, device):
+    """对训练集（确定性预处理）运行一次教师，返回 (N, 2, C)：原图与水平翻转"""
+    loader = DataLoader(IndexedDataset(dataset), batch_size=batch_size, shuffle=False, num_workers=4)
+    cache = torch.empty(len(dataset), 2, num_classes)
+    for images, _, idx in tqdm(loader, desc="教师前向（缓存）"):
+        images = images.to(device)
+        cache[idx, 0] = teacher(images).float().cpu()
+        cache[idx, 1] = teacher(torch.flip(images, dims=[3])).float().cpu()
+    return cache
+
+
+def load_or_compute_teacher_logits(teacher, dataset, batch_size, device, cache_path):
+    """样本列表与缓存一致时直接复用，否则重新计算并保存"""
+    samples = [os.path.relpath(p, data_dir) for p, _ in dataset.samples]
+    if os.path.exists(cache_path):
+        cached = torch.load(cache_path)
+        if cached["samples"] == samples:
+            print(f"✅ 复用教师 logits 缓存: {cache_path}")
+            return cached["logits"]
+        print("⚠️ 训练集已变化，重新计算教师 logits")
+    logits = compute_teacher_logits(teacher, dataset, batch_size, device)
+    torch.save({"samples": samples, "logits": logits}, cache_path)
+    print(f"✅ 教师 logits 已缓存: {cache_path}")
+    return logits
+
+
+def distillation_loss(student_logits, teacher_logits, labels, T=temperature, a=alpha):
+    """Hinton 蒸馏损失：T² 缩放的软标签 KL 散度 + 真实标签交叉熵"""
+    soft = F.kl_div(F.log_softmax(student_logits / T, dim=1),
+                    F.softmax(teacher_logits / T, dim=1),
+                    reduction="batchmean") * (T * T)
+    hard = F.cross_entropy(student_logits, labels)
+    return a * soft + (1 - a) * hard
+
+
+# ================================
+# 3️⃣ 评估与测速
+# ================================
+@torch.no_grad()
+def evaluate(model, loader, device):
+    """返回准确率（%）"""
+    model.eval()
+    correct, total = 0, 0
+    for images, labels in loader:
+        outputs = model(images.to(device))
+        correct += outputs.argmax(1).cpu().eq(labels).sum().item()
+        total += labels.size(0)
+    return 100 * correct / total
+
+
+@torch.no_grad()
+def measure_throughput(model, batch_size=32, iters=20, warmup=3):
+    """在 CPU 上用随机输入测量推理吞吐（images/sec）"""
+    model = model.to("cpu").eval()
+    x = torch.randn(batch_size, 3, 224, 224)
+    for _ in range(warmup):
+        model(x)
+    start = time.perf_counter()
+    for _ in range(iters):
+        model(x)
+    return batch_size * iters / (time.perf_counter() - start)
+
+
+def count_parameters(model):
+    return sum(p.numel() for p in model.parameters())
+
+
+# ================================
+# 4️⃣ 蒸馏训练
+# ================================
+def main():
+    train_folder = os.path.join(data_dir, "train")
+    val_dataset = datasets.ImageFolder(os.path.join(data_dir, "val"), transform=eval_transforms)
+    test_dataset = datasets.ImageFolder(os.path.join(data_dir, "test"), transform=eval_transforms)
+    val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False, num_workers=4)
+    test_loader = DataLoader(test_dataset, batch_size=batch_size, shuffle=False, num_workers=4)
+
+    teacher = load_resnet50(teacher_path, num_classes, device)
+    student = build_student(student_arch, num_classes).to(device)
+    print(f"教师参数量: {count_parameters(teacher) / 1e6:.2f}M | "
+          f"学生 ({student_arch}) 参数量: {count_parameters(student) / 1e6:.2f}M")
+
+    if use_cached_teacher_logits:
+        # 缓存模式：输入需与缓存时一致，数据增强仅保留（已缓存的）水平翻转
+        train_dataset = datasets.ImageFolder(train_folder, transform=eval_transforms)
+        teacher_logits = load_or_compute_teacher_logits(
+            teacher, train_dataset, batch_size, device, teacher_cache_path)
+        teacher.to("cpu")
+    else:
+        train_dataset = datasets.ImageFolder(train_folder, transform=train_transforms)
+        teacher_logits = None
+    train_loader = DataLoader(IndexedDataset(train_dataset), batch_size=batch_size,
+                              shuffle=True, num_workers=4)
+
+    optimizer = torch.optim.Adam(student.parameters(), lr=learning_rate)
+    scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=num_epochs)
+    best_val_acc = 0.0
+
+    for epoch in range(num_epochs):
+        print(f"\nEpoch [{epoch+1}/{num_epochs}]")
+        student.train()
+        running_loss, total = 0.0, 0
+
+        for images, labels, idx in tqdm(train_loader, desc="Distilling"):
+            images, labels = images.to(device), labels.to(device)
+            if teacher_logits is not None:
+                flip = torch.rand(images.size(0)) < 0.5
+                images[flip.to(device)] = torch.flip(images[flip.to(device)], dims=[3])
+                t_logits = teacher_logits[idx, flip.long()].to(device)
+            else:
+                with torch.no_grad():
+                    t_logits = teacher(images)
+
+            optimizer.zero_grad()
+            loss = distillation_loss(student(images), t_logits, labels)
+            loss.backward()
+            optimizer.step()
+
+            running_loss += loss.item() * images.size(0)
+            total += images.size(0)
+
+        val_acc = evaluate(student, val_loader, device)
+        print(f"Distill Loss: {running_loss / total:.4f} | Val Acc: {val_acc:.2f}%")
+        if val_acc > best_val_acc:
+            best_val_acc = val_acc
+            torch.save(student.state_dict(), student_path)
+            print("✅ 保存最佳学生模型！")
+        scheduler.step()
+
+    # ================================
+    # 5️⃣ 教师 vs 学生 报告
+    # ================================
+    student.load_state_dict(torch.load(student_path, map_location=device))
+    teacher.to(device)
+    rows = []
+    for name, model in [("teacher (resnet50)", teacher), (f"student ({student_arch})", student)]:
+        acc = evaluate(model.to(device), test_loader, device)
+        ips = measure_throughput(model)
+        rows.append((name, count_parameters(model) / 1e6, acc, ips))
+
+    lines = [f"{'model':<30}{'params(M)':>12}{'test acc(%)':>14}{'CPU img/s':>12}"]
+    for name, params, acc, ips in rows:
+        lines.append(f"{name:<30}{params:>12.2f}{acc:>14.2f}{ips:>12.1f}")
+    lines.append(f"\nspeedup: {rows[1][3] / rows[0][3]:.2f}x | "
+                 f"accuracy delta: {rows[1][2] - rows[0][2]:+.2f} pts")
+    report = "\n".join(lines)
+    print("\n" + report)
+    with open(report_path, "w", encoding="utf-8") as f:
+        f.write(report + "\n")
+    print(f"✅ 蒸馏报告已保存为: {report_path}")
+
+
+if __name__ == "__main__":
+    main()
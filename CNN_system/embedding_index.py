@@ -0,0 +1,356 @@
+"""
+图像相似检索与近重复检测
+提取训练好的 ResNet50 倒数第二层特征（2048 维），以 float16/int8 紧凑存储，
+并用纯 NumPy 实现的 IVF（倒排文件）近似最近邻索引支持批量查询
+
+用法:
+    python embedding_index.py build               # 提取 train/val/test 特征并建索引
+    python embedding_index.py query a.jpg b.jpg   # 查询相似图像
+    python embedding_index.py dups                # 跨划分近重复检测
+    python embedding_index.py bench               # 与暴力搜索对比召回率与 QPS
+"""
+
+import os
+import time
+import argparse
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader
+from torchvision import datasets
+from PIL import Image
+from tqdm import tqdm
+
+from model_utils import eval_transforms, load_resnet50
+
+# ================================
+# 配置
+# ================================
+DATA_DIR = "split_dataset"
+MODEL_PATH = "best_resnet50.pth"
+INDEX_PATH = "embedding_index.npz"
+SPLITS = ("train", "val", "test")
+NUM_CLASSES = 10
+BATCH_SIZE = 32
+SEED = 42
+
+
+# ================================
+# 特征提取
+# ================================
+def build_feature_extractor(model_path=MODEL_PATH, num_classes=NUM_CLASSES, device="cpu"):
+    """加载训练好的模型，并去掉分类头，输出 2048 维池化特征"""
+    model = load_resnet50(model_path, num_classes, device)
+    model.fc = nn.Identity()
+    return model
+
+
+@torch.no_grad()
+def extract_embeddings(model, loader, device="cpu"):
+    """批量提取 L2 归一化后的特征，返回 float32 矩阵 (N, D)"""
+    feats = []
+    for images, _ in tqdm(loader, desc="提取特征"):
+        out = model(images.to(device))
+        feats.append(nn.functional.normalize(out, dim=1).cpu().numpy())
+    return np.concatenate(feats).astype(np.float32)
+
+
+def extract_split_embeddings(model, data_dir=DATA_DIR, splits=SPLITS, device="cpu"):
+    """提取各划分的特征，同时记录文件路径、划分与标签"""
+    all_feats, paths, split_names, labels = [], [], [], []
+    for split in splits:
+        dataset = datasets.ImageFolder(os.path.join(data_dir, split), transform=eval_transforms)
+        loader = DataLoader(dataset, batch_size=BATCH_SIZE, shuffle=False, num_workers=4)
+        print(f"[{split}] {len(dataset)} 张")
+        all_feats.append(extract_embeddings(model, loader, device))
+        paths.extend(os.path.relpath(p, data_dir) for p, _ in dataset.samples)
+        split_names.extend([split] * len(dataset))
+        labels.extend(dataset.targets)
+    return (np.concatenate(all_feats), np.array(paths),
+            np.array(split_names), np.array(labels, dtype=np.int16))
+
+
+# ================================
+# 紧凑存储（float16 / 逐向量缩放的 int8）
+# ================================
+def quantize(x, dtype="int8"):
+    """返回 (codes, scales)；float16 时 scales 为 None"""
+    if dtype == "float16":
+        return x.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(x).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.round(x / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    raise ValueError(f"不支持的存储类型: {dtype}")
+
+
+def dequantize(codes, scales=None):
+    """还原为 float32"""
+    x = codes.astype(np.float32)
+    if scales is not None:
+        x *= scales[:, None]
+    return x
+
+
+# ================================
+# IVF 近似最近邻索引
+# ================================
+def spherical_kmeans(x, nlist, iters=20, seed=SEED, chunk=8192):
+    """球面 k-means（余弦相似度），返回单位化的聚类中心 (nlist, D)"""
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), nlist, replace=False)].copy()
+    for _ in range(iters):
+        assign = assign_lists(x, centroids, chunk)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        counts = np.bincount(assign, minlength=nlist)
+        # 空簇重新随机初始化
+        empty = counts == 0
+        sums[empty] = x[rng.choice(len(x), int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.maximum(norms, 1e-12)
+    return centroids.astype(np.float32)
+
+
+def assign_lists(x, centroids, chunk=8192):
+    """把每个向量分配到内积最大的聚类中心"""
+    assign = np.empty(len(x), dtype=np.int64)
+    for start in range(0, len(x), chunk):
+        assign[start:start + chunk] = (x[start:start + chunk] @ centroids.T).argmax(axis=1)
+    return assign
+
+
+class IVFIndex:
+    """倒排文件索引：向量按所属聚类连续存放（CSR 布局），查询只扫描 nprobe 个倒排表"""
+
+    def __init__(self, centroids, codes, scales, ids, offsets, dtype):
+        self.centroids = centroids
+        self.codes = codes
+        self.scales = scales
+        self.ids = ids
+        self.offsets = offsets
+        self.dtype = dtype
+        # 原始编号 -> 存储位置
+        self.positions = np.empty(len(ids), dtype=np.int64)
+        self.positions[ids] = np.arange(len(ids))
+
+    @classmethod
+    def build(cls, x, nlist=None, dtype="int8", iters=20, seed=SEED):
+        """在归一化特征上训练聚类中心并写入倒排表"""
+        if nlist is None:
+            nlist = max(1, int(4 * np.sqrt(len(x))))
+        nlist = min(nlist, len(x))
+        centroids = spherical_kmeans(x, nlist, iters, seed)
+        assign = assign_lists(x, centroids)
+        order = np.argsort(assign, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))])
+        codes, scales = quantize(x[order], dtype)
+        return cls(centroids, codes, scales, order.astype(np.int64), offsets.astype(np.int64), dtype)
+
+    @property
+    def ntotal(self):
+        return len(self.ids)
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    def vectors(self, start=0, stop=None):
+        """按存储顺序还原一段向量"""
+        scales = None if self.scales is None else self.scales[start:stop]
+        return dequantize(self.codes[start:stop], scales)
+
+    def reconstruct(self, ids):
+        """按原始编号还原向量"""
+        p = self.positions[np.asarray(ids)]
+        scales = None if self.scales is None else self.scales[p]
+        return dequantize(self.codes[p], scales)
+
+    def search(self, queries, k=10, nprobe=8):
+        """
+        批量近似搜索，返回 (scores, ids)，形状均为 (nq, k)；不足 k 个时 id 为 -1
+        按倒排表分组：每个被探测的倒排表只还原一次，与探测它的全部查询做一次矩阵乘法
+        """
+        queries = np.atleast_2d(queries).astype(np.float32)
+        nprobe = min(nprobe, self.nlist)
+        nq = len(queries)
+        coarse = queries @ self.centroids.T
+        probes = np.argpartition(-coarse, nprobe - 1, axis=1)[:, :nprobe]
+
+        # 每个查询 nprobe 个槽位，每个槽位保留对应倒排表内的前 k 个候选（存储位置）
+        cand_scores = np.full((nq, nprobe, k), -np.inf, dtype=np.float32)
+        cand_pos = np.full((nq, nprobe, k), -1, dtype=np.int64)
+        for l in np.unique(probes):
+            start, stop = self.offsets[l], self.offsets[l + 1]
+            if start == stop:
+                continue
+            qs, slots = np.nonzero(probes == l)
+            scores = queries[qs] @ self.vectors(start, stop).T
+            kl = min(k, stop - start)
+            top = np.argpartition(-scores, kl - 1, axis=1)[:, :kl]
+            cand_scores[qs, slots, :kl] = np.take_along_axis(scores, top, axis=1)
+            cand_pos[qs, slots, :kl] = start + top
+
+        cand_scores, cand_pos = cand_scores.reshape(nq, -1), cand_pos.reshape(nq, -1)
+        top = np.argpartition(-cand_scores, k - 1, axis=1)[:, :k]
+        order = np.take_along_axis(cand_scores, top, axis=1).argsort(axis=1)[:, ::-1]
+        top = np.take_along_axis(top, order, axis=1)
+        pos = np.take_along_axis(cand_pos, top, axis=1)
+        out_ids = np.where(pos >= 0, self.ids[np.maximum(pos, 0)], -1)
+        return np.take_along_axis(cand_scores, top, axis=1), out_ids
+
+    def search_exact(self, queries, k=10, chunk=4096):
+        """暴力搜索（同一份量化数据），作为召回率基准；k 超过库大小时与 search 一样以 -1 补齐"""
+        queries = np.atleast_2d(queries).astype(np.float32)
+        scores = np.empty((len(queries), self.ntotal), dtype=np.float32)
+        for start in range(0, self.ntotal, chunk):
+            scores[:, start:start + chunk] = queries @ self.vectors(start, start + chunk).T
+        kk = min(k, self.ntotal)
+        top = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+        order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+        top = np.take_along_axis(top, order, axis=1)
+        out_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        out_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        out_scores[:, :kk] = np.take_along_axis(scores, top, axis=1)
+        out_ids[:, :kk] = self.ids[top]
+        return out_scores, out_ids
+
+    def save(self, path, **metadata):
+        arrays = dict(centroids=self.centroids, codes=self.codes, ids=self.ids,
+                      offsets=self.offsets, dtype=np.array(self.dtype))
+        if self.scales is not None:
+            arrays["scales"] = self.scales
+        np.savez(path, **arrays, **metadata)
+
+    @classmethod
+    def load(cls, path):
+        """返回 (index, metadata)"""
+        data = np.load(path)
+        scales = data["scales"] if "scales" in data.files else None
+        index = cls(data["centroids"], data["codes"], scales, data["ids"],
+                    data["offsets"], str(data["dtype"]))
+        reserved = {"centroids", "codes", "scales", "ids", "offsets", "dtype"}
+        metadata = {k: data[k] for k in data.files if k not in reserved}
+        return index, metadata
+
+
+# ================================
+# 查询 / 近重复检测 / 基准测试
+# ================================
+@torch.no_grad()
+def embed_images(model, image_paths, device="cpu"):
+    """对任意图片文件提取归一化特征"""
+    batch = torch.stack([eval_transforms(Image.open(p).convert("RGB")) for p in image_paths])
+    return nn.functional.normalize(model(batch.to(device)), dim=1).cpu().numpy()
+
+
+def find_near_duplicates(index, threshold=0.97, k=5, nprobe=8, batch=1024):
+    """返回相似度不低于阈值的无序对 [(i, j, score)]，i < j"""
+    pairs = set()
+    result = []
+    for start in tqdm(range(0, index.ntotal, batch), desc="近重复检测"):
+        ids = np.arange(start, min(start + batch, index.ntotal))
+        scores, neighbors = index.search(index.reconstruct(ids), k + 1, nprobe)
+        for qi, i in enumerate(ids):
+            for s, j in zip(scores[qi], neighbors[qi]):
+                if j < 0 or j == i or s < threshold:
+                    continue
+                key = (min(i, j), max(i, j))
+                if key not in pairs:
+                    pairs.add(key)
+                    result.append((int(key[0]), int(key[1]), float(s)))
+    return sorted(result, key=lambda t: -t[2])
+
+
+def benchmark(index, num_queries=1000, k=10, nprobes=(1, 4, 8, 16, 32), seed=SEED):
+    """以库内随机向量作为查询，对比 IVF 与暴力搜索的 Recall@k 和 QPS"""
+    rng = np.random.default_rng(seed)
+    ids = rng.choice(index.ntotal, min(num_queries, index.ntotal), replace=False)
+    queries = index.reconstruct(ids)
+
+    t0 = time.perf_counter()
+    _, truth = index.search_exact(queries, k)
+    exact_time = time.perf_counter() - t0
+    # 两者都是批量查询：暴力搜索为整块矩阵乘法，IVF 按倒排表分组做矩阵乘法
+    print(f"\n批量查询 {len(queries)} 条（暴力搜索与 IVF 均为批量矩阵乘法）")
+    print(f"{'方法':<12}{'Recall@' + str(k):>12}{'QPS':>12}")
+    print(f"{'brute-force':<12}{1.0:>12.4f}{len(queries) / exact_time:>12.1f}")
+
+    results = []
+    for nprobe in nprobes:
+        if nprobe > index.nlist:
+            continue
+        t0 = time.perf_counter()
+        _, found = index.search(queries, k, nprobe)
+        elapsed = time.perf_counter() - t0
+        recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+        qps = len(queries) / elapsed
+        results.append((nprobe, recall, qps))
+        print(f"{'nprobe=' + str(nprobe):<12}{recall:>12.4f}{qps:>12.1f}")
+    return exact_time, results
+
+
+# ================================
+# 命令行入口
+# ================================
+def main():
+    parser = argparse.ArgumentParser(description="CNN 特征相似检索与近重复检测")
+    parser.add_argument("--index", default=INDEX_PATH, help="索引文件路径")
+    parser.add_argument("--model", default=MODEL_PATH, help="训练好的模型权重")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_build = sub.add_parser("build", help="提取特征并建立索引")
+    p_build.add_argument("--data_dir", default=DATA_DIR)
+    p_build.add_argument("--dtype", default="int8", choices=["int8", "float16"])
+    p_build.add_argument("--nlist", type=int, default=None, help="倒排表数量，默认 4*sqrt(N)")
+
+    p_query = sub.add_parser("query", help="查询相似图像")
+    p_query.add_argument("images", nargs="+")
+    p_query.add_argument("--k", type=int, default=5)
+    p_query.add_argument("--nprobe", type=int, default=8)
+
+    p_dups = sub.add_parser("dups", help="近重复检测")
+    p_dups.add_argument("--threshold", type=float, default=0.97)
+    p_dups.add_argument("--nprobe", type=int, default=8)
+
+    p_bench = sub.add_parser("bench", help="召回率与 QPS 基准测试")
+    p_bench.add_argument("--queries", type=int, default=1000)
+    p_bench.add_argument("--k", type=int, default=10)
+
+    args = parser.parse_args()
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+    if args.command == "build":
+        model = build_feature_extractor(args.model, device=device)
+        feats, paths, splits, labels = extract_split_embeddings(model, args.data_dir, device=device)
+        index = IVFIndex.build(feats, nlist=args.nlist, dtype=args.dtype)
+        index.save(args.index, paths=paths, splits=splits, labels=labels)
+        print(f"✅ 索引已保存: {args.index}（{index.ntotal} 条，{index.nlist} 个倒排表，"
+              f"{index.codes.nbytes / 2**20:.1f} MiB {args.dtype}）")
+        return
+
+    index, meta = IVFIndex.load(args.index)
+
+    if args.command == "query":
+        model = build_feature_extractor(args.model, device=device)
+        scores, ids = index.search(embed_images(model, args.images, device), args.k, args.nprobe)
+        for img, row_s, row_i in zip(args.images, scores, ids):
+            print(f"\n🔍 {img}")
+            for s, i in zip(row_s, row_i):
+                if i >= 0:
+                    print(f"  {s:.4f}  {meta['paths'][i]}")
+    elif args.command == "dups":
+        pairs = find_near_duplicates(index, args.threshold, nprobe=args.nprobe)
+        splits = meta["splits"]
+        cross = [p for p in pairs if splits[p[0]] != splits[p[1]]]
+        print(f"\n共发现 {len(pairs)} 对近重复，其中跨划分 {len(cross)} 对（可能造成数据泄漏）")
+        for i, j, s in cross:
+            print(f"  {s:.4f}  {meta['paths'][i]}  <->  {meta['paths'][j]}")
+    elif args.command == "bench":
+        benchmark(index, args.queries, args.k)
+
+
+if __name__ == "__main__":
+    main()
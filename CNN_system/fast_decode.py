@@ -0,0 +1,134 @@
+"""
+降分辨率 JPEG 解码
+Animals-10 中许多图像远大于 224px，完整解码后又被 Resize((224, 224)) 丢弃大部分像素。
+这里利用 JPEG 解码器在 DCT 域按 1/2、1/4、1/8 缩放的能力（PIL draft 模式），
+直接解码到不小于目标尺寸的最小尺度，再交给后续 transforms 处理；非 JPEG 图像按原方式解码
+
+用法:
+    python fast_decode.py --data_dir split_dataset/test --model best_resnet50.pth
+"""
+
+import io
+import os
+import time
+import argparse
+import functools
+
+import torch
+from PIL import Image
+from torch.utils.data import DataLoader
+from torchvision import datasets, transforms
+from torchvision.datasets.folder import default_loader
+
+from model_utils import IMAGENET_MEAN, IMAGENET_STD, load_resnet50
+from zip_dataset import pil_bytes_loader
+
+TARGET_SIZE = (224, 224)
+# 全项目统一的解码开关（训练 / 测试 / 级联 / 对比 / 调优 / 超参数搜索共用）
+# 默认完整解码，与已发布的 best_resnet50.pth 训练时一致；开启前先用本脚本评估准确率影响，且训练与评估需一致
+FAST_JPEG_DECODE = False
+
+
+def draft_open(fp, target_size=TARGET_SIZE):
+    """打开图像；若为 JPEG，则按不小于 target_size 的最小 DCT 缩放比例解码"""
+    img = Image.open(fp)
+    if img.format == "JPEG":
+        img.draft("RGB", target_size)
+    return img.convert("RGB")
+
+
+def draft_loader(path, target_size=TARGET_SIZE):
+    """可直接传给 ImageFolder / ManifestDataset 的 loader"""
+    with open(path, "rb") as f:
+        return draft_open(f, target_size)
+
+
+def draft_bytes_loader(data, target_size=TARGET_SIZE):
+    """可直接传给 ZipImageFolder / ShardDataset 的 loader（输入为编码字节）"""
+    return draft_open(io.BytesIO(data), target_size)
+
+
+def make_loaders(target_size=TARGET_SIZE):
+    """返回 (路径 loader, 字节 loader)，可被 DataLoader worker 序列化"""
+    return (functools.partial(draft_loader, target_size=target_size),
+            functools.partial(draft_bytes_loader, target_size=target_size))
+
+
+def select_loaders(fast=FAST_JPEG_DECODE, target_size=TARGET_SIZE):
+    """按解码开关返回 (路径 loader, 字节 loader)：draft 降分辨率解码或 PIL 完整解码"""
+    return make_loaders(target_size) if fast else (default_loader, pil_bytes_loader)
+
+
+# ================================
+# 基准：解码耗时与准确率影响
+# ================================
+def benchmark_decode(paths, loader, resize=transforms.Resize(TARGET_SIZE)):
+    """返回平均每张图像的 解码 + Resize 耗时（毫秒）"""
+    start = time.perf_counter()
+    for path in paths:
+        resize(loader(path))
+    return (time.perf_counter() - start) * 1000 / max(len(paths), 1)
+
+
+@torch.no_grad()
+def predict(model, dataset, batch_size, device, num_workers=4):
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers)
+    preds, labels = [], []
+    for images, targets in loader:
+        preds.append(model(images.to(device)).argmax(1).cpu())
+        labels.append(targets)
+    return torch.cat(preds), torch.cat(labels)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="降分辨率 JPEG 解码：耗时与准确率对比")
+    parser.add_argument("--data_dir", default="split_dataset/test")
+    parser.add_argument("--model", default="best_resnet50.pth", help="为空则只测解码耗时")
+    parser.add_argument("--num_images", type=int, default=500, help="解码测速使用的图像数")
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--report", default="decode_report.txt")
+    args = parser.parse_args()
+
+    tf = transforms.Compose([
+        transforms.Resize(TARGET_SIZE),
+        transforms.ToTensor(),
+        transforms.Normalize(IMAGENET_MEAN, IMAGENET_STD)
+    ])
+    default_ds = datasets.ImageFolder(args.data_dir, transform=tf)
+    draft_ds = datasets.ImageFolder(args.data_dir, transform=tf, loader=draft_loader)
+    paths = [p for p, _ in default_ds.samples[:args.num_images]]
+
+    # 预热文件缓存，避免首次读盘计入解码耗时
+    for p in paths:
+        with open(p, "rb") as f:
+            f.read()
+    t_default = benchmark_decode(paths, default_loader)
+    t_draft = benchmark_decode(paths, draft_loader)
+    lines = [
+        f"decode+resize default: {t_default:.2f} ms/img",
+        f"decode+resize draft:   {t_draft:.2f} ms/img  ({t_default / t_draft:.2f}x)",
+    ]
+
+    if args.model and os.path.exists(args.model):
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        model = load_resnet50(args.model, len(default_ds.classes), device)
+        p_default, labels = predict(model, default_ds, args.batch_size, device)
+        p_draft, _ = predict(model, draft_ds, args.batch_size, device)
+        acc_default = p_default.eq(labels).float().mean().item() * 100
+        acc_draft = p_draft.eq(labels).float().mean().item() * 100
+        agree = p_default.eq(p_draft).float().mean().item() * 100
+        lines += [
+            f"accuracy default: {acc_default:.2f}%",
+            f"accuracy draft:   {acc_draft:.2f}%  (delta {acc_draft - acc_default:+.2f} pts)",
+            f"prediction agreement: {agree:.2f}%",
+        ]
+
+    report = "\n".join(lines)
+    print(report)
+    with open(args.report, "w", encoding="utf-8") as f:
+        f.write(report + "\n")
+    print(f"✅ 解码对比报告已保存为: {args.report}")
+
+
+if __name__ == "__main__":
+    main()
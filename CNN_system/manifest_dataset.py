@@ -0,0 +1,40 @@
+"""
+清单数据集
+读取 Data/prepare_data.py --manifest 生成的划分清单，直接从 raw-img 加载图像，
+接口与 torchvision ImageFolder 一致（classes / class_to_idx / samples / targets）
+"""
+
+import json
+import os
+
+from torch.utils.data import Dataset
+from torchvision.datasets.folder import default_loader
+
+
+class ManifestDataset(Dataset):
+    """按清单中某一划分（train / val / test）读取原始图像"""
+
+    def __init__(self, manifest_path, split, transform=None, loader=default_loader):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if split not in manifest["splits"]:
+            raise KeyError(f"清单中不存在划分: {split}")
+
+        self.root = os.path.join(os.path.dirname(os.path.abspath(manifest_path)), manifest["root"])
+        self.classes = manifest["classes"]
+        self.class_to_idx = {cls: i for i, cls in enumerate(self.classes)}
+        self.samples = [(os.path.join(self.root, rel), label) for rel, label in manifest["splits"][split]]
+        self.targets = [label for _, label in self.samples]
+        self.imgs = self.samples
+        self.transform = transform
+        self.loader = loader
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, idx):
+        path, target = self.samples[idx]
+        image = self.loader(path)
+        if self.transform is not None:
+            image = self.transform(image)
+        return image, target
@@ -0,0 +1,63 @@
+"""
+模型与预处理公共工具
+供索引、蒸馏、剪枝等辅助脚本复用 ResNet50 结构与测试时预处理
+"""
+
+import torch
+import torch.nn as nn
+from torchvision import models, transforms
+
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+# 与 test_model.py / 验证集一致的预处理
+eval_transforms = transforms.Compose([
+    transforms.Resize((224, 224)),
+    transforms.ToTensor(),
+    transforms.Normalize(IMAGENET_MEAN, IMAGENET_STD)
+])
+
+
+def build_resnet50(num_classes, pretrained=False):
+    """构建分类头替换为 num_classes 的 ResNet50"""
+    weights = models.ResNet50_Weights.IMAGENET1K_V2 if pretrained else None
+    model = models.resnet50(weights=weights)
+    model.fc = nn.Linear(model.fc.in_features, num_classes)
+    return model
+
+
+def resize_bottleneck(block, mid1, mid2):
+    """按给定中间通道数重建 Bottleneck 的 conv1/bn1/conv2/bn2/conv3（输入输出通道不变）"""
+    conv1, conv2, conv3 = block.conv1, block.conv2, block.conv3
+    block.conv1 = nn.Conv2d(conv1.in_channels, mid1, 1, bias=False)
+    block.bn1 = nn.BatchNorm2d(mid1)
+    block.conv2 = nn.Conv2d(mid1, mid2, 3, stride=conv2.stride, padding=conv2.padding,
+                            dilation=conv2.dilation, bias=False)
+    block.bn2 = nn.BatchNorm2d(mid2)
+    block.conv3 = nn.Conv2d(mid2, conv3.out_channels, 1, bias=False)
+    return block
+
+
+def build_resnet50_from_state_dict(state_dict):
+    """根据权重形状构建 ResNet50，兼容通道剪枝后的瘦身模型"""
+    model = build_resnet50(state_dict["fc.weight"].shape[0])
+    for layer_name in ("layer1", "layer2", "layer3", "layer4"):
+        for i, block in enumerate(getattr(model, layer_name)):
+            prefix = f"{layer_name}.{i}"
+            mid1 = state_dict[f"{prefix}.conv1.weight"].shape[0]
+            mid2 = state_dict[f"{prefix}.conv2.weight"].shape[0]
+            if (mid1, mid2) != (block.conv1.out_channels, block.conv2.out_channels):
+                resize_bottleneck(block, mid1, mid2)
+    return model
+
+
+def load_resnet50(model_path, num_classes, device):
+    """加载训练保存的 ResNet50 权重（含剪枝模型）并切换到推理模式"""
+    state_dict = torch.load(model_path, map_location=device)
+    model = build_resnet50_from_state_dict(state_dict)
+    if model.fc.out_features != num_classes:
+        raise ValueError(f"模型类别数 {model.fc.out_features} 与数据集类别数 {num_classes} 不一致")
+    model.load_state_dict(state_dict)
+    model = model.to(device)
+    model.eval()
+    return model
@@ -0,0 +1,204 @@
+"""
+ResNet50 结构化通道剪枝
+对每个 Bottleneck 的中间通道（conv1 / conv2 输出）按 BN 缩放因子或卷积核 L1 范数排序，
+物理删除低重要性通道，得到仍然稠密的瘦身模型；随后在训练集上短暂微调并导出，
+导出的权重可直接被 test_model.py 加载（model_utils.load_resnet50 按权重形状建模）
+
+输出各剪枝率下的 FLOPs、参数量、CPU 延迟与准确率对比
+"""
+
+import copy
+import os
+import time
+
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader
+from torchvision import datasets, transforms
+from torchvision.models.resnet import Bottleneck
+from tqdm import tqdm
+
+from model_utils import IMAGENET_MEAN, IMAGENET_STD, eval_transforms, load_resnet50, resize_bottleneck
+
+# ================================
+# 1️⃣ 基本配置
+# ================================
+data_dir = "split_dataset"
+model_path = "best_resnet50.pth"
+num_classes = 10
+sparsity_levels = (0.25, 0.5, 0.7)   # 每个 Bottleneck 中间通道的剪除比例
+criterion_name = "bn"                # bn: |BN gamma|；l1: 卷积核 L1 范数
+finetune_epochs = 1
+finetune_lr = 1e-4
+batch_size = 8
+report_path = "pruning_report.txt"
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+train_transforms = transforms.Compose([
+    transforms.Resize((224, 224)),
+    transforms.RandomHorizontalFlip(),
+    transforms.RandomRotation(15),
+    transforms.ToTensor(),
+    transforms.Normalize(IMAGENET_MEAN, IMAGENET_STD)
+])
+
+
+# ================================
+# 2️⃣ 通道重要性与剪枝
+# ================================
+def channel_importance(conv, bn, criterion="bn"):
+    """返回每个输出通道的重要性分数"""
+    if criterion == "bn":
+        return bn.weight.detach().abs()
+    if criterion == "l1":
+        return conv.weight.detach().abs().sum(dim=(1, 2, 3))
+    raise ValueError(f"不支持的剪枝准则: {criterion}")
+
+
+def _keep_indices(scores, ratio):
+    n_keep = max(1, int(round(len(scores) * (1 - ratio))))
+    return torch.sort(torch.topk(scores, n_keep).indices).values
+
+
+def _copy_bn(dst, src, idx):
+    dst.weight.data.copy_(src.weight.data[idx])
+    dst.bias.data.copy_(src.bias.data[idx])
+    dst.running_mean.copy_(src.running_mean[idx])
+    dst.running_var.copy_(src.running_var[idx])
+
+
+@torch.no_grad()
+def prune_bottleneck(block, ratio, criterion="bn"):
+    """剪除 Bottleneck 中间通道；块的输入/输出通道不变，残差连接无需改动"""
+    keep1 = _keep_indices(channel_importance(block.conv1, block.bn1, criterion), ratio)
+    keep2 = _keep_indices(channel_importance(block.conv2, block.bn2, criterion), ratio)
+    old = copy.deepcopy(block)
+    resize_bottleneck(block, len(keep1), len(keep2))
+
+    block.conv1.weight.copy_(old.conv1.weight[keep1])
+    _copy_bn(block.bn1, old.bn1, keep1)
+    block.conv2.weight.copy_(old.conv2.weight[keep2][:, keep1])
+    _copy_bn(block.bn2, old.bn2, keep2)
+    block.conv3.weight.copy_(old.conv3.weight[:, keep2])
+    return block
+
+
+def prune_resnet(model, ratio, criterion="bn"):
+    """返回剪枝后的模型副本"""
+    pruned = copy.deepcopy(model).cpu()
+    for module in pruned.modules():
+        if isinstance(module, Bottleneck):
+            prune_bottleneck(module, ratio, criterion)
+    # 新建的层默认处于训练模式，需与原模型保持一致
+    return pruned.train(model.training)
+
+
+# ================================
+# 3️⃣ 统计：FLOPs / 参数量 / 延迟 / 准确率
+# ================================
+@torch.no_grad()
+def count_flops(model, input_size=(1, 3, 224, 224)):
+    """统计单张图像前向的 FLOPs（乘加按 2 次计），仅计入卷积与全连接层"""
+    total = [0]
+
+    def conv_hook(m, inp, out):
+        kh, kw = m.kernel_size
+        total[0] += 2 * out.numel() * (m.in_channels // m.groups) * kh * kw
+
+    def linear_hook(m, inp, out):
+        total[0] += 2 * out.numel() * m.in_features
+
+    handles = []
+    for m in model.modules():
+        if isinstance(m, nn.Conv2d):
+            handles.append(m.register_forward_hook(conv_hook))
+        elif isinstance(m, nn.Linear):
+            handles.append(m.register_forward_hook(linear_hook))
+    model.eval()
+    model(torch.zeros(input_size, device=next(model.parameters()).device))
+    for h in handles:
+        h.remove()
+    return total[0]
+
+
+def count_parameters(model):
+    return sum(p.numel() for p in model.parameters())
+
+
+@torch.no_grad()
+def measure_latency(model, iters=30, warmup=5):
+    """CPU 单张图像推理延迟中位数（毫秒）"""
+    model = model.to("cpu").eval()
+    x = torch.randn(1, 3, 224, 224)
+    for _ in range(warmup):
+        model(x)
+    times = []
+    for _ in range(iters):
+        start = time.perf_counter()
+        model(x)
+        times.append((time.perf_counter() - start) * 1000)
+    return sorted(times)[len(times) // 2]
+
+
+@torch.no_grad()
+def evaluate(model, loader):
+    model = model.to(device).eval()
+    correct, total = 0, 0
+    for images, labels in loader:
+        outputs = model(images.to(device))
+        correct += outputs.argmax(1).cpu().eq(labels).sum().item()
+        total += labels.size(0)
+    return 100 * correct / total
+
+
+def finetune(model, loader, epochs=finetune_epochs, lr=finetune_lr):
+    """剪枝后在训练集上短暂微调以恢复精度"""
+    model = model.to(device)
+    criterion = nn.CrossEntropyLoss()
+    optimizer = torch.optim.Adam(model.parameters(), lr=lr)
+    for epoch in range(epochs):
+        model.train()
+        for images, labels in tqdm(loader, desc=f"Fine-tune {epoch+1}/{epochs}"):
+            images, labels = images.to(device), labels.to(device)
+            optimizer.zero_grad()
+            loss = criterion(model(images), labels)
+            loss.backward()
+            optimizer.step()
+    return model
+
+
+# ================================
+# 4️⃣ 剪枝流水线
+# ================================
+def main():
+    train_dataset = datasets.ImageFolder(os.path.join(data_dir, "train"), transform=train_transforms)
+    test_dataset = datasets.ImageFolder(os.path.join(data_dir, "test"), transform=eval_transforms)
+    train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True, num_workers=4)
+    test_loader = DataLoader(test_dataset, batch_size=batch_size, shuffle=False, num_workers=4)
+
+    base = load_resnet50(model_path, num_classes, device)
+    rows = [("baseline", base)]
+    for ratio in sparsity_levels:
+        print(f"\n✂️ 剪枝率 {ratio:.0%}（准则: {criterion_name}）")
+        pruned = finetune(prune_resnet(base, ratio, criterion_name), train_loader)
+        out_path = f"pruned_resnet50_s{int(ratio * 100)}.pth"
+        torch.save(pruned.state_dict(), out_path)
+        print(f"✅ 已导出: {out_path}")
+        rows.append((f"sparsity {ratio:.0%}", pruned))
+
+    lines = [f"{'model':<16}{'GFLOPs':>10}{'params(M)':>12}{'latency(ms)':>14}{'test acc(%)':>14}"]
+    for name, model in rows:
+        flops = count_flops(model.to(device)) / 1e9
+        params = count_parameters(model) / 1e6
+        acc = evaluate(model, test_loader)
+        latency = measure_latency(model)
+        lines.append(f"{name:<16}{flops:>10.2f}{params:>12.2f}{latency:>14.1f}{acc:>14.2f}")
+    report = "\n".join(lines)
+    print("\n" + report)
+    with open(report_path, "w", encoding="utf-8") as f:
+        f.write(report + "\n")
+    print(f"✅ 剪枝报告已保存为: {report_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+顺序分片归档数据集
+把每个划分打包成少量大 tar 分片（编码后的图像 + 标签），训练时顺序流式读取，
+避免在网络文件系统上随机访问大量小 JPEG
+
+分片内成员按样本成对存放：<key>.<ext>（原始图像字节）与 <key>.cls（标签）
+ShardDataset 按 rank / DataLoader worker 切分分片，并用有界内存的洗牌缓冲区近似全局打乱
+
+用法:
+    python shard_dataset.py pack --data_dir split_dataset --out_dir shards
+    python shard_dataset.py bench --data_dir split_dataset --out_dir shards --split train
+"""
+
+import io
+import os
+import math
+import json
+import time
+import random
+import tarfile
+import argparse
+
+import torch.distributed as dist
+from torch.utils.data import DataLoader, IterableDataset, get_worker_info
+from torchvision import datasets, transforms
+
+from zip_dataset import pil_bytes_loader
+
+SHARD_SIZE_MB = 64
+MIN_SHARDS = 16  # 每个划分至少的分片数：num_workers(4) × world_size(1) × 4，保证每个 worker 都分到多个分片
+SHUFFLE_BUFFER = 2000
+SEED = 42
+
+
+# ================================
+# 打包
+# ================================
+def _add_bytes(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = 0
+    tar.addfile(info, io.BytesIO(data))
+
+
+def pack_samples(samples, classes, out_dir, split, shard_size_mb=SHARD_SIZE_MB, seed=SEED,
+                 min_shards=MIN_SHARDS):
+    """
+    把 [(图像路径, 标签), ...] 写成若干 tar 分片，并生成 <split>-index.json
+    打包前先打乱一次，使每个分片内类别混合
+    分片数取 max(总字节数 / shard_size_mb, min_shards)（不超过样本数），样本按数量均分到各分片
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    samples = list(samples)
+    random.Random(seed).shuffle(samples)
+    total_bytes = sum(os.path.getsize(path) for path, _ in samples)
+    num_shards = max(math.ceil(total_bytes / (shard_size_mb * 1024 * 1024)), min_shards)
+    num_shards = max(min(num_shards, len(samples)), 1)
+
+    shards = []
+    for s in range(num_shards):
+        begin, end = len(samples) * s // num_shards, len(samples) * (s + 1) // num_shards
+        name = f"{split}-{s:05d}.tar"
+        with tarfile.open(os.path.join(out_dir, name), "w") as tar:
+            for i in range(begin, end):
+                path, label = samples[i]
+                with open(path, "rb") as f:
+                    data = f.read()
+                key = f"{i:08d}"
+                ext = os.path.splitext(path)[1].lower().lstrip(".") or "jpg"
+                _add_bytes(tar, f"{key}.{ext}", data)
+                _add_bytes(tar, f"{key}.cls", str(label).encode())
+        shards.append({"name": name, "count": end - begin})
+
+    index = {"split": split, "classes": classes, "total": len(samples), "shards": shards}
+    with open(os.path.join(out_dir, f"{split}-index.json"), "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=1)
+    print(f"✅ [{split}] {len(samples)} 张 -> {len(shards)} 个分片: {out_dir}")
+    return index
+
+
+def pack_split(data_dir, out_dir, split, shard_size_mb=SHARD_SIZE_MB, seed=SEED, min_shards=MIN_SHARDS):
+    """打包 split_dataset/<split> 目录（ImageFolder 布局）"""
+    folder = datasets.ImageFolder(os.path.join(data_dir, split))
+    return pack_samples(folder.samples, folder.classes, out_dir, split, shard_size_mb, seed, min_shards)
+
+
+# ================================
+# 流式读取
+# ================================
+def iter_tar_samples(path):
+    """顺序读取一个分片，产出 (图像字节, 标签)"""
+    pending = {}
+    with tarfile.open(path, "r|") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            key, ext = os.path.splitext(member.name)
+            data = tar.extractfile(member).read()
+            sample = pending.setdefault(key, {})
+            sample["cls" if ext == ".cls" else "image"] = data
+            if len(sample) == 2:
+                del pending[key]
+                yield sample["image"], int(sample["cls"])
+
+
+def shuffle_buffer(iterator, size, rng):
+    """有界洗牌缓冲区：缓冲区满后随机取出一个样本并用新样本替换；size <= 0 时不打乱"""
+    if size <= 0:
+        yield from iterator
+        return
+    buffer = []
+    for item in iterator:
+        if len(buffer) < size:
+            buffer.append(item)
+            continue
+        idx = rng.randrange(size)
+        yield buffer[idx]
+        buffer[idx] = item
+    rng.shuffle(buffer)
+    yield from buffer
+
+
+def _rank_and_world():
+    if dist.is_available() and dist.is_initialized():
+        return dist.get_rank(), dist.get_world_size()
+    return 0, 1
+
+
+class ShardDataset(IterableDataset):
+    """
+    按分片顺序流式读取某一划分
+    分片先在 rank 之间轮流分配，再在该 rank 的 DataLoader worker 之间轮流分配；
+    分片数应不少于 world_size × num_workers，否则部分 worker 空闲（打包时默认至少 MIN_SHARDS 个）
+    每个 epoch 前调用 set_epoch(epoch) 以改变分片顺序与洗牌种子
+    """
+
+    def __init__(self, shard_dir, split, transform=None, shuffle=True,
+                 buffer_size=SHUFFLE_BUFFER, seed=SEED, loader=pil_bytes_loader):
+        with open(os.path.join(shard_dir, f"{split}-index.json"), encoding="utf-8") as f:
+            index = json.load(f)
+        self.shard_paths = [os.path.join(shard_dir, s["name"]) for s in index["shards"]]
+        self.shard_counts = [s["count"] for s in index["shards"]]
+        self.classes = index["classes"]
+        self.class_to_idx = {cls: i for i, cls in enumerate(self.classes)}
+        self.total = index["total"]
+        self.transform = transform
+        self.shuffle = shuffle
+        self.buffer_size = buffer_size
+        self.seed = seed
+        self.loader = loader
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _assigned_shards(self):
+        """返回 (当前进程读取的分片, 洗牌种子槽位)；在主进程中调用时返回整个 rank 的分片"""
+        rank, world = _rank_and_world()
+        worker = get_worker_info()
+        worker_id, num_workers = (worker.id, worker.num_workers) if worker else (0, 1)
+        order = list(range(len(self.shard_paths)))
+        if self.shuffle:
+            random.Random(self.seed + self.epoch).shuffle(order)
+        return order[rank::world][worker_id::num_workers], rank * num_workers + worker_id
+
+    def __iter__(self):
+        shards, slot = self._assigned_shards()
+        samples = (s for i in shards for s in iter_tar_samples(self.shard_paths[i]))
+        if self.shuffle:
+            rng = random.Random((self.seed + self.epoch) * 100003 + slot)
+            samples = shuffle_buffer(samples, self.buffer_size, rng)
+        for data, label in samples:
+            image = self.loader(data)
+            if self.transform is not None:
+                image = self.transform(image)
+            yield image, label
+
+    def __len__(self):
+        # 与实际产出的样本数一致：worker 内为该 worker 的分片样本数，主进程中为本 rank 全部 worker 之和
+        shards, _ = self._assigned_shards()
+        return sum(self.shard_counts[i] for i in shards)
+
+
+# ================================
+# I/O 吞吐基准
+# ================================
+def _raw_file_throughput(samples, max_items):
+    order = list(range(len(samples)))
+    random.Random(SEED).shuffle(order)
+    n_bytes, start = 0, time.perf_counter()
+    for i in order[:max_items]:
+        with open(samples[i][0], "rb") as f:
+            n_bytes += len(f.read())
+    return min(max_items, len(order)), n_bytes, time.perf_counter() - start
+
+
+def _raw_shard_throughput(shard_paths, max_items):
+    n, n_bytes, start = 0, 0, time.perf_counter()
+    for path in shard_paths:
+        for data, _ in iter_tar_samples(path):
+            n += 1
+            n_bytes += len(data)
+            if n >= max_items:
+                return n, n_bytes, time.perf_counter() - start
+    return n, n_bytes, time.perf_counter() - start
+
+
+def _loader_throughput(loader, max_items):
+    n, start = 0, time.perf_counter()
+    for images, _ in loader:
+        n += images.size(0)
+        if n >= max_items:
+            break
+    return n, time.perf_counter() - start
+
+
+def benchmark(data_dir, shard_dir, split="train", num_workers=4, batch_size=32, max_items=5000):
+    """对比 ImageFolder 随机读取与分片顺序读取：原始字节吞吐与完整解码流水线吞吐"""
+    tf = transforms.Compose([transforms.Resize((224, 224)), transforms.ToTensor()])
+    folder = datasets.ImageFolder(os.path.join(data_dir, split), transform=tf)
+    shards = ShardDataset(shard_dir, split, transform=tf)
+
+    print(f"{'方式':<28}{'images/s':>12}{'MB/s':>10}")
+    n, n_bytes, t = _raw_file_throughput(folder.samples, max_items)
+    print(f"{'ImageFolder 原始读取':<28}{n / t:>12.1f}{n_bytes / t / 2**20:>10.1f}")
+    n, n_bytes, t = _raw_shard_throughput(shards.shard_paths, max_items)
+    print(f"{'Shard 原始读取':<28}{n / t:>12.1f}{n_bytes / t / 2**20:>10.1f}")
+
+    n, t = _loader_throughput(DataLoader(folder, batch_size=batch_size, shuffle=True,
+                                         num_workers=num_workers), max_items)
+    print(f"{'ImageFolder DataLoader':<28}{n / t:>12.1f}{'-':>10}")
+    n, t = _loader_throughput(DataLoader(shards, batch_size=batch_size,
+                                         num_workers=num_workers), max_items)
+    print(f"{'Shard DataLoader':<28}{n / t:>12.1f}{'-':>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分片归档打包与 I/O 基准")
+    parser.add_argument("command", choices=["pack", "bench"])
+    parser.add_argument("--data_dir", default="split_dataset")
+    parser.add_argument("--out_dir", default="shards")
+    parser.add_argument("--split", default=None, help="只处理某一划分（默认 train/val/test）")
+    parser.add_argument("--shard_size_mb", type=int, default=SHARD_SIZE_MB)
+    parser.add_argument("--min_shards", type=int, default=MIN_SHARDS,
+                        help="每个划分至少的分片数（建议 ≥ num_workers × world_size × 4）")
+    parser.add_argument("--num_workers", type=int, default=4)
+    parser.add_argument("--max_items", type=int, default=5000)
+    args = parser.parse_args()
+
+    splits = [args.split] if args.split else ["train", "val", "test"]
+    if args.command == "pack":
+        for split in splits:
+            pack_split(args.data_dir, args.out_dir, split, args.shard_size_mb, min_shards=args.min_shards)
+    else:
+        benchmark(args.data_dir, args.out_dir, splits[0], args.num_workers, max_items=args.max_items)
+
+
+if __name__ == "__main__":
+    main()
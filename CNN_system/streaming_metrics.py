@@ -0,0 +1,112 @@
+"""
+流式评估指标模块
+按批次增量累积混淆矩阵、Top-k 命中数，并把原始 logits / 标签写入内存映射文件，
+便于离线分析阈值与校准，无需重新跑模型
+"""
+
+import numpy as np
+
+
+class StreamingMetrics:
+    """按批次增量更新的分类指标累加器"""
+
+    def __init__(self, num_classes, num_samples=None, topk=(1, 5),
+                 logits_path=None, labels_path=None):
+        self.num_classes = num_classes
+        self.topk = tuple(k for k in topk if k <= num_classes)
+        self.confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+        self.topk_correct = {k: 0 for k in self.topk}
+        self.count = 0
+
+        # 预分配内存映射文件（.npy 格式，可直接 np.load(..., mmap_mode="r") 读取）
+        self.logits_mm = None
+        self.labels_mm = None
+        if logits_path is not None:
+            if num_samples is None:
+                raise ValueError("导出 logits 时必须指定 num_samples")
+            self.logits_mm = np.lib.format.open_memmap(
+                logits_path, mode="w+", dtype=np.float32, shape=(num_samples, num_classes))
+            if labels_path is not None:
+                self.labels_mm = np.lib.format.open_memmap(
+                    labels_path, mode="w+", dtype=np.int64, shape=(num_samples,))
+
+    def update(self, logits, labels):
+        """累积一个批次的 logits（N×C）与真实标签（N）"""
+        logits = np.asarray(logits, dtype=np.float32)
+        labels = np.asarray(labels, dtype=np.int64)
+        n = labels.shape[0]
+
+        preds = logits.argmax(axis=1)
+        # 原地累加混淆矩阵：行=真实类别，列=预测类别
+        flat = labels * self.num_classes + preds
+        self.confusion += np.bincount(flat, minlength=self.num_classes ** 2).reshape(
+            self.num_classes, self.num_classes)
+
+        if self.topk:
+            max_k = max(self.topk)
+            top = np.argpartition(-logits, max_k - 1, axis=1)[:, :max_k]
+            # argpartition 不保证顺序，需按分数排序后再截取前 k 个
+            order = np.take_along_axis(logits, top, axis=1).argsort(axis=1)[:, ::-1]
+            top = np.take_along_axis(top, order, axis=1)
+            hits = top == labels[:, None]
+            for k in self.topk:
+                self.topk_correct[k] += int(hits[:, :k].any(axis=1).sum())
+
+        if self.logits_mm is not None:
+            self.logits_mm[self.count:self.count + n] = logits
+            if self.labels_mm is not None:
+                self.labels_mm[self.count:self.count + n] = labels
+
+        self.count += n
+
+    def accuracy(self):
+        """总体准确率"""
+        return np.trace(self.confusion) / max(self.count, 1)
+
+    def topk_accuracy(self):
+        """返回 {k: Top-k 准确率}"""
+        return {k: c / max(self.count, 1) for k, c in self.topk_correct.items()}
+
+    def precision_recall_f1(self):
+        """逐类精确率、召回率、F1 与样本数"""
+        tp = np.diag(self.confusion).astype(np.float64)
+        pred_total = self.confusion.sum(axis=0)
+        support = self.confusion.sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            precision = np.where(pred_total > 0, tp / pred_total, 0.0)
+            recall = np.where(support > 0, tp / support, 0.0)
+            f1 = np.where(precision + recall > 0,
+                          2 * precision * recall / (precision + recall), 0.0)
+        return precision, recall, f1, support
+
+    def report(self, class_names, digits=2):
+        """生成与 sklearn classification_report 相同排版的文本报告"""
+        precision, recall, f1, support = self.precision_recall_f1()
+        total = support.sum()
+        width = max(max(len(c) for c in class_names), len("weighted avg"), digits)
+        headers = ["precision", "recall", "f1-score", "support"]
+        lines = [" " * width + " " + "".join(f"{h:>10}" for h in headers), ""]
+
+        row_fmt = "{:>{width}s} " + " {:>9.{digits}f}" * 3 + " {:>9}"
+        for i, name in enumerate(class_names):
+            lines.append(row_fmt.format(name, precision[i], recall[i], f1[i], int(support[i]),
+                                        width=width, digits=digits))
+        lines.append("")
+
+        acc_fmt = "{:>{width}s} " + " {:>9}" * 2 + " {:>9.{digits}f}" + " {:>9}"
+        lines.append(acc_fmt.format("accuracy", "", "", self.accuracy(), int(total),
+                                    width=width, digits=digits))
+        lines.append(row_fmt.format("macro avg", precision.mean(), recall.mean(), f1.mean(),
+                                    int(total), width=width, digits=digits))
+        weights = support / max(total, 1)
+        lines.append(row_fmt.format("weighted avg", (precision * weights).sum(),
+                                    (recall * weights).sum(), (f1 * weights).sum(),
+                                    int(total), width=width, digits=digits))
+        return "\n".join(lines) + "\n"
+
+    def flush(self):
+        """把内存映射数据落盘"""
+        if self.logits_mm is not None:
+            self.logits_mm.flush()
+        if self.labels_mm is not None:
+            self.labels_mm.flush()
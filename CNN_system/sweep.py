@@ -0,0 +1,345 @@
+"""
+并行超参数搜索
+在本机进程池中并行运行多组 (learning_rate, batch_size, StepLR step_size / gamma, num_epochs) 试验：
+- 数据只解码一次：train / val 图像 Resize 到 224×224 后以 uint8 存成 .npy，各试验以只读内存映射共享（同一份页缓存）
+- 每个工作进程绑定一组互不重叠的 CPU 核（sched_setaffinity），torch 线程数与核数一致，避免试验间争抢
+- 中位数早停：试验在某个 epoch 的最好验证准确率低于其他试验同一 epoch 的中位数时提前终止
+- 结束后输出按最好验证准确率排序的排行榜
+
+搜索空间为 JSON：列表表示候选值，{"low": a, "high": b, "log": true} 表示连续区间（仅 random 模式）
+    {"learning_rate": [1e-3, 3e-4, 1e-4], "batch_size": [8, 16, 32],
+     "step_size": [3, 5], "gamma": [0.1, 0.5], "num_epochs": [5, 10]}
+
+用法:
+    python sweep.py --data_dir split_dataset --workers 4
+    python sweep.py --space space.json --search random --trials 16 --workers 8
+"""
+
+import os
+import json
+import queue
+import math
+import time
+import random
+import argparse
+import itertools
+import statistics
+import multiprocessing as mp
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader, Dataset, Subset
+from torchvision import datasets, transforms
+
+from fast_decode import FAST_JPEG_DECODE, select_loaders
+from model_utils import IMAGENET_MEAN, IMAGENET_STD, build_resnet50
+
+CACHE_DIR = "decoded_cache"
+IMAGE_SIZE = 224
+SEED = 42
+DEFAULT_SPACE = {
+    "learning_rate": [1e-3, 3e-4, 1e-4],
+    "batch_size": [8, 16],
+    "step_size": [5],
+    "gamma": [0.1],
+    "num_epochs": [5],
+}
+GRACE_EPOCHS = 1          # 前几个 epoch 不做早停判断
+MIN_TRIALS_FOR_PRUNE = 3  # 同一 epoch 至少有这么多试验的记录才计算中位数
+RESULT_POLL_S = 30        # 等待结果的轮询间隔；超时时检查工作进程是否已退出（OOM / 原生崩溃）
+
+
+# ================================
+# 1️⃣ 解码缓存
+# ================================
+def _fingerprint(samples):
+    """源文件列表的指纹：数量 + 总大小 + 最大 mtime，任一变化即重建缓存"""
+    sizes, mtimes = 0, 0.0
+    for path, _ in samples:
+        st = os.stat(path)
+        sizes += st.st_size
+        mtimes = max(mtimes, st.st_mtime)
+    return {"count": len(samples), "bytes": sizes, "mtime": mtimes}
+
+
+def build_decoded_cache(data_dir, split, cache_dir=CACHE_DIR, size=IMAGE_SIZE):
+    """把 data_dir/<split> 解码并 Resize 为 uint8 (N, size, size, 3)，已是最新时直接复用"""
+    folder = datasets.ImageFolder(os.path.join(data_dir, split))
+    meta_path = os.path.join(cache_dir, f"{split}.json")
+    meta = {"classes": folder.classes, "size": size, "fast_decode": FAST_JPEG_DECODE,
+            "source": _fingerprint(folder.samples)}
+    if os.path.exists(meta_path):
+        with open(meta_path, encoding="utf-8") as f:
+            if json.load(f) == meta:
+                print(f"↻ [{split}] 复用解码缓存: {cache_dir}")
+                return meta
+
+    os.makedirs(cache_dir, exist_ok=True)
+    images = np.lib.format.open_memmap(os.path.join(cache_dir, f"{split}_images.npy"), mode="w+",
+                                       dtype=np.uint8, shape=(len(folder.samples), size, size, 3))
+    path_loader, _ = select_loaders(target_size=(size, size))
+    resize = transforms.Resize((size, size))
+    start = time.perf_counter()
+    for i, (path, _) in enumerate(folder.samples):
+        images[i] = np.asarray(resize(path_loader(path)))
+    images.flush()
+    del images
+    np.save(os.path.join(cache_dir, f"{split}_labels.npy"), np.array(folder.targets, dtype=np.int64))
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    print(f"✅ [{split}] 解码 {len(folder.samples)} 张 -> {cache_dir}（{time.perf_counter() - start:.1f}s）")
+    return meta
+
+
+class DecodedDataset(Dataset):
+    """只读内存映射的解码缓存；数据增强与 Resnet50_CNN.py 的训练预处理一致（Resize 已在缓存时完成）"""
+
+    def __init__(self, cache_dir, split, augment=False):
+        self.images_path = os.path.join(cache_dir, f"{split}_images.npy")
+        self.labels = np.load(os.path.join(cache_dir, f"{split}_labels.npy"))
+        self._images = None
+        ops = [transforms.RandomHorizontalFlip(), transforms.RandomRotation(15)] if augment else []
+        self.transform = transforms.Compose(ops + [transforms.Normalize(IMAGENET_MEAN, IMAGENET_STD)])
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        if self._images is None:
+            self._images = np.load(self.images_path, mmap_mode="r")
+        image = torch.from_numpy(np.array(self._images[idx])).permute(2, 0, 1).float().div_(255)
+        return self.transform(image), int(self.labels[idx])
+
+
+# ================================
+# 2️⃣ 搜索空间
+# ================================
+def sample_value(spec, rng):
+    if isinstance(spec, list):
+        return rng.choice(spec)
+    if spec.get("log"):
+        return math.exp(rng.uniform(math.log(spec["low"]), math.log(spec["high"])))
+    value = rng.uniform(spec["low"], spec["high"])
+    return round(value) if isinstance(spec["low"], int) and isinstance(spec["high"], int) else value
+
+
+def generate_trials(space, search="grid", num_trials=None, seed=SEED):
+    """grid：列表参数的笛卡尔积（可用 num_trials 截取随机子集）；random：独立采样 num_trials 组"""
+    rng = random.Random(seed)
+    if search == "grid":
+        if any(not isinstance(v, list) for v in space.values()):
+            raise ValueError("grid 模式下所有参数都必须是候选值列表")
+        keys = list(space)
+        trials = [dict(zip(keys, values)) for values in itertools.product(*space.values())]
+        if num_trials and num_trials < len(trials):
+            trials = rng.sample(trials, num_trials)
+        return trials
+    return [{k: sample_value(v, rng) for k, v in space.items()} for _ in range(num_trials or 10)]
+
+
+# ================================
+# 3️⃣ 中位数早停
+# ================================
+def should_prune(history, trial_id, epoch, grace=GRACE_EPOCHS, min_trials=MIN_TRIALS_FOR_PRUNE):
+    """history: {trial_id: [每个 epoch 的验证准确率]}；按截至该 epoch 的最好准确率比较"""
+    if epoch < grace:
+        return False
+    others = [max(accs[:epoch + 1]) for tid, accs in history.items()
+              if tid != trial_id and len(accs) > epoch]
+    if len(others) + 1 < min_trials:
+        return False
+    return max(history[trial_id][:epoch + 1]) < statistics.median(others)
+
+
+# ================================
+# 4️⃣ 试验执行
+# ================================
+def run_trial(trial_id, params, cache_dir, num_classes, pretrained, history, lock, max_train_samples=None):
+    torch.manual_seed(SEED + trial_id)
+    train_set = DecodedDataset(cache_dir, "train", augment=True)
+    if max_train_samples and max_train_samples < len(train_set):
+        train_set = Subset(train_set, random.Random(SEED).sample(range(len(train_set)), max_train_samples))
+    val_set = DecodedDataset(cache_dir, "val")
+    # 数据已解码，增强很轻，worker=0 使试验严格留在绑定的核上
+    train_loader = DataLoader(train_set, batch_size=params["batch_size"], shuffle=True)
+    val_loader = DataLoader(val_set, batch_size=params["batch_size"])
+
+    model = build_resnet50(num_classes, pretrained=pretrained)
+    criterion = nn.CrossEntropyLoss()
+    optimizer = torch.optim.Adam(model.parameters(), lr=params["learning_rate"])
+    scheduler = torch.optim.lr_scheduler.StepLR(optimizer, step_size=params["step_size"], gamma=params["gamma"])
+
+    best_acc, best_epoch, status = 0.0, 0, "completed"
+    for epoch in range(params["num_epochs"]):
+        model.train()
+        for images, labels in train_loader:
+            optimizer.zero_grad()
+            loss = criterion(model(images), labels)
+            loss.backward()
+            optimizer.step()
+        scheduler.step()
+
+        model.eval()
+        correct = 0
+        with torch.no_grad():
+            for images, labels in val_loader:
+                correct += model(images).argmax(1).eq(labels).sum().item()
+        acc = 100 * correct / len(val_set)
+        if acc > best_acc:
+            best_acc, best_epoch = acc, epoch
+        with lock:
+            history[trial_id] = history.get(trial_id, []) + [acc]
+            prune = should_prune(dict(history), trial_id, epoch)
+        print(f"  trial {trial_id:03d} epoch {epoch + 1}/{params['num_epochs']}: val acc {acc:.2f}%")
+        if prune and epoch + 1 < params["num_epochs"]:
+            status = "pruned"
+            break
+    return {"best_val_acc": best_acc, "best_epoch": best_epoch + 1, "epochs_run": epoch + 1, "status": status}
+
+
+def _worker(slot, cores, tasks, results, cache_dir, num_classes, pretrained, history, lock, max_train_samples,
+            running):
+    """常驻工作进程：绑定到 cores 后依次领取试验；running[slot] 记录正在运行的试验，供主进程发现崩溃"""
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(max(len(cores), 1))
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        trial_id, params = task
+        running[slot] = trial_id
+        start = time.perf_counter()
+        try:
+            result = run_trial(trial_id, params, cache_dir, num_classes, pretrained, history, lock,
+                               max_train_samples)
+        except Exception as e:  # 单个试验失败不影响整个搜索
+            result = {"best_val_acc": 0.0, "best_epoch": 0, "epochs_run": 0, "status": f"failed: {e}"}
+        result.update(trial_id=trial_id, params=params, slot=slot, cores=sorted(cores),
+                      duration_s=time.perf_counter() - start)
+        results.put(result)
+        running.pop(slot, None)
+
+
+def core_slots(num_workers):
+    """把可用核均分为 num_workers 组互不重叠的集合"""
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count()))
+    per = max(len(cores) // num_workers, 1)
+    return [set(cores[i * per:(i + 1) * per]) or {cores[i % len(cores)]} for i in range(num_workers)]
+
+
+def run_sweep(trials, cache_dir, num_classes, workers, pretrained=True, max_train_samples=None):
+    ctx = mp.get_context("spawn")
+    manager = ctx.Manager()
+    history, lock, running = manager.dict(), manager.Lock(), manager.dict()
+    tasks, results = ctx.Queue(), ctx.Queue()
+    for item in enumerate(trials):
+        tasks.put(item)
+    slots = core_slots(workers)
+    procs = []
+    for slot, cores in enumerate(slots):
+        tasks.put(None)
+        p = ctx.Process(target=_worker, args=(slot, cores, tasks, results, cache_dir, num_classes,
+                                              pretrained, history, lock, max_train_samples, running))
+        p.start()
+        procs.append(p)
+
+    finished, pending, exited = [], set(range(len(trials))), set()
+
+    def record(r):
+        pending.discard(r["trial_id"])
+        finished.append(r)
+        print(f"🏁 trial {r['trial_id']:03d} [{r['status']}] best {r['best_val_acc']:.2f}% "
+              f"@ epoch {r['best_epoch']} ({r['duration_s']:.0f}s, cores {r['cores']})")
+
+    def lost(trial_id, slot, status):
+        return {"best_val_acc": 0.0, "best_epoch": 0, "epochs_run": 0, "status": status, "trial_id": trial_id,
+                "params": trials[trial_id], "slot": slot, "cores": sorted(slots[slot]), "duration_s": 0.0}
+
+    while pending:
+        try:
+            record(results.get(timeout=RESULT_POLL_S))
+            continue
+        except queue.Empty:
+            pass
+        # 工作进程被 OOM-kill 或原生崩溃时不会返回结果：把它正在运行的试验记为失败
+        for slot, p in enumerate(procs):
+            if slot in exited or p.is_alive():
+                continue
+            exited.add(slot)
+            trial_id = running.pop(slot, None)
+            if trial_id in pending:
+                record(lost(trial_id, slot, f"failed: worker exited (code {p.exitcode})"))
+        if len(exited) == len(procs):
+            while True:  # 先取回已退出进程留在队列中的结果
+                try:
+                    record(results.get(timeout=1))
+                except queue.Empty:
+                    break
+            for trial_id in sorted(pending):
+                record(lost(trial_id, trial_id % len(slots), "failed: no live workers"))
+
+    for p in procs:
+        p.join(timeout=RESULT_POLL_S)
+        if p.is_alive():
+            p.terminate()
+            p.join()
+    manager.shutdown()
+    return finished
+
+
+def leaderboard(results):
+    ranked = sorted(results, key=lambda r: -r["best_val_acc"])
+    keys = sorted({k for r in ranked for k in r["params"]})
+    header = f"{'rank':<6}{'trial':<7}{'val acc(%)':>11}{'best ep':>9}{'epochs':>8}  {'status':<10}" + \
+             "".join(f"{k:>15}" for k in keys)
+    lines = [header]
+    for rank, r in enumerate(ranked, 1):
+        values = "".join(f"{r['params'].get(k, ''):>15.4g}" if isinstance(r["params"].get(k), float)
+                         else f"{str(r['params'].get(k, '')):>15}" for k in keys)
+        lines.append(f"{rank:<6}{r['trial_id']:<7}{r['best_val_acc']:>11.2f}{r['best_epoch']:>9}"
+                     f"{r['epochs_run']:>8}  {r['status'][:10]:<10}{values}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并行超参数搜索（共享解码缓存 + 绑核 + 中位数早停）")
+    parser.add_argument("--data_dir", default="split_dataset")
+    parser.add_argument("--cache_dir", default=CACHE_DIR)
+    parser.add_argument("--space", default=None, help="搜索空间 JSON 文件（默认 DEFAULT_SPACE）")
+    parser.add_argument("--search", choices=["grid", "random"], default="grid")
+    parser.add_argument("--trials", type=int, default=None, help="试验数（grid 模式下为随机子集大小）")
+    parser.add_argument("--workers", type=int, default=max((os.cpu_count() or 1) // 4, 1), help="并行试验数")
+    parser.add_argument("--no_pretrained", action="store_true", help="不加载 ImageNet 预训练权重")
+    parser.add_argument("--max_train_samples", type=int, default=None, help="每个试验只用训练集的随机子集")
+    parser.add_argument("--output", default="sweep_results.json")
+    parser.add_argument("--leaderboard", default="sweep_leaderboard.txt")
+    args = parser.parse_args()
+
+    space = DEFAULT_SPACE
+    if args.space:
+        with open(args.space, encoding="utf-8") as f:
+            space = json.load(f)
+    trials = generate_trials(space, args.search, args.trials)
+    print(f"🔍 共 {len(trials)} 组试验，{args.workers} 个并行进程")
+
+    meta = build_decoded_cache(args.data_dir, "train", args.cache_dir)
+    build_decoded_cache(args.data_dir, "val", args.cache_dir)
+    pretrained = not args.no_pretrained
+    if pretrained:
+        build_resnet50(len(meta["classes"]), pretrained=True)  # 先在主进程下载权重，避免各进程同时下载
+
+    results = run_sweep(trials, args.cache_dir, len(meta["classes"]), args.workers, pretrained,
+                        args.max_train_samples)
+    board = leaderboard(results)
+    print("\n" + board)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(sorted(results, key=lambda r: -r["best_val_acc"]), f, ensure_ascii=False, indent=1)
+    with open(args.leaderboard, "w", encoding="utf-8") as f:
+        f.write(board + "\n")
+    print(f"✅ 排行榜已保存为: {args.leaderboard}（详细结果: {args.output}）")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,48 @@
 import torch
-import torch.nn as nn
-from torchvision import datasets, models, transforms
+from torchvision import datasets, transforms
 import matplotlib.pyplot as plt
 import seaborn as sns
-from sklearn.metrics import confusion_matrix, classification_report
 import numpy as np
 
+from fast_decode import FAST_JPEG_DECODE, select_loaders
+from manifest_dataset import ManifestDataset
+from shard_dataset import ShardDataset
+from zip_dataset import ZipImageFolder
+from autotune import apply_threads, load_tuned_config, loader_kwargs
+from cascade import load_cascade
+from compile_utils import enable_compile_cache, make_eval_step
+from model_utils import load_resnet50
+from streaming_metrics import StreamingMetrics
+
 # ======================================================
 # 配置部分
 # ======================================================
 data_dir = "./split_dataset/test"       # 测试集路径（文件夹结构应为 data/test/猫, data/test/狗 ...）
-model_path = "./best_resnet50.pth" # 训练保存的模型路径
+manifest_path = None                    # 划分清单路径（如 "./split_manifest.json"），设置后读取其中的 test 划分
+zip_path = None                         # 数据集 zip 包路径，设置后直接从归档读取，无需解压
+zip_root = "split_dataset/test"         # zip 内测试集目录；配合 manifest_path 时为 raw-img 目录
+shard_dir = None                        # shard_dataset.py pack 生成的分片目录，设置后顺序读取 test 分片
+fast_jpeg_decode = FAST_JPEG_DECODE     # 降分辨率 JPEG 解码（默认关闭）；在 fast_decode.py 中统一切换，需与训练时一致
+model_path = "./best_resnet50.pth" # 训练保存的模型路径（也可为 prune_resnet.py 导出的剪枝模型）
 batch_size = 8
+num_workers = 0
+prefetch_factor = 2
+use_tuned_config = False            # 若本机运行过 autotune.py --mode eval，用调优结果覆盖批大小 / worker / 线程数
+logits_path = "./test_logits.npy"   # 原始 logits 导出路径（内存映射 .npy，设为 None 则不导出）
+labels_path = "./test_labels.npy"   # 对应真实标签导出路径
+topk = (1, 5)                       # 额外统计的 Top-k 准确率
+use_compile = False                 # torch.compile 编译前向（最后一批补齐到整批，不重新编译）
+cascade_head_path = None            # cascade.py 导出的早退出分类头（如 "./exit_head.pth"），设置后启用级联推理
+exit_mask_path = "./test_exit_mask.npy"  # 级联推理时逐样本是否早退出（与 logits 行一一对应，设为 None 则不导出）
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
+tuned = load_tuned_config("eval") if use_tuned_config else None
+if tuned:
+    batch_size, num_workers, prefetch_factor = tuned["batch_size"], tuned["num_workers"], tuned["prefetch_factor"]
+    apply_threads(tuned)
+    print(f"⚙️ 使用调优配置: batch_size={batch_size}, num_workers={num_workers}, "
+          f"prefetch_factor={prefetch_factor}, threads={tuned['intra_op_threads']}/{tuned['inter_op_threads']}")
+
 # ======================================================
 # 数据预处理
 # ======================================================
@@ -24,49 +53,64 @@ test_transforms = transforms.Compose([
                          [0.229, 0.224, 0.225])
 ])
 
-test_dataset = datasets.ImageFolder(root=data_dir, transform=test_transforms)
-test_loader = torch.utils.data.DataLoader(test_dataset, batch_size=batch_size, shuffle=False)
+path_loader, bytes_loader = select_loaders(fast_jpeg_decode)
+if shard_dir:
+    test_dataset = ShardDataset(shard_dir, "test", transform=test_transforms, shuffle=False,
+                                loader=bytes_loader)
+elif zip_path and manifest_path:
+    test_dataset = ZipImageFolder(zip_path, zip_root, transform=test_transforms, loader=bytes_loader,
+                                  manifest_path=manifest_path, split="test")
+elif zip_path:
+    test_dataset = ZipImageFolder(zip_path, zip_root, transform=test_transforms, loader=bytes_loader)
+elif manifest_path:
+    test_dataset = ManifestDataset(manifest_path, "test", transform=test_transforms, loader=path_loader)
+else:
+    test_dataset = datasets.ImageFolder(root=data_dir, transform=test_transforms, loader=path_loader)
+test_loader = torch.utils.data.DataLoader(test_dataset, batch_size=batch_size, shuffle=False,
+                                          **loader_kwargs(num_workers, prefetch_factor))
 
 class_names = test_dataset.classes
 print("📁 检测到的类别：", class_names)
 
 # ======================================================
-# 加载模型
+# 加载模型（按权重形状构建，兼容剪枝后的模型）
 # ======================================================
-model = models.resnet50(pretrained=False)
-num_features = model.fc.in_features
-model.fc = nn.Linear(num_features, len(class_names))
-model.load_state_dict(torch.load(model_path, map_location=device))
-model = model.to(device)
-model.eval()
+model = load_resnet50(model_path, len(class_names), device)
+if cascade_head_path is not None:
+    # 置信度达到校准阈值的样本在 layer3 早退出（各批剩余样本数不定，不与编译模式同时使用）
+    forward = load_cascade(model, cascade_head_path, device, record_exits=exit_mask_path is not None)
+else:
+    if use_compile:
+        enable_compile_cache()
+    forward = make_eval_step(model, batch_size, compile=use_compile)
 
 # ======================================================
-# 测试过程
+# 测试过程（逐批累积指标，logits 写入内存映射文件）
 # ======================================================
-all_preds = []
-all_labels = []
-correct = 0
-total = 0
+metrics = StreamingMetrics(len(class_names), num_samples=len(test_dataset), topk=topk,
+                           logits_path=logits_path, labels_path=labels_path)
 
 with torch.no_grad():
     for images, labels in test_loader:
-        images, labels = images.to(device), labels.to(device)
-        outputs = model(images)
-        _, preds = torch.max(outputs, 1)
-
-        all_preds.extend(preds.cpu().numpy())
-        all_labels.extend(labels.cpu().numpy())
+        images = images.to(device)
+        outputs = forward(images)
+        metrics.update(outputs.cpu().numpy(), labels.numpy())
 
-        correct += torch.sum(preds == labels).item()
-        total += labels.size(0)
+metrics.flush()
+if cascade_head_path is not None and exit_mask_path is not None:
+    np.save(exit_mask_path, forward.exit_mask().numpy())
 
 # ======================================================
 # 结果输出
 # ======================================================
-accuracy = correct / total
+accuracy = metrics.accuracy()
 print(f"\n🎯 测试集总体准确率: {accuracy * 100:.2f}%")
+for k, acc in metrics.topk_accuracy().items():
+    print(f"   Top-{k} 准确率: {acc * 100:.2f}%")
+if cascade_head_path is not None:
+    print(f"   早退出比例: {forward.exit_fraction * 100:.2f}%（阈值 {forward.threshold:.4f}）")
 print("\n📊 分类详细报告：")
-report = classification_report(all_labels, all_preds, target_names=class_names)
+report = metrics.report(class_names)
 print(report)
 
 # 保存分类报告
@@ -75,10 +119,14 @@ with open(report_path, "w", encoding="utf-8") as f:
     f.write(report)
 
 print(f"✅ 分类报告已保存为: {report_path}")
+if logits_path is not None:
+    print(f"✅ 原始 logits 已导出为: {logits_path}（标签: {labels_path}）")
+    if cascade_head_path is not None and exit_mask_path is not None:
+        print(f"✅ 早退出掩码已导出为: {exit_mask_path}（True 的行为 layer3 分类头的 logits）")
 # ======================================================
 # 混淆矩阵可视化
 # ======================================================
-cm = confusion_matrix(all_labels, all_preds)
+cm = metrics.confusion
 plt.figure(figsize=(8, 6))
 sns.heatmap(cm, annot=True, fmt="d", cmap="Blues",
             xticklabels=class_names, yticklabels=class_names)
@@ -0,0 +1,101 @@
+"""
+Zip 归档数据集
+直接从下载的 zip 包中按需读取图像，无需先解压；只在初始化时读取一次中央目录，
+类别布局与 torchvision ImageFolder 一致：<root>/<类别>/<文件>
+每个 DataLoader worker 进程各自持有独立的文件句柄
+"""
+
+import io
+import os
+import json
+import zipfile
+
+from PIL import Image
+from torch.utils.data import Dataset
+
+IMG_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def pil_bytes_loader(data):
+    """从内存字节解码为 RGB 图像"""
+    with Image.open(io.BytesIO(data)) as img:
+        return img.convert("RGB")
+
+
+class ZipImageFolder(Dataset):
+    """
+    以 zip 内某个目录为根的 ImageFolder
+    例如 root="split_dataset/train"；root 为空时以归档根目录为根
+    同时给出 manifest_path 与 split 时，按清单（prepare_data.py --manifest）选取该划分的样本，
+    此时 root 为 zip 内 raw-img 所在目录，如 root="raw-img"
+    """
+
+    def __init__(self, zip_path, root="", transform=None, loader=pil_bytes_loader,
+                 manifest_path=None, split=None):
+        self.zip_path = os.path.abspath(zip_path)
+        self.root = root.strip("/")
+        self.transform = transform
+        self.loader = loader
+        self._zip = None
+        self._pid = None
+
+        prefix = f"{self.root}/" if self.root else ""
+        if manifest_path is not None:
+            self._init_from_manifest(manifest_path, split, prefix)
+            return
+
+        members = []
+        with zipfile.ZipFile(self.zip_path) as zf:
+            for info in zf.infolist():
+                name = info.filename
+                if info.is_dir() or not name.startswith(prefix) or not name.lower().endswith(IMG_EXTENSIONS):
+                    continue
+                parts = name[len(prefix):].split("/")
+                if len(parts) != 2:
+                    continue
+                members.append((name, parts[0]))
+        if not members:
+            raise FileNotFoundError(f"在 {zip_path} 的 '{self.root}' 下未找到图像")
+
+        self.classes = sorted({cls for _, cls in members})
+        self.class_to_idx = {cls: i for i, cls in enumerate(self.classes)}
+        self.samples = sorted((name, self.class_to_idx[cls]) for name, cls in members)
+        self.targets = [label for _, label in self.samples]
+        self.imgs = self.samples
+
+    def _init_from_manifest(self, manifest_path, split, prefix):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        with zipfile.ZipFile(self.zip_path) as zf:
+            names = set(zf.namelist())
+        self.classes = manifest["classes"]
+        self.class_to_idx = {cls: i for i, cls in enumerate(self.classes)}
+        self.samples = [(prefix + rel, label) for rel, label in manifest["splits"][split]]
+        missing = [name for name, _ in self.samples if name not in names]
+        if missing:
+            raise FileNotFoundError(f"清单中有 {len(missing)} 个文件不在 {self.zip_path} 中，如 {missing[0]}")
+        self.targets = [label for _, label in self.samples]
+        self.imgs = self.samples
+
+    def _handle(self):
+        # fork 出的 worker 会继承父进程对象，按进程号判断是否需要重新打开
+        if self._zip is None or self._pid != os.getpid():
+            self._zip = zipfile.ZipFile(self.zip_path)
+            self._pid = os.getpid()
+        return self._zip
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_zip"] = None
+        state["_pid"] = None
+        return state
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, idx):
+        name, target = self.samples[idx]
+        image = self.loader(self._handle().read(name))
+        if self.transform is not None:
+            image = self.transform(image)
+        return image, target
@@ -0,0 +1,259 @@
+"""
+并行分块下载器
+按字节区间（HTTP Range）并行下载，复用连接池，大块缓冲写入预分配文件；
+已完成的分块记录在 <目标文件>.part.json 中，中断后重新运行可断点续传；
+下载完成后可校验 SHA-256
+
+附带一个支持 Range 的本地 HTTP 服务器（serve_directory），用于离线测试
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
+
+CHUNK_SIZE = 8 * 1024 * 1024     # 每个 Range 请求的字节数
+WRITE_BUFFER = 1024 * 1024       # 单次读取/写入的缓冲大小
+NUM_WORKERS = 8                  # 并行连接数
+MAX_RETRIES = 5                  # 单个分块的最大重试次数
+TIMEOUT = 30                     # 连接/读取超时（秒）
+
+
+class DownloadError(Exception):
+    """下载失败或校验不通过"""
+
+
+def make_session(pool_size=NUM_WORKERS):
+    """创建连接池大小与并发数匹配的 Session"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def sha256_file(path, chunk_size=WRITE_BUFFER):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class ChunkedDownloader:
+    """分块并行下载一个 URL 到 dest_path"""
+
+    def __init__(self, url, dest_path, sha256=None, chunk_size=CHUNK_SIZE,
+                 workers=NUM_WORKERS, max_retries=MAX_RETRIES, session=None, desc="下载中"):
+        self.url = url
+        self.dest_path = str(dest_path)
+        self.part_path = self.dest_path + ".part"
+        self.state_path = self.dest_path + ".part.json"
+        self.sha256 = sha256.lower() if sha256 else None
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.max_retries = max_retries
+        self.session = session or make_session(workers)
+        self.desc = desc
+        self._lock = threading.Lock()
+
+    # ---------- 探测服务器能力 ----------
+    def probe(self):
+        """返回 (文件大小, 是否支持 Range, ETag)；大小未知时为 None"""
+        resp = self.session.head(self.url, allow_redirects=True, timeout=TIMEOUT)
+        if resp.ok:
+            size = int(resp.headers.get("Content-Length", 0)) or None
+            etag = resp.headers.get("ETag")
+            ranges = resp.headers.get("Accept-Ranges", "").lower() == "bytes"
+        else:
+            # HEAD 失败（如 403/405）时不信任其响应头，改用 Range 请求探测
+            size, etag, ranges = None, None, False
+        if not ranges or size is None:
+            # 部分服务器不在 HEAD 中声明，用 1 字节 Range 请求确认
+            resp = self.session.get(self.url, headers={"Range": "bytes=0-0"},
+                                    stream=True, timeout=TIMEOUT)
+            resp.close()
+            resp.raise_for_status()
+            content_range = resp.headers.get("Content-Range", "")
+            if resp.status_code == HTTPStatus.PARTIAL_CONTENT and "/" in content_range:
+                total = content_range.rsplit("/", 1)[1]
+                if total.isdigit():
+                    size, ranges = int(total), True
+            etag = etag or resp.headers.get("ETag")
+        return size, ranges, etag
+
+    # ---------- 断点状态 ----------
+    def _load_state(self, size, etag):
+        if not (os.path.exists(self.state_path) and os.path.exists(self.part_path)):
+            return set()
+        with open(self.state_path, encoding="utf-8") as f:
+            state = json.load(f)
+        if (state.get("url"), state.get("size"), state.get("etag"), state.get("chunk_size")) != \
+                (self.url, size, etag, self.chunk_size):
+            print("⚠️ 远端文件或分块参数已变化，重新下载")
+            return set()
+        return set(state["done"])
+
+    def _save_state(self, size, etag, done):
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"url": self.url, "size": size, "etag": etag,
+                       "chunk_size": self.chunk_size, "done": sorted(done)}, f)
+        os.replace(tmp, self.state_path)
+
+    # ---------- 分块下载 ----------
+    def _fetch_chunk(self, index, size, progress):
+        start = index * self.chunk_size
+        end = min(start + self.chunk_size, size) - 1
+        for attempt in range(self.max_retries):
+            written = 0
+            try:
+                headers = {"Range": f"bytes={start}-{end}"}
+                with self.session.get(self.url, headers=headers, stream=True, timeout=TIMEOUT) as resp:
+                    if resp.status_code != HTTPStatus.PARTIAL_CONTENT:
+                        raise DownloadError(f"服务器未按 Range 返回数据（HTTP {resp.status_code}）")
+                    with open(self.part_path, "r+b", buffering=WRITE_BUFFER) as f:
+                        f.seek(start)
+                        for data in resp.iter_content(chunk_size=WRITE_BUFFER):
+                            f.write(data)
+                            written += len(data)
+                            progress.update(len(data))
+                if written != end - start + 1:
+                    raise DownloadError(f"分块 {index} 长度不符: {written} != {end - start + 1}")
+                return index
+            except (requests.RequestException, DownloadError) as e:
+                progress.update(-written)
+                if attempt == self.max_retries - 1:
+                    raise DownloadError(f"分块 {index} 下载失败: {e}") from e
+                time.sleep(min(2 ** attempt, 30))
+
+    def _download_ranges(self, size, etag):
+        n_chunks = (size + self.chunk_size - 1) // self.chunk_size
+        done = self._load_state(size, etag)
+        if not done:
+            # 预分配目标大小，各线程直接写入各自偏移
+            with open(self.part_path, "wb") as f:
+                f.truncate(size)
+            self._save_state(size, etag, done)
+        pending = [i for i in range(n_chunks) if i not in done]
+        done_bytes = sum(min(self.chunk_size, size - i * self.chunk_size) for i in done)
+        if done:
+            print(f"↻ 断点续传：已完成 {len(done)}/{n_chunks} 个分块")
+
+        with tqdm(desc=self.desc, total=size, initial=done_bytes, unit="iB",
+                  unit_scale=True, unit_divisor=1024) as progress, \
+                ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(self._fetch_chunk, i, size, progress) for i in pending]
+            errors = []
+            for future in as_completed(futures):
+                try:
+                    index = future.result()
+                except DownloadError as e:
+                    # 继续记录其余分块的进度，下次运行只需补齐失败的分块
+                    errors.append(e)
+                    continue
+                with self._lock:
+                    done.add(index)
+                    self._save_state(size, etag, done)
+        if errors:
+            raise DownloadError(f"{len(errors)} 个分块下载失败，重新运行可断点续传: {errors[0]}")
+
+    def _download_stream(self, size):
+        """服务器不支持 Range 时退回单连接流式下载（无法续传）"""
+        with self.session.get(self.url, stream=True, timeout=TIMEOUT) as resp, \
+                open(self.part_path, "wb", buffering=WRITE_BUFFER) as f, \
+                tqdm(desc=self.desc, total=size, unit="iB", unit_scale=True, unit_divisor=1024) as progress:
+            resp.raise_for_status()
+            for data in resp.iter_content(chunk_size=WRITE_BUFFER):
+                f.write(data)
+                progress.update(len(data))
+
+    def download(self):
+        """执行下载并返回目标路径；校验失败抛出 DownloadError"""
+        size, ranges, etag = self.probe()
+        if ranges and size:
+            self._download_ranges(size, etag)
+        else:
+            print("⚠️ 服务器不支持 Range，使用单连接下载")
+            self._download_stream(size)
+
+        if self.sha256:
+            digest = sha256_file(self.part_path)
+            if digest != self.sha256:
+                os.remove(self.part_path)
+                if os.path.exists(self.state_path):
+                    os.remove(self.state_path)
+                raise DownloadError(f"SHA-256 校验失败: 期望 {self.sha256}，实际 {digest}")
+            print("✓ SHA-256 校验通过")
+
+        os.replace(self.part_path, self.dest_path)
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+        return self.dest_path
+
+
+# ========== 本地测试服务器 ==========
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """在 SimpleHTTPRequestHandler 基础上支持单区间 Range 请求"""
+
+    def send_head(self):
+        self._range = None
+        range_header = self.headers.get("Range")
+        path = self.translate_path(self.path)
+        if not range_header or not os.path.isfile(path):
+            f = super().send_head()
+            return f
+
+        size = os.path.getsize(path)
+        start, _, end = range_header.replace("bytes=", "").partition("-")
+        start = int(start)
+        end = min(int(end) if end else size - 1, size - 1)
+        if start >= size or start > end:
+            self.send_error(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            return None
+        f = open(path, "rb")
+        f.seek(start)
+        self._range = end - start + 1
+        self.send_response(HTTPStatus.PARTIAL_CONTENT)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(self._range))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        return f
+
+    def end_headers(self):
+        if not getattr(self, "_range", None):
+            self.send_header("Accept-Ranges", "bytes")
+        super().end_headers()
+
+    def copyfile(self, source, outputfile):
+        remaining = getattr(self, "_range", None)
+        if remaining is None:
+            return super().copyfile(source, outputfile)
+        while remaining > 0:
+            data = source.read(min(WRITE_BUFFER, remaining))
+            if not data:
+                break
+            outputfile.write(data)
+            remaining -= len(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_directory(directory, port=0):
+    """在后台线程中启动本地 Range 服务器，返回 (server, base_url)；用完调用 server.shutdown()"""
+    handler = functools.partial(RangeRequestHandler, directory=str(directory))
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
@@ -4,31 +4,21 @@
 """
 
 import os
-import sys
 import argparse
 import subprocess
 from pathlib import Path
-import requests
-from tqdm import tqdm
 import zipfile
 import shutil
 
+from chunked_download import ChunkedDownloader, NUM_WORKERS
 
-def download_file(url, dest_path, desc="下载中"):
-    """下载文件并显示进度条"""
-    response = requests.get(url, stream=True)
-    total_size = int(response.headers.get('content-length', 0))
-    
-    with open(dest_path, 'wb') as file, tqdm(
-        desc=desc,
-        total=total_size,
-        unit='iB',
-        unit_scale=True,
-        unit_divisor=1024,
-    ) as progress_bar:
-        for data in response.iter_content(chunk_size=1024):
-            size = file.write(data)
-            progress_bar.update(size)
+
+def download_file(url, dest_path, desc="下载中", sha256=None, workers=NUM_WORKERS):
+    """
+    分块并行下载文件并显示进度条
+    中断后重新运行会从 <dest_path>.part.json 记录的进度续传；指定 sha256 时下载完成后校验
+    """
+    return ChunkedDownloader(url, dest_path, sha256=sha256, workers=workers, desc=desc).download()
 
 
 def download_from_kaggle(dataset_name, download_dir):
@@ -186,8 +176,11 @@ def setup_kaggle_api():
     print("=" * 70)
 
 
-def download_from_url(url, dest_dir, filename=None):
-    """从指定URL下载文件"""
+def download_from_url(url, dest_dir, filename=None, sha256=None, workers=NUM_WORKERS, extract=True):
+    """
+    从指定URL下载文件
+    extract=False 时保留 zip 包不解压，可配合 CNN_system/zip_dataset.py 直接从归档训练
+    """
     dest_dir = Path(dest_dir)
     dest_dir.mkdir(parents=True, exist_ok=True)
     
@@ -200,10 +193,10 @@ def download_from_url(url, dest_dir, filename=None):
     print(f"保存到: {dest_path}")
     
     try:
-        download_file(url, dest_path, desc=filename)
+        download_file(url, dest_path, desc=filename, sha256=sha256, workers=workers)
         
         # 如果是压缩文件，自动解压
-        if dest_path.suffix in ['.zip', '.tar', '.gz']:
+        if extract and dest_path.suffix in ['.zip', '.tar', '.gz']:
             print(f"解压: {dest_path}")
             if dest_path.suffix == '.zip':
                 with zipfile.ZipFile(dest_path, 'r') as zip_ref:
@@ -275,6 +268,12 @@ def main():
                         help='显示 Kaggle API 配置指南')
     parser.add_argument('--url', type=str,
                         help='从指定URL下载数据集')
+    parser.add_argument('--sha256', type=str,
+                        help='下载完成后校验的 SHA-256（配合 --url 使用）')
+    parser.add_argument('--workers', type=int, default=NUM_WORKERS,
+                        help='并行下载连接数（配合 --url 使用）')
+    parser.add_argument('--no-extract', action='store_true',
+                        help='下载后不解压 zip（训练时直接从归档读取）')
     
     args = parser.parse_args()
     
@@ -284,7 +283,8 @@ def main():
     
     if args.url:
         data_dir = Path(__file__).parent / 'data'
-        download_from_url(args.url, data_dir)
+        download_from_url(args.url, data_dir, sha256=args.sha256, workers=args.workers,
+                          extract=not args.no_extract)
         return
     
     if args.dataset == 'animals10':
@@ -298,13 +298,4 @@ def main():
 
 
 if __name__ == '__main__':
-    # 检查必要的库
-    try:
-        import requests
-        from tqdm import tqdm
-    except ImportError:
-        print("请先安装必要的库:")
-        print("pip install requests tqdm kaggle")
-        sys.exit(1)
-    
     main()
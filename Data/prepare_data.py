@@ -1,17 +1,23 @@
 import os
+import json
 import shutil
 import random
+import hashlib
+import argparse
 from glob import glob
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 
 # ========== 配置部分 ==========
 RAW_DIR = "data/raw-img"   # Kaggle 原始目录
 OUTPUT_DIR = "split_dataset"          # 输出目录，用于训练脚本
+MANIFEST_PATH = "split_manifest.json" # 清单模式输出：只记录划分结果，不复制图像
+INDEX_PATH = "raw_index.json"         # 增量模式：原始文件索引（路径、大小、mtime、内容哈希、划分）
+NUM_WORKERS = min(32, (os.cpu_count() or 1) * 4)  # 增量模式哈希与文件 I/O 的线程数
 SPLIT_RATIOS = (0.7, 0.15, 0.15)  # train / val / test 比例
 SEED = 42                         # 随机种子，保证可重复
 IMG_EXTENSIONS = (".jpg", ".jpeg", ".png")
-
-random.seed(SEED)
+SPLITS = ("train", "val", "test")
 
 # ========== 创建目标目录结构 ==========
 def ensure_dir(path):
@@ -19,40 +25,275 @@ def ensure_dir(path):
         os.makedirs(path)
 
 def make_subdirs(output_dir, classes):
-    for split in ["train", "val", "test"]:
+    for split in SPLITS:
         for cls in classes:
             ensure_dir(os.path.join(output_dir, split, cls))
 
-# ========== 主函数 ==========
-def split_dataset(raw_dir=RAW_DIR, output_dir=OUTPUT_DIR, ratios=SPLIT_RATIOS):
+# ========== 划分 ==========
+def compute_splits(raw_dir=RAW_DIR, ratios=SPLIT_RATIOS, seed=SEED):
+    """按类别打乱并划分，返回 (classes, {split: [(src_path, cls), ...]})"""
     assert sum(ratios) == 1.0 or abs(sum(ratios) - 1.0) < 1e-6, "比例之和必须为1"
+    rng = random.Random(seed)
     classes = sorted([d for d in os.listdir(raw_dir) if os.path.isdir(os.path.join(raw_dir, d))])
     print(f"检测到类别: {classes}")
-    make_subdirs(output_dir, classes)
 
+    splits = {split: [] for split in SPLITS}
     for cls in classes:
         cls_dir = os.path.join(raw_dir, cls)
-        imgs = [f for f in glob(os.path.join(cls_dir, "*")) if f.lower().endswith(IMG_EXTENSIONS)]
-        random.shuffle(imgs)
+        # 排序后再打乱，保证不同机器/文件系统上的划分一致
+        imgs = sorted(f for f in glob(os.path.join(cls_dir, "*")) if f.lower().endswith(IMG_EXTENSIONS))
+        rng.shuffle(imgs)
 
         n_total = len(imgs)
         n_train = int(ratios[0] * n_total)
         n_val = int(ratios[1] * n_total)
 
-        splits = {
+        parts = {
             "train": imgs[:n_train],
             "val": imgs[n_train:n_train + n_val],
             "test": imgs[n_train + n_val:]
         }
+        print(f"[{cls}] 共 {n_total} 张 -> 训练: {len(parts['train'])}, 验证: {len(parts['val'])}, 测试: {len(parts['test'])}")
+        for split, files in parts.items():
+            splits[split].extend((f, cls) for f in files)
+    return classes, splits
+
+# ========== 文件落地（复制 / 硬链接 / 软链接） ==========
+def place_file(src_path, dst_path, mode="copy"):
+    if os.path.lexists(dst_path):
+        os.remove(dst_path)
+    if mode == "hardlink":
+        try:
+            os.link(src_path, dst_path)
+            return
+        except OSError:
+            pass  # 跨文件系统等情况退回复制
+    elif mode == "symlink":
+        os.symlink(os.path.abspath(src_path), dst_path)
+        return
+    shutil.copy2(src_path, dst_path)
+
+def prune_output(output_dir, classes, expected):
+    """删除输出目录各划分中不在 expected（目标路径集合）里的文件，返回删除数"""
+    removed = 0
+    for split in SPLITS:
+        for cls in classes:
+            for entry in os.scandir(os.path.join(output_dir, split, cls)):
+                if entry.path not in expected:
+                    os.remove(entry.path)
+                    removed += 1
+    return removed
+
+def materialize(classes, splits, output_dir=OUTPUT_DIR, mode="copy"):
+    """
+    把划分结果落地为 ImageFolder 目录结构
+    先清理输出目录中不属于本次划分的文件：划分变化后重新运行时，同一图像不会同时留在 train 与 test 中
+    """
+    make_subdirs(output_dir, classes)
+    expected = {os.path.join(output_dir, split, cls, os.path.basename(src_path))
+                for split, items in splits.items() for src_path, cls in items}
+    removed = prune_output(output_dir, classes, expected)
+    if removed:
+        print(f"已移除 {removed} 个不属于当前划分的旧文件")
+    for split, items in splits.items():
+        for src_path, cls in tqdm(items, desc=f"{split}({mode})", leave=False):
+            dst_path = os.path.join(output_dir, split, cls, os.path.basename(src_path))
+            place_file(src_path, dst_path, mode)
+
+# ========== 清单模式 ==========
+def write_manifest(raw_dir=RAW_DIR, manifest_path=MANIFEST_PATH, ratios=SPLIT_RATIOS, seed=SEED):
+    """只把划分写成紧凑的清单文件（相对路径 + 标签），训练时直接从 raw_dir 读取"""
+    classes, splits = compute_splits(raw_dir, ratios, seed)
+    class_to_idx = {cls: i for i, cls in enumerate(classes)}
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    manifest = {
+        "version": 1,
+        "root": os.path.relpath(os.path.abspath(raw_dir), manifest_dir).replace(os.sep, "/"),
+        "seed": seed,
+        "ratios": list(ratios),
+        "classes": classes,
+        "splits": {
+            split: [[os.path.relpath(p, raw_dir).replace(os.sep, "/"), class_to_idx[cls]]
+                    for p, cls in items]
+            for split, items in splits.items()
+        },
+    }
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, separators=(",", ":"))
+    print(f"\n✅ 清单已写入：{os.path.abspath(manifest_path)}")
+    return manifest
+
+def load_manifest(manifest_path=MANIFEST_PATH):
+    """读取清单，返回 (root_dir, classes, {split: [(src_path, cls), ...]})"""
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    root = os.path.join(os.path.dirname(os.path.abspath(manifest_path)), manifest["root"])
+    classes = manifest["classes"]
+    splits = {
+        split: [(os.path.join(root, rel), classes[label]) for rel, label in items]
+        for split, items in manifest["splits"].items()
+    }
+    return root, classes, splits
+
+def materialize_manifest(manifest_path=MANIFEST_PATH, output_dir=OUTPUT_DIR, mode="hardlink"):
+    """按清单生成 split_dataset 目录（默认硬链接，不额外占用磁盘）"""
+    _, classes, splits = load_manifest(manifest_path)
+    materialize(classes, splits, output_dir, mode)
+    print(f"\n✅ 已按清单生成目录（{mode}）：{os.path.abspath(output_dir)}")
+
+# ========== 增量模式（内容哈希索引） ==========
+def hash_file(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def assign_split(digest, ratios=SPLIT_RATIOS):
+    """由内容哈希决定划分：同一文件始终落在同一划分，与其他文件的增删无关"""
+    u = int(digest[:16], 16) / float(1 << 64)
+    cumulative = 0.0
+    for split, ratio in zip(SPLITS, ratios):
+        cumulative += ratio
+        if u < cumulative:
+            return split
+    return SPLITS[-1]
+
+def scan_raw_files(raw_dir=RAW_DIR):
+    """列出原始图像，返回 {相对路径: (size, mtime_ns)}"""
+    files = {}
+    for cls_entry in os.scandir(raw_dir):
+        if not cls_entry.is_dir():
+            continue
+        for entry in os.scandir(cls_entry.path):
+            if entry.is_file() and entry.name.lower().endswith(IMG_EXTENSIONS):
+                st = entry.stat()
+                files[f"{cls_entry.name}/{entry.name}"] = (st.st_size, st.st_mtime_ns)
+    return files
+
+def load_index(index_path=INDEX_PATH):
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_index(index, index_path=INDEX_PATH):
+    with open(index_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
 
-        print(f"\n[{cls}] 共 {n_total} 张 -> 训练: {len(splits['train'])}, 验证: {len(splits['val'])}, 测试: {len(splits['test'])}")
+def update_index(raw_dir=RAW_DIR, index_path=INDEX_PATH, ratios=SPLIT_RATIOS, workers=NUM_WORKERS):
+    """只对新增或 size/mtime 变化的文件重新计算哈希，返回 (新索引, 变更)"""
+    assert sum(ratios) == 1.0 or abs(sum(ratios) - 1.0) < 1e-6, "比例之和必须为1"
+    old = load_index(index_path) or {"files": {}}
+    old_files = old["files"]
+    current = scan_raw_files(raw_dir)
+
+    to_hash = [rel for rel, (size, mtime) in current.items()
+               if rel not in old_files
+               or old_files[rel]["size"] != size or old_files[rel]["mtime_ns"] != mtime]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        digests = list(tqdm(pool.map(lambda rel: hash_file(os.path.join(raw_dir, rel)), to_hash),
+                            total=len(to_hash), desc="计算哈希", leave=False))
+    hashed = dict(zip(to_hash, digests))
+
+    files = {}
+    for rel, (size, mtime) in current.items():
+        digest = hashed[rel] if rel in hashed else old_files[rel]["sha256"]
+        files[rel] = {"size": size, "mtime_ns": mtime, "sha256": digest,
+                      "split": assign_split(digest, ratios)}
+
+    changes = {
+        "added": sorted(rel for rel in current if rel not in old_files),
+        # 内容变化，或比例调整导致划分变化
+        "changed": sorted(rel for rel in current if rel in old_files and (
+            files[rel]["sha256"] != old_files[rel]["sha256"]
+            or files[rel]["split"] != old_files[rel]["split"])),
+        "deleted": sorted(rel for rel in old_files if rel not in current),
+    }
+    # "outputs" 记录每个输出目录上次同步时的状态，与哈希状态分开保存
+    index = {"version": 1, "ratios": list(ratios), "files": files,
+             "outputs": old.get("outputs", {})}
+    save_index(index, index_path)
+    return index, changes
+
+def _output_path(output_dir, rel, split):
+    cls, name = rel.split("/", 1)
+    return os.path.join(output_dir, split, cls, name)
+
+def sync_output(raw_dir, output_dir, index, mode="copy", workers=NUM_WORKERS):
+    """对比输出目录上次同步的状态，只删除/放置有差异的文件；返回 (放置数, 删除数)"""
+    files = index["files"]
+    key = os.path.abspath(output_dir)
+    first_sync = key not in index["outputs"]
+    placed = index["outputs"].get(key, {})
+    wanted = {rel: [meta["split"], meta["sha256"]] for rel, meta in files.items()}
+    classes = sorted({rel.split("/", 1)[0] for rel in files})
+    make_subdirs(output_dir, classes)
+
+    to_remove = [rel for rel, state in placed.items() if wanted.get(rel) != state]
+    for rel in to_remove:
+        old_dst = _output_path(output_dir, rel, placed[rel][0])
+        if os.path.lexists(old_dst):
+            os.remove(old_dst)
+
+    if first_sync:
+        # 首次同步：清理旧版（按打乱划分）遗留在其他划分中的文件
+        expected = {_output_path(output_dir, rel, split) for rel, (split, _) in wanted.items()}
+        prune_output(output_dir, classes, expected)
 
-        # 拷贝文件
-        for split, files in splits.items():
-            for src_path in tqdm(files, desc=f"{cls}-{split}", leave=False):
-                filename = os.path.basename(src_path)
-                dst_path = os.path.join(output_dir, split, cls, filename)
-                shutil.copy2(src_path, dst_path)
+    to_place = [rel for rel, state in wanted.items() if placed.get(rel) != state]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        jobs = [pool.submit(place_file, os.path.join(raw_dir, rel),
+                            _output_path(output_dir, rel, wanted[rel][0]), mode)
+                for rel in to_place]
+        for job in tqdm(jobs, desc=f"同步({mode})", leave=False):
+            job.result()
+
+    index["outputs"][key] = wanted
+    return len(to_place), len(to_remove)
+
+def write_manifest_from_index(index, raw_dir=RAW_DIR, manifest_path=MANIFEST_PATH):
+    """把增量索引中的划分写成与 write_manifest 相同格式的清单"""
+    files = index["files"]
+    classes = sorted({rel.split("/", 1)[0] for rel in files})
+    class_to_idx = {cls: i for i, cls in enumerate(classes)}
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    splits = {split: [] for split in SPLITS}
+    for rel in sorted(files):
+        splits[files[rel]["split"]].append([rel, class_to_idx[rel.split("/", 1)[0]]])
+    manifest = {
+        "version": 1,
+        "root": os.path.relpath(os.path.abspath(raw_dir), manifest_dir).replace(os.sep, "/"),
+        "split_by": "sha256",
+        "ratios": index["ratios"],
+        "classes": classes,
+        "splits": splits,
+    }
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, separators=(",", ":"))
+    print(f"✅ 清单已写入：{os.path.abspath(manifest_path)}")
+
+def incremental_prepare(raw_dir=RAW_DIR, output_dir=OUTPUT_DIR, index_path=INDEX_PATH,
+                        ratios=SPLIT_RATIOS, workers=NUM_WORKERS, mode="copy",
+                        manifest_path=None, sync_dir=True):
+    """增量整理：只处理新增、变更、删除的图像；划分由内容哈希决定"""
+    index, changes = update_index(raw_dir, index_path, ratios, workers)
+    print(f"共 {len(index['files'])} 张 -> 新增: {len(changes['added'])}, "
+          f"变更: {len(changes['changed'])}, 删除: {len(changes['deleted'])}")
+    if sync_dir:
+        n_placed, n_removed = sync_output(raw_dir, output_dir, index, mode, workers)
+        save_index(index, index_path)
+        print(f"✅ 已同步：{os.path.abspath(output_dir)}（放置 {n_placed}，移除 {n_removed}）")
+    if manifest_path:
+        write_manifest_from_index(index, raw_dir, manifest_path)
+    return changes
+
+# ========== 主函数 ==========
+def split_dataset(raw_dir=RAW_DIR, output_dir=OUTPUT_DIR, ratios=SPLIT_RATIOS):
+    classes, splits = compute_splits(raw_dir, ratios)
+
+    # 拷贝文件
+    materialize(classes, splits, output_dir, mode="copy")
 
     print(f"\n✅ 数据集整理完成！输出路径：{os.path.abspath(output_dir)}")
     print("目录结构示例：")
@@ -62,4 +303,26 @@ def split_dataset(raw_dir=RAW_DIR, output_dir=OUTPUT_DIR, ratios=SPLIT_RATIOS):
     print(" └── test/cat/xxx.jpg")
 
 if __name__ == "__main__":
-    split_dataset()
+    parser = argparse.ArgumentParser(description="划分 Animals-10 数据集")
+    parser.add_argument("--raw_dir", default=RAW_DIR)
+    parser.add_argument("--output_dir", default=OUTPUT_DIR)
+    parser.add_argument("--manifest", nargs="?", const=MANIFEST_PATH, default=None,
+                        help="清单模式：只写划分清单，不复制图像")
+    parser.add_argument("--materialize", choices=["hardlink", "symlink", "copy"], default=None,
+                        help="清单模式下可选：按清单生成 split_dataset 目录；增量模式下为文件落地方式")
+    parser.add_argument("--incremental", action="store_true",
+                        help="增量模式：基于内容哈希索引，只处理新增/变更/删除的图像")
+    parser.add_argument("--index", default=INDEX_PATH, help="增量模式的索引文件")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS, help="增量模式的线程数")
+    args = parser.parse_args()
+
+    if args.incremental:
+        incremental_prepare(args.raw_dir, args.output_dir, args.index, workers=args.workers,
+                            mode=args.materialize or "copy", manifest_path=args.manifest,
+                            sync_dir=not args.manifest or args.materialize is not None)
+    elif args.manifest:
+        write_manifest(args.raw_dir, args.manifest)
+        if args.materialize:
+            materialize_manifest(args.manifest, args.output_dir, args.materialize)
+    else:
+        split_dataset(args.raw_dir, args.output_dir)
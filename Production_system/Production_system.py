@@ -12,8 +12,9 @@ RULES = get_rules()
 # 推理引擎类
 # ==========================================================
 class InferenceEngine:
-    def __init__(self, rules):
+    def __init__(self, rules, verbose=True):
         self.rules = rules
+        self.verbose = verbose  # 是否打印触发的规则（批量评测时关闭）
         self.facts = {}  # 当前事实（特征）
         self.derived_facts = {}  # 推理得到的事实
 
@@ -45,7 +46,8 @@ class InferenceEngine:
                     # 应用规则
                     self.derived_facts.update(rule.conclusion)
                     applied_rules.append(rule.rule_id)
-                    print(f"✅ 触发规则 {rule.rule_id}: {rule.description}")
+                    if self.verbose:
+                        print(f"✅ 触发规则 {rule.rule_id}: {rule.description}")
                     updated = True
 
         return applied_rules
@@ -0,0 +1,374 @@
+"""
+编译后的共享规则网络 + 轻量会话工作内存
+把规则库一次性编译为不可变结构：每个 (属性, 值) 事实对应一个比特位，每条规则的条件是一个位掩码，
+并为每个比特位建立"涉及该事实的规则"索引。多个会话共享同一个网络（只读，线程安全），
+每个会话只保存几个整数（__slots__）：用户断言的事实位、推导出的事实位、当前满足条件的规则集合
+
+推理结果与 Production_system.InferenceEngine 完全一致（含规则触发顺序、推导属性被后续规则覆盖、
+用户事实优先于推导事实等语义），但事实变化时只重新检查受影响的规则
+
+附带 asyncio 服务（每个 TCP 连接一个会话）与基准：并发会话的单步延迟与每会话内存
+
+用法:
+    python rule_network.py verify                    # 与 InferenceEngine 逐条对比
+    python rule_network.py bench --sessions 5000     # 并发会话基准
+    python rule_network.py serve --port 8765         # 行协议服务：ADD <特征> / INFER / RESET / QUIT
+"""
+
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tracemalloc
+from types import MappingProxyType
+
+from rules_base import get_rules
+from Production_system import InferenceEngine
+
+
+# ==========================================================
+# 编译后的规则网络（不可变）
+# ==========================================================
+class RuleNetwork:
+    """规则库的位掩码编译结果；创建后不可修改，可在线程 / 协程间共享"""
+
+    __slots__ = ("rule_ids", "descriptions", "conditions", "conclusions", "bit_of", "fact_of",
+                 "key_masks", "rules_by_bit")
+
+    def __init__(self, rules):
+        bit_of = {}
+
+        def intern(key, value):
+            return bit_of.setdefault((key, value), len(bit_of))
+
+        for rule in rules:
+            for key, value in list(rule.conditions.items()) + list(rule.conclusion.items()):
+                intern(key, value)
+
+        key_masks = {}
+        for (key, _), bit in bit_of.items():
+            key_masks[key] = key_masks.get(key, 0) | (1 << bit)
+
+        rules_by_bit = [0] * len(bit_of)
+        conditions = []
+        for index, rule in enumerate(rules):
+            mask = 0
+            for key, value in rule.conditions.items():
+                bit = bit_of[(key, value)]
+                mask |= 1 << bit
+                rules_by_bit[bit] |= 1 << index
+            conditions.append(mask)
+
+        # 结论按规则中的书写顺序逐项写入：(属性掩码, 新值位)
+        conclusions = tuple(tuple((key_masks[k], 1 << bit_of[(k, v)]) for k, v in rule.conclusion.items())
+                            for rule in rules)
+
+        init = object.__setattr__
+        init(self, "rule_ids", tuple(rule.rule_id for rule in rules))
+        init(self, "descriptions", tuple(rule.description for rule in rules))
+        init(self, "conditions", tuple(conditions))
+        init(self, "conclusions", conclusions)
+        init(self, "bit_of", MappingProxyType(bit_of))
+        init(self, "fact_of", tuple(sorted(bit_of, key=bit_of.get)))
+        init(self, "key_masks", MappingProxyType(key_masks))
+        init(self, "rules_by_bit", tuple(rules_by_bit))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("RuleNetwork 是只读的")
+
+    def decode(self, bits):
+        """位集合 -> {属性: 值}"""
+        facts = {}
+        while bits:
+            low = bits & -bits
+            key, value = self.fact_of[low.bit_length() - 1]
+            facts[key] = value
+            bits ^= low
+        return facts
+
+    def session(self):
+        return Session(self)
+
+
+# ==========================================================
+# 会话工作内存
+# ==========================================================
+class Session:
+    """
+    单个会话的工作内存，只含 4 个整数：
+    user_bits 用户断言的事实位，user_keys 用户断言过的属性掩码（这些属性的推导值被屏蔽），
+    derived_bits 推导事实位（每个属性至多一位），matched 当前条件全部满足的规则集合
+    """
+
+    __slots__ = ("network", "user_bits", "user_keys", "derived_bits", "matched")
+
+    def __init__(self, network):
+        self.network = network
+        self.reset()
+
+    def reset(self):
+        self.user_bits = 0
+        self.user_keys = 0
+        self.derived_bits = 0
+        self.matched = 0
+
+    def _effective(self):
+        return self.user_bits | (self.derived_bits & ~self.user_keys)
+
+    def _refresh(self, before, after):
+        """只重新检查条件中含有变化事实位的规则"""
+        changed, affected = before ^ after, 0
+        rules_by_bit = self.network.rules_by_bit
+        while changed:
+            low = changed & -changed
+            affected |= rules_by_bit[low.bit_length() - 1]
+            changed ^= low
+        conditions, matched = self.network.conditions, self.matched
+        while affected:
+            low = affected & -affected
+            cond = conditions[low.bit_length() - 1]
+            matched = matched | low if after & cond == cond else matched & ~low
+            affected ^= low
+        self.matched = matched
+
+    def add_fact(self, key, value=True):
+        """添加用户事实；规则中从未出现的属性不会影响推理，直接忽略"""
+        key_mask = self.network.key_masks.get(key)
+        if key_mask is None:
+            return
+        before = self._effective()
+        self.user_keys |= key_mask
+        bit = self.network.bit_of.get((key, value))
+        self.user_bits = (self.user_bits & ~key_mask) | (1 << bit if bit is not None else 0)
+        self._refresh(before, self._effective())
+
+    def infer(self):
+        """
+        前向推理，返回按触发顺序排列的规则编号
+        与 InferenceEngine.infer 相同：按规则顺序逐轮扫描，本轮触发的规则立即影响其后规则的匹配，
+        某一轮没有新规则触发时结束
+        """
+        network = self.network
+        fired, applied, pos, fired_in_pass = 0, [], 0, False
+        while True:
+            candidates = (self.matched & ~fired) >> pos << pos
+            if not candidates:
+                if not fired_in_pass:
+                    return applied
+                pos, fired_in_pass = 0, False
+                continue
+            index = (candidates & -candidates).bit_length() - 1
+            before = self._effective()
+            derived = self.derived_bits
+            for key_mask, bit in network.conclusions[index]:
+                derived = (derived & ~key_mask) | bit
+            self.derived_bits = derived
+            self._refresh(before, self._effective())
+            fired |= 1 << index
+            applied.append(network.rule_ids[index])
+            pos, fired_in_pass = index + 1, True
+
+    @property
+    def derived_facts(self):
+        return self.network.decode(self.derived_bits)
+
+    def get_result(self):
+        derived = self.derived_facts
+        return derived.get("动物名称", "未知动物"), derived.get("大类", ""), derived.get("亚类", "")
+
+
+# ==========================================================
+# asyncio 服务
+# ==========================================================
+class RuleService:
+    """每个会话一个 Session，所有会话共享同一个 RuleNetwork"""
+
+    def __init__(self, network):
+        self.network = network
+        self.sessions = {}
+
+    def open(self, session_id):
+        self.sessions[session_id] = self.network.session()
+
+    def close(self, session_id):
+        self.sessions.pop(session_id, None)
+
+    async def add_fact(self, session_id, key, value=True):
+        self.sessions[session_id].add_fact(key, value)
+
+    async def infer(self, session_id):
+        session = self.sessions[session_id]
+        fired = session.infer()
+        return fired, session.get_result()
+
+    async def handle_client(self, reader, writer):
+        """行协议：ADD <特征> / INFER / RESET / QUIT"""
+        session_id = id(writer)
+        self.open(session_id)
+        try:
+            while line := (await reader.readline()).decode("utf-8").strip():
+                command, _, arg = line.partition(" ")
+                command = command.upper()
+                if command == "ADD":
+                    await self.add_fact(session_id, arg.strip())
+                    reply = "OK"
+                elif command == "INFER":
+                    fired, (name, category, subcat) = await self.infer(session_id)
+                    reply = f"{name}|{category}|{subcat}|{','.join(fired)}"
+                elif command == "RESET":
+                    self.sessions[session_id].reset()
+                    reply = "OK"
+                elif command == "QUIT":
+                    break
+                else:
+                    reply = "ERR unknown command"
+                writer.write((reply + "\n").encode("utf-8"))
+                await writer.drain()
+        finally:
+            self.close(session_id)
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        server = await asyncio.start_server(self.handle_client, host, port)
+        print(f"🧠 规则服务已启动: {host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+# ==========================================================
+# 一致性校验与基准
+# ==========================================================
+def all_facts(rules):
+    """规则条件中出现的全部 (属性, 值)，另加每个非布尔属性的一个未知取值（用于覆盖"用户事实屏蔽推导值"）"""
+    facts = {(key, value) for rule in rules for key, value in rule.conditions.items()}
+    facts |= {(key, "其他") for key, value in facts if value is not True}
+    return sorted(facts, key=str)
+
+
+def random_dialogue(facts, rng, steps):
+    """随机会话：若干次（添加几个事实，然后推理）"""
+    return [rng.sample(facts, rng.randint(1, 4)) for _ in range(steps)]
+
+
+def verify(num_dialogues=2000, steps=3, seed=0):
+    """随机会话下逐步对比 InferenceEngine 与 Session 的触发序列、推导事实与结果"""
+    rules = get_rules()
+    network = RuleNetwork(rules)
+    facts = all_facts(rules)
+    rng = random.Random(seed)
+    for n in range(num_dialogues):
+        engine, session = InferenceEngine(rules, verbose=False), network.session()
+        for batch in random_dialogue(facts, rng, steps):
+            for key, value in batch:
+                engine.add_fact(key, value)
+                session.add_fact(key, value)
+            expected, actual = engine.infer(), session.infer()
+            if expected != actual or engine.derived_facts != session.derived_facts \
+                    or engine.get_result() != session.get_result():
+                raise AssertionError(f"第 {n} 个会话不一致: {expected} != {actual}")
+    print(f"✅ {num_dialogues} 个随机会话（每个 {steps} 步）与 InferenceEngine 结果完全一致")
+
+
+def _percentiles(values):
+    ordered = sorted(values)
+    return {q: ordered[min(len(ordered) - 1, len(ordered) * q // 100)] for q in (50, 90, 99)}
+
+
+def measure_memory(factory, populate, count):
+    """创建 count 个会话并执行 populate 后，平均每个会话占用的 Python 堆内存（字节）"""
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    sessions = [factory() for _ in range(count)]
+    for s in sessions:
+        populate(s)
+    used = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    return used / count
+
+
+async def _run_clients(service, dialogues):
+    latencies = []
+
+    async def client(session_id, dialogue):
+        service.open(session_id)
+        for batch in dialogue:
+            start = time.perf_counter()
+            for key, value in batch:
+                await service.add_fact(session_id, key, value)
+            await service.infer(session_id)
+            latencies.append((time.perf_counter() - start) * 1e6)
+            await asyncio.sleep(0)  # 让出事件循环，使各会话交错执行
+        service.close(session_id)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(i, d) for i, d in enumerate(dialogues)))
+    return latencies, time.perf_counter() - start
+
+
+def benchmark(num_sessions=5000, steps=3, seed=0):
+    rules = get_rules()
+    network = RuleNetwork(rules)
+    facts = all_facts(rules)
+    rng = random.Random(seed)
+    dialogues = [random_dialogue(facts, rng, steps) for _ in range(num_sessions)]
+    sample = dialogues[0]
+
+    def populate_engine(engine):
+        for batch in sample:
+            for key, value in batch:
+                engine.add_fact(key, value)
+            engine.infer()
+
+    def populate_session(session):
+        for batch in sample:
+            for key, value in batch:
+                session.add_fact(key, value)
+            session.infer()
+
+    mem_engine = measure_memory(lambda: InferenceEngine(rules, verbose=False), populate_engine,
+                                min(num_sessions, 2000))
+    mem_session = measure_memory(network.session, populate_session, min(num_sessions, 2000))
+
+    # 单步延迟（同步，逐步：添加特征 + 推理）
+    engine_steps = []
+    for dialogue in dialogues[:2000]:
+        engine = InferenceEngine(rules, verbose=False)
+        for batch in dialogue:
+            start = time.perf_counter()
+            for key, value in batch:
+                engine.add_fact(key, value)
+            engine.infer()
+            engine_steps.append((time.perf_counter() - start) * 1e6)
+
+    latencies, elapsed = asyncio.run(_run_clients(RuleService(network), dialogues))
+    e, s = _percentiles(engine_steps), _percentiles(latencies)
+    print(f"会话数: {num_sessions}（asyncio 并发），每会话 {steps} 步")
+    print(f"{'':<20}{'bytes/session':>14}{'p50(us)':>10}{'p90(us)':>10}{'p99(us)':>10}")
+    print(f"{'InferenceEngine':<20}{mem_engine:>14.0f}{e[50]:>10.1f}{e[90]:>10.1f}{e[99]:>10.1f}")
+    print(f"{'RuleNetwork':<20}{mem_session:>14.0f}{s[50]:>10.1f}{s[90]:>10.1f}{s[99]:>10.1f}")
+    print(f"asyncio 吞吐: {len(latencies) / elapsed:.0f} steps/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="编译规则网络：校验 / 基准 / asyncio 服务")
+    parser.add_argument("command", choices=["verify", "bench", "serve"])
+    parser.add_argument("--sessions", type=int, default=5000)
+    parser.add_argument("--steps", type=int, default=3)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    if args.command == "verify":
+        verify(steps=args.steps)
+    elif args.command == "bench":
+        benchmark(args.sessions, args.steps)
+    else:
+        try:
+            asyncio.run(RuleService(RuleNetwork(get_rules())).serve(args.host, args.port))
+        except KeyboardInterrupt:
+            sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,444 @@
+"""
+规则库离线优化器
+分析 rules_base.py：
+1. 重复规则：条件与结论完全相同
+2. 被蕴含规则：去掉该规则后，仅凭其余规则从它的条件出发也能推出它的全部结论
+3. 不可达规则：条件中的事实既不能由用户输入，也不能由其他规则推出
+   （默认 any：调用方可通过 InferenceEngine.add_fact 输入条件中出现的任意 (属性, 值)；
+    boolean 只对应交互模式——用户只能把条件属性设为 True，删除的规则对其他调用方不等价）
+4. 公共条件提取：把多条规则共有的条件子集提取为共享中间节点，每轮匹配中只计算一次
+   （节点在当前事实上求值并缓存到事实变化为止，不引入新的推导事实，因此不改变推理语义）
+
+每一项删除都要通过等价性检查才会被采纳：在知识库特征、规则条件组合、随机事实集合与多步会话上
+对比原规则库与优化后规则库的推理结果与推导事实，不一致时按类型归类报告
+
+输出优化后的规则模块（rules_base_optimized.py，接口与 rules_base 相同，另含 SHARED_NODES / RULE_NODES）
+以及优化报告（含优化前后的条件匹配次数）
+
+用法:
+    python rule_optimizer.py
+    python rule_optimizer.py --input_model boolean --allow_restricted --output rules_base_optimized.py
+"""
+
+import random
+import argparse
+from itertools import combinations
+
+from rules_base import ANIMAL_KNOWLEDGE_BASE, Rule, get_rules
+from Production_system import InferenceEngine
+
+NUM_RANDOM_TESTS = 3000
+INPUT_MODEL = "any"   # 与 InferenceEngine.add_fact 的公开接口一致
+SEED = 0
+
+
+# ==========================================================
+# 计数 / 共享节点推理引擎
+# ==========================================================
+class CountingInferenceEngine(InferenceEngine):
+    """与 InferenceEngine 相同，另统计条件测试次数（每比较一个条件计 1 次）"""
+
+    def __init__(self, rules, verbose=False):
+        super().__init__(rules, verbose)
+        self.tests = 0
+
+    def match_rule(self, rule):
+        for key, val in rule.conditions.items():
+            self.tests += 1
+            if key not in self.facts and key not in self.derived_facts:
+                return False
+            if self.facts.get(key, self.derived_facts.get(key)) != val:
+                return False
+        return True
+
+
+class FactoredInferenceEngine(CountingInferenceEngine):
+    """
+    使用共享中间节点的推理引擎：规则先检查所属节点（节点结果在事实变化前缓存），再检查剩余条件
+    nodes: {节点编号: 条件字典}；rule_nodes: {规则编号: 节点编号}
+    """
+
+    def __init__(self, rules, nodes, rule_nodes, verbose=False):
+        super().__init__(rules, verbose)
+        self.nodes = nodes
+        self.rule_nodes = rule_nodes
+        self.remaining = {
+            rule.rule_id: {k: v for k, v in rule.conditions.items()
+                           if k not in nodes.get(rule_nodes.get(rule.rule_id), {})}
+            for rule in rules
+        }
+        self._node_cache = {}
+
+    def add_fact(self, key, value=True):
+        super().add_fact(key, value)
+        self._node_cache.clear()
+
+    def _match_conditions(self, conditions):
+        return super().match_rule(Rule("", conditions, {}))
+
+    def match_rule(self, rule):
+        node = self.rule_nodes.get(rule.rule_id)
+        if node is not None:
+            if node not in self._node_cache:
+                self._node_cache[node] = self._match_conditions(self.nodes[node])
+            if not self._node_cache[node]:
+                return False
+        return self._match_conditions(self.remaining[rule.rule_id])
+
+    def infer(self):
+        """与 InferenceEngine.infer 相同，规则触发（事实变化）后清空节点缓存"""
+        applied_rules = []
+        updated = True
+        while updated:
+            updated = False
+            for rule in self.rules:
+                if rule.rule_id in applied_rules:
+                    continue
+                if self.match_rule(rule):
+                    self.derived_facts.update(rule.conclusion)
+                    self._node_cache.clear()
+                    applied_rules.append(rule.rule_id)
+                    if self.verbose:
+                        print(f"✅ 触发规则 {rule.rule_id}: {rule.description}")
+                    updated = True
+        return applied_rules
+
+
+# ==========================================================
+# 输入模型与测试用例
+# ==========================================================
+def assertable_facts(rules, input_model=INPUT_MODEL):
+    """
+    用户可以输入的事实集合
+    boolean：交互模式，只能把条件中出现的属性设为 True；any：条件中出现的任意 (属性, 值)
+    """
+    facts = {(k, v) for rule in rules for k, v in rule.conditions.items()}
+    if input_model == "boolean":
+        return sorted({(k, True) for k, _ in facts}, key=str)
+    return sorted(facts, key=str)
+
+
+def make_test_cases(rules, input_model=INPUT_MODEL, num_random=NUM_RANDOM_TESTS, seed=SEED):
+    """
+    返回会话列表，每个会话是若干步事实列表（每步添加后推理一次）：
+    知识库动物特征、每条规则的条件、两两规则条件的并集、随机事实集合、随机多步会话
+    """
+    pool = assertable_facts(rules, input_model)
+    allowed = set(pool)
+    rng = random.Random(seed)
+    cases = []
+    for entry in ANIMAL_KNOWLEDGE_BASE.values():
+        cases.append([[(f, True) for f in entry["特征"] + entry["外观"] + entry["习性"]]])
+    rule_sets = [[(k, v) for k, v in rule.conditions.items() if (k, v) in allowed] for rule in rules]
+    cases += [[facts] for facts in rule_sets if facts]
+    cases += [[a + b] for a, b in combinations(rule_sets, 2) if a and b]
+    for _ in range(num_random):
+        cases.append([rng.sample(pool, rng.randint(1, min(10, len(pool))))])
+        cases.append([rng.sample(pool, rng.randint(1, 4)) for _ in range(rng.randint(2, 4))])
+    return cases
+
+
+def run_case(engine, case):
+    """按步执行会话，返回每步的 (结果, 推导事实)"""
+    trace = []
+    for step in case:
+        for key, value in step:
+            engine.add_fact(key, value)
+        engine.infer()
+        trace.append((engine.get_result(), dict(engine.derived_facts)))
+    return trace
+
+
+# ==========================================================
+# 等价性检查
+# ==========================================================
+def classify_conflict(expected, actual):
+    (name_a, cat_a, sub_a), facts_a = expected
+    (name_b, cat_b, sub_b), facts_b = actual
+    if name_a != name_b:
+        if name_b == "未知动物":
+            return "漏识别"
+        if name_a == "未知动物":
+            return "多识别"
+        return "识别结果不同"
+    if (cat_a, sub_a) != (cat_b, sub_b):
+        return "大类/亚类不同"
+    if facts_a != facts_b:
+        return "推导事实不同"
+    return None
+
+
+def check_equivalence(original, optimized, nodes=None, rule_nodes=None, cases=None,
+                      input_model=INPUT_MODEL, max_examples=3):
+    """
+    在测试会话上对比两套规则库，返回 {"cases": 会话数, "conflicts": {类型: 次数}, "examples": [...]}
+    conflicts 为空表示在所有测试上等价（测试驱动的检查，并非形式证明）
+    """
+    cases = cases if cases is not None else make_test_cases(original, input_model)
+    conflicts, examples = {}, []
+    for case in cases:
+        expected = run_case(InferenceEngine(original, verbose=False), case)
+        engine = FactoredInferenceEngine(optimized, nodes, rule_nodes) if nodes else \
+            InferenceEngine(optimized, verbose=False)
+        actual = run_case(engine, case)
+        for step, (e, a) in enumerate(zip(expected, actual)):
+            kind = classify_conflict(e, a)
+            if kind:
+                conflicts[kind] = conflicts.get(kind, 0) + 1
+                if len(examples) < max_examples:
+                    examples.append({"type": kind, "input": case[:step + 1], "expected": e[0], "actual": a[0]})
+                break
+    return {"cases": len(cases), "conflicts": conflicts, "examples": examples}
+
+
+# ==========================================================
+# 分析
+# ==========================================================
+def find_duplicates(rules):
+    """返回 [(保留的规则, 重复的规则)]"""
+    seen, duplicates = {}, []
+    for rule in rules:
+        key = (frozenset(rule.conditions.items()), frozenset(rule.conclusion.items()))
+        if key in seen:
+            duplicates.append((seen[key].rule_id, rule.rule_id))
+        else:
+            seen[key] = rule
+    return duplicates
+
+
+def closure(facts, rules):
+    """从 facts 出发按规则做单调前向闭包（忽略覆盖，只用于判断可推出性）"""
+    facts = dict(facts)
+    changed = True
+    while changed:
+        changed = False
+        for rule in rules:
+            if all(facts.get(k) == v for k, v in rule.conditions.items()) and \
+                    any(facts.get(k) != v for k, v in rule.conclusion.items()):
+                facts.update(rule.conclusion)
+                changed = True
+    return facts
+
+
+def find_subsumed(rules):
+    """返回 [(被蕴含的规则, 蕴含它的规则列表)]：去掉它后，其余规则从它的条件出发仍能推出它的结论"""
+    subsumed = []
+    for rule in rules:
+        others = [r for r in rules if r is not rule]
+        derived = closure(rule.conditions, others)
+        if all(derived.get(k) == v for k, v in rule.conclusion.items()):
+            witnesses = [r.rule_id for r in others
+                         if all(derived.get(k) == v for k, v in r.conditions.items())
+                         and set(r.conclusion.items()) & set(rule.conclusion.items())]
+            subsumed.append((rule.rule_id, witnesses))
+    return subsumed
+
+
+def find_unreachable(rules, input_model=INPUT_MODEL):
+    """返回 [(规则编号, 不可达的条件列表)]"""
+    reachable = set(assertable_facts(rules, input_model))
+    changed = True
+    while changed:
+        changed = False
+        for rule in rules:
+            if all(item in reachable for item in rule.conditions.items()):
+                new = set(rule.conclusion.items()) - reachable
+                if new:
+                    reachable |= new
+                    changed = True
+    return [(rule.rule_id, [item for item in rule.conditions.items() if item not in reachable])
+            for rule in rules if not all(item in reachable for item in rule.conditions.items())]
+
+
+def find_overlaps(rules):
+    """结论相同的规则对及其公共条件（仅提示，不自动处理）"""
+    overlaps = []
+    for a, b in combinations(rules, 2):
+        common = set(a.conclusion.items()) & set(b.conclusion.items())
+        if ("动物名称", a.conclusion.get("动物名称")) in common:
+            overlaps.append((a.rule_id, b.rule_id, dict(set(a.conditions.items()) & set(b.conditions.items()))))
+    return overlaps
+
+
+def factor_conditions(rules, min_size=2):
+    """
+    贪心提取共享条件子集：候选为任意两条规则条件的交集（至少 min_size 个条件），
+    节省量 = 子集大小 × (共享规则数 - 1)，每条规则至多归入一个节点
+    返回 (nodes, rule_nodes)
+    """
+    condition_sets = {rule.rule_id: frozenset(rule.conditions.items()) for rule in rules}
+    candidates = {a & b for a, b in combinations(condition_sets.values(), 2) if len(a & b) >= min_size}
+    nodes, rule_nodes = {}, {}
+    while candidates:
+        def saving(subset):
+            users = [rid for rid, conds in condition_sets.items() if rid not in rule_nodes and subset <= conds]
+            return len(subset) * (len(users) - 1), users
+
+        best = max(candidates, key=lambda s: (saving(s)[0], len(s), sorted(map(str, s))))
+        gain, users = saving(best)
+        if gain <= 0:
+            break
+        node_id = f"N{len(nodes) + 1}"
+        # 条件顺序沿用第一条使用它的规则中的书写顺序
+        first = next(r for r in rules if r.rule_id == users[0])
+        nodes[node_id] = {k: v for k, v in first.conditions.items() if (k, v) in best}
+        for rid in users:
+            rule_nodes[rid] = node_id
+        candidates.discard(best)
+    return nodes, rule_nodes
+
+
+def reorder_conditions(rules, nodes, rule_nodes):
+    """把节点条件排在规则条件最前面，普通 InferenceEngine 逐条匹配时也能更早短路"""
+    reordered = []
+    for rule in rules:
+        node = nodes.get(rule_nodes.get(rule.rule_id), {})
+        conditions = {**node, **{k: v for k, v in rule.conditions.items() if k not in node}}
+        reordered.append(Rule(rule.rule_id, conditions, dict(rule.conclusion), rule.description))
+    return reordered
+
+
+# ==========================================================
+# 优化流水线
+# ==========================================================
+def optimize(rules, input_model=INPUT_MODEL, num_random=NUM_RANDOM_TESTS):
+    """返回 (优化后的规则, nodes, rule_nodes, 分析记录)"""
+    cases = make_test_cases(rules, input_model, num_random)
+    findings = {"duplicates": find_duplicates(rules), "subsumed": find_subsumed(rules),
+                "unreachable": find_unreachable(rules, input_model), "overlaps": find_overlaps(rules),
+                "removed": [], "rejected": []}
+
+    candidates = [(dup, f"与 {keep} 重复") for keep, dup in findings["duplicates"]]
+    candidates += [(rid, f"被 {', '.join(w) or '其余规则'} 蕴含") for rid, w in findings["subsumed"]]
+    candidates += [(rid, f"条件不可达: {dict(missing)}") for rid, missing in findings["unreachable"]]
+
+    current = list(rules)
+    for rule_id, reason in candidates:
+        if rule_id not in {r.rule_id for r in current}:
+            continue
+        trial = [r for r in current if r.rule_id != rule_id]
+        result = check_equivalence(rules, trial, cases=cases)
+        if result["conflicts"]:
+            findings["rejected"].append((rule_id, reason, result["conflicts"]))
+        else:
+            findings["removed"].append((rule_id, reason))
+            current = trial
+
+    nodes, rule_nodes = factor_conditions(current)
+    optimized = reorder_conditions(current, nodes, rule_nodes)
+    findings["equivalence"] = check_equivalence(rules, optimized, nodes, rule_nodes, cases=cases)
+    return optimized, nodes, rule_nodes, findings
+
+
+def match_counts(rules, optimized, nodes, rule_nodes, cases):
+    """
+    在同一批会话上统计条件测试次数，返回 (原规则库, 优化后规则库 + 普通引擎, 优化后规则库 + 共享节点)
+    """
+    engines = (lambda: CountingInferenceEngine(rules),
+               lambda: CountingInferenceEngine(optimized),
+               lambda: FactoredInferenceEngine(optimized, nodes, rule_nodes))
+    counts = [0, 0, 0]
+    for case in cases:
+        for i, make in enumerate(engines):
+            engine = make()
+            run_case(engine, case)
+            counts[i] += engine.tests
+    return tuple(counts)
+
+
+def render_module(rules, nodes, rule_nodes, input_model):
+    """生成与 rules_base 接口相同的优化后规则模块源码"""
+    lines = [
+        '"""',
+        "优化后的产生式规则 - 由 rule_optimizer.py 自动生成，请勿手工修改",
+        f"输入模型: {input_model}；SHARED_NODES 为共享条件节点，RULE_NODES 为规则所属节点",
+        "可直接用 InferenceEngine(RULES) 推理，或用 rule_optimizer.FactoredInferenceEngine 利用共享节点",
+        '"""',
+        "",
+        "from rules_base import ANIMAL_KNOWLEDGE_BASE, Rule, get_all_animals, get_animal_knowledge  # noqa: F401",
+        "",
+        "SHARED_NODES = {",
+    ]
+    lines += [f"    {node!r}: {conds!r}," for node, conds in nodes.items()]
+    lines += ["}", "", "RULE_NODES = {"]
+    lines += [f"    {rid!r}: {node!r}," for rid, node in rule_nodes.items()]
+    lines += ["}", "", "RULES = ["]
+    for rule in rules:
+        lines += [
+            "    Rule(",
+            f"        rule_id={rule.rule_id!r},",
+            f"        conditions={rule.conditions!r},",
+            f"        conclusion={rule.conclusion!r},",
+            f"        description={rule.description!r}",
+            "    ),",
+        ]
+    lines += ["]", "", "", "def get_rules():", '    """获取所有规则"""', "    return RULES", ""]
+    return "\n".join(lines)
+
+
+def render_report(rules, optimized, nodes, rule_nodes, findings, counts, input_model):
+    before, plain, after = counts
+    eq = findings["equivalence"]
+    lines = [f"规则数: {len(rules)} -> {len(optimized)}（输入模型: {input_model}）", ""]
+    lines.append(f"重复规则: {findings['duplicates'] or '无'}")
+    lines.append(f"被蕴含规则: {[rid for rid, _ in findings['subsumed']] or '无'}")
+    lines.append(f"不可达规则: {[rid for rid, _ in findings['unreachable']] or '无'}")
+    lines.append("\n已删除（均通过等价性检查）:")
+    lines += [f"  {rid}: {reason}" for rid, reason in findings["removed"]] or ["  无"]
+    lines.append("未删除（删除后推理结果变化）:")
+    lines += [f"  {rid}: {reason} -> {conflicts}" for rid, reason, conflicts in findings["rejected"]] or ["  无"]
+    subsumed = {rid for rid, _ in findings["subsumed"]}
+    lines.append("\n结论相同的重叠规则（仅提示；已做蕴含检测，标注为互不蕴含的规则对不能互相替代）:")
+    for a, b, common in findings["overlaps"]:
+        relation = "互不蕴含" if not {a, b} & subsumed else \
+            f"{', '.join(sorted({a, b} & subsumed))} 被蕴含，见上文"
+        lines.append(f"  {a} / {b} 公共条件: {common or '无'}；{relation}")
+    lines.append("\n共享条件节点:")
+    for node, conds in nodes.items():
+        users = [rid for rid, n in rule_nodes.items() if n == node]
+        lines.append(f"  {node} {conds} <- {', '.join(users)}")
+    status = f"不一致 {eq['conflicts']}" if eq["conflicts"] else "全部一致"
+    lines.append(f"\n等价性检查: {eq['cases']} 个会话，{status}")
+    for example in eq["examples"]:
+        lines.append(f"  [{example['type']}] 输入 {example['input']}: {example['expected']} -> {example['actual']}")
+    lines.append("\n条件匹配次数（同一批测试会话）:")
+    lines.append(f"  原规则库:               {before}")
+    lines.append(f"  删除规则 + 条件重排:    {plain}（减少 {(1 - plain / before) * 100:.1f}%）")
+    lines.append(f"  再使用共享条件节点:     {after}（减少 {(1 - after / before) * 100:.1f}%）")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="规则库离线优化：去重 / 蕴含 / 不可达 / 公共条件提取")
+    parser.add_argument("--input_model", choices=["boolean", "any"], default=INPUT_MODEL,
+                        help="any: 可输入条件中的任意取值（add_fact 公开接口）；boolean: 用户只能把条件属性设为 True（交互模式）")
+    parser.add_argument("--allow_restricted", action="store_true",
+                        help="input_model=boolean 时仍写出规则模块（只对交互模式等价）")
+    parser.add_argument("--num_random", type=int, default=NUM_RANDOM_TESTS, help="随机测试会话数")
+    parser.add_argument("--output", default="rules_base_optimized.py")
+    parser.add_argument("--report", default="rule_optimizer_report.txt")
+    args = parser.parse_args()
+
+    rules = get_rules()
+    optimized, nodes, rule_nodes, findings = optimize(rules, args.input_model, args.num_random)
+    cases = make_test_cases(rules, args.input_model, args.num_random, seed=SEED + 1)
+    counts = match_counts(rules, optimized, nodes, rule_nodes, cases)
+    report = render_report(rules, optimized, nodes, rule_nodes, findings, counts, args.input_model)
+    print(report)
+
+    with open(args.report, "w", encoding="utf-8") as f:
+        f.write(report + "\n")
+    if findings["equivalence"]["conflicts"]:
+        print("\n❌ 优化后的规则库未通过等价性检查，未写出规则模块")
+        return
+    if args.input_model != "any" and not args.allow_restricted:
+        print(f"\n⚠️ 输入模型 {args.input_model} 下的等价性只对交互模式成立，"
+              f"通过 add_fact 输入其他取值的调用方可能得到不同结果；加 --allow_restricted 才写出规则模块")
+        return
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write(render_module(optimized, nodes, rule_nodes, args.input_model))
+    print(f"\n✅ 优化后的规则已保存为: {args.output}（报告: {args.report}）")
+
+
+if __name__ == "__main__":
+    main()